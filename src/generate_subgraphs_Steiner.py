@@ -2,19 +2,39 @@
 This module generates subgraphs for a given set of QIDs. It uses the Steiner tree algorithm to build a minimal subgraph
 that connects the interesting entities for each QID. The resulting subgraphs are saved as triples in JSON format.
 """
+import asyncio
 import logging
 import os
 import json
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from kg.query import query_kg, query_kg_endpoint, get_triples_from_response
+from kg.constants import SPARQL_ASYNC_MAX_CONCURRENCY, SPARQL_CACHE_DIR, NEIGHBORS_BATCH_SIZE, QID_INDEX_DIR, \
+    QID_RETRY_ROUNDS, YAGO_ENTITY_STORE_DB_PATH, FRONTIER_NODE_BUDGET
+from kg.sparql_client import SparqlClient, SparqlQueryError, get_default_client, set_default_client
+from kg.sparql_cache import SparqlDiskCache
+from kg.qid_index import QIDIndex
+from kg.async_client import AsyncSparqlClient
+from kg.sparql_metrics import get_default_metrics
+from kg.replica_router import get_default_router
+from kg.circuit_breaker import get_default_circuit_breaker
+from kg.io_scheduler import get_default_io_scheduler
+from kg.sparql_replay import make_recording_client, make_replay_client
+from kg.triple_frame import TripleFrame, URIDictionary, decode_triples
+from kg.predicate_policy import get_default_predicate_policy
+from kg.bounded_expansion import EntityCounts
 from kg.kg_functions import (load_json, extract_ids_with_prefix, convert_QID_yagoID, 
                                 combine_lists_from_dict, get_yago_direct_neighbors, 
-                                sparql_to_triples_with_main_entity, parallel_process_nodes)
+                                sparql_to_triples_with_main_entity,
+                                parallel_process_nodes_batched, aparallel_process_nodes_batched,
+                                expand_frontier, aexpand_frontier,
+                                set_qid_index)
 
-from kg.subgraph_functions import (create_graph_from_triples, build_minimal_subgraph_Steiner, 
+from kg.subgraph_functions import (create_graph_from_triple_frame,
+                                      build_minimal_subgraph_Steiner, 
                                       largest_connected_subgraph, edges_to_triples, 
-                                      get_interesting_entities, filter_triples_by_predicates)
+                                      get_interesting_entities, aget_interesting_entities)
 
 # Setup logging
 log_location = './logs/'
@@ -34,12 +54,124 @@ logging.info("Starting multithreaded KG processing.")
 
 input_location = './inputs/'
 
+# Number of QIDs processed concurrently (same as the ThreadPoolExecutor default),
+# and number of neighbor lookups each of them runs at once, within the endpoint limit of the I/O scheduler
+# (`IO_SCHEDULER_ENDPOINT_LIMIT`, see kg/io_scheduler.py)
+qid_workers = min(32, (os.cpu_count() or 1) + 4)
+node_workers = 5
+# Number of interesting entities whose neighbors are fetched with a single query
+neighbors_batch_size = NEIGHBORS_BATCH_SIZE
+# SPARQL result format of the neighbor queries ("json", "tsv" or "csv"); the tabular formats are smaller and faster to decode
+neighbors_result_format = "tsv"
+# Fetch the neighbors of hub entities (e.g. countries) in pages instead of truncating them at the query LIMIT,
+# so that the Steiner trees do not miss connecting edges. Only applies without a hub neighbor budget.
+complete_hub_neighbors = True
+# Opt-in: bound the neighbors of every interesting entity to a budget of triples, keeping the edges toward the other
+# interesting entities first, then predicate-stratified samples weighted by the entity counts (see
+# kg/bounded_expansion.py). This changes the generated subgraphs, and replaces the paging of the hub neighbors (their
+# first page already holds more triples than the budget keeps); None keeps all the neighbors, a budget (e.g.
+# `HUB_NEIGHBOR_BUDGET`) turns the bounded expansion on.
+hub_neighbor_budget = None
+hub_entity_counts = EntityCounts(YAGO_ENTITY_STORE_DB_PATH) if os.path.exists(YAGO_ENTITY_STORE_DB_PATH) else None
+# Opt-in: expand the interesting entities level by level until they are connected (see `expand_frontier`), so that
+# entities two or more hops apart are not left in separate components. This changes the generated subgraphs and
+# enlarges the Steiner input; 1 only fetches the direct neighbors of the interesting entities, 2 or more (e.g.
+# `FRONTIER_MAX_LEVELS`) turns the expansion on.
+frontier_max_levels = 1
+frontier_node_budget = FRONTIER_NODE_BUDGET
 
-exclude_props = ['knowsLanguage', 'location', 'image', 'about', 'comment', 'gtin', 'url', 'label', 
-                 'postalCode', 'isbn', 'sameAs', 'mainEntityOfPage', 'leiCode', 'type', 'dateCreated', 
-                 'unemploymentRate', 'length', 'description', 'iswcCode', 'iataCode', 'logo', 'alternateName', 
-                 'geo', 'subclassOf', 'icaoCode', 'humanDevelopmentIndex', 'sameAs', 'dateCreated', 
-                 'startDate', 'endDate', 'follows', 'superEvent']
+# Use the asyncio access path: all the lookups run on one event loop, bounded by a single concurrency limit
+use_async_io = False
+async_max_concurrency = SPARQL_ASYNC_MAX_CONCURRENCY
+
+# Keep the SPARQL results on disk, so that reruns and entities shared across QIDs become local reads
+use_sparql_cache = True
+sparql_cache = SparqlDiskCache(SPARQL_CACHE_DIR) if use_sparql_cache else None
+# Spread the queries across the read replicas, if more than one is configured in `YAGO_ENDPOINT_REPLICAS`
+replica_router = get_default_router()
+# Cut the concurrency when the endpoint slows down, and stop sending requests during outages
+circuit_breaker = get_default_circuit_breaker()
+# Record the SPARQL traffic to a log ("record"), or answer the queries from a recorded log ("replay"), to benchmark
+# the pipeline offline against real traffic (see kg/sparql_replay.py). Both modes bypass the cache, and only
+# apply to the threaded path; replay the asyncio path with `python -m kg.sparql_replay serve` instead.
+sparql_traffic_mode = None
+sparql_traffic_log = os.path.join(output_location, 'sparql_traffic.jsonl.gz')
+if sparql_traffic_mode == "record":
+    set_default_client(make_recording_client(sparql_traffic_log, router=replica_router, breaker=circuit_breaker))
+elif sparql_traffic_mode == "replay":
+    set_default_client(make_replay_client(sparql_traffic_log))
+else:
+    set_default_client(SparqlClient(cache=sparql_cache, router=replica_router, breaker=circuit_breaker))
+# QIDs whose queries failed are retried (after the circuit closes) instead of dropped,
+# waiting qid_retry_backoff seconds, doubled every round
+qid_retry_rounds = QID_RETRY_ROUNDS
+qid_retry_backoff = 5.0
+
+# Resolve the QIDs from the offline index (built with `python -m kg.qid_index`) when it is available
+if os.path.exists(os.path.join(QID_INDEX_DIR, 'meta.json')):
+    set_qid_index(QIDIndex(QID_INDEX_DIR))
+    logging.info(f"Resolving QIDs from the offline index in {QID_INDEX_DIR}")
+
+
+# The predicates are excluded on the server by the query templates; the triples left over from predicates
+# outside the known YAGO predicates are dropped on the client (see kg/predicate_policy.py)
+predicate_policy = get_default_predicate_policy()
+
+def build_subgraph_result(interesting_entities, results):
+    """
+    Build the Steiner subgraphs of a QID from the neighbors of its interesting entities.
+    """
+    # The triples are dictionary-encoded: the filtering and the graph work on int32 codes,
+    # and only the triples of the Steiner subgraphs are decoded back to URIs.
+    # The codes are only compared within the QID, so its own dictionary is released with its triples
+    dictionary = URIDictionary()
+    triples = TripleFrame.from_triples(combine_lists_from_dict(results), dictionary=dictionary)
+    triples = predicate_policy.filter_frame(triples)
+    graph = create_graph_from_triple_frame(triples)
+    terminals = [code for code in triples.dictionary.lookup_many(interesting_entities).tolist() if code >= 0]
+
+    subgraph_Steiner = build_minimal_subgraph_Steiner(graph, terminals)
+    subgraph_Steiner_largest_connected = largest_connected_subgraph(subgraph_Steiner)
+
+    subgraph_Steiner_triples = decode_triples(edges_to_triples(subgraph_Steiner), dictionary=dictionary)
+    subgraph_Steiner_largest_connected_triples = decode_triples(edges_to_triples(subgraph_Steiner_largest_connected),
+                                                                dictionary=dictionary)
+
+    return {
+        'subgraph_Steiner': subgraph_Steiner_triples,
+        'subgraph_Steiner_length': len(subgraph_Steiner_triples),
+        'subgraph_Steiner_largest_connected': subgraph_Steiner_largest_connected_triples,
+        'subgraph_Steiner_largest_connected_length': len(subgraph_Steiner_largest_connected_triples)
+    }
+
+class QIDQueryError(Exception):
+    """
+    Raised when some neighbor lookups of a QID failed, so that the QID is retried instead of saved incomplete.
+    """
+
+# Marks a QID whose queries failed, to be processed again once the endpoint recovers
+RETRY = "retry"
+
+def check_node_results(QID, results, terminals=None):
+    """
+    Raise a QIDQueryError if the neighbor lookup of any interesting entity failed.
+    With `terminals`, only the lookups of the terminals are checked: the results also hold the entities expanded
+    by the frontier expansion, whose failed lookups only leave them out of the expansion.
+    """
+    if terminals is not None:
+        results = {node: results.get(node) for node in terminals}
+    failed = [node for node, result in results.items() if isinstance(result, dict) and "error" in result]
+    if failed:
+        raise QIDQueryError(f"{len(failed)} of {len(results)} neighbor lookups failed")
+
+def log_frontier_stats(QID, frontier_stats):
+    """
+    Log the statistics of the frontier expansion of a QID, and warn about its failed batches.
+    """
+    if frontier_stats["failed_batches"]:
+        logging.warning(f"Frontier expansion of QID {QID}: {len(frontier_stats['failed_batches'])} batches "
+                        f"({frontier_stats['failed_nodes']} entities) failed and were left out")
+    logging.debug(f"Frontier expansion of QID {QID}: {frontier_stats}")
 
 # Function to process a single QID
 def process_qid(QID):
@@ -47,65 +179,200 @@ def process_qid(QID):
         # logging.info(f"Processing QID: {QID}")
         
         interesting_entities = get_interesting_entities(QID, data[QID]['entities'])
-        results = parallel_process_nodes(interesting_entities)
-        comb_list = combine_lists_from_dict(results)
-        comb_list = filter_triples_by_predicates(comb_list, exclude_props)
-        graph = create_graph_from_triples(comb_list)
+        if frontier_max_levels > 1:
+            results, frontier_stats = expand_frontier(interesting_entities, max_levels=frontier_max_levels,
+                                                      node_budget=frontier_node_budget,
+                                                      max_workers_limit=node_workers,
+                                                      result_format=neighbors_result_format,
+                                                      complete_hubs=complete_hub_neighbors,
+                                                      neighbor_budget=hub_neighbor_budget,
+                                                      entity_counts=hub_entity_counts)
+            log_frontier_stats(QID, frontier_stats)
+        else:
+            results = parallel_process_nodes_batched(interesting_entities, batch_size=neighbors_batch_size,
+                                                     max_workers_limit=node_workers,
+                                                     result_format=neighbors_result_format,
+                                                     complete_hubs=complete_hub_neighbors,
+                                                     neighbor_budget=hub_neighbor_budget,
+                                                     entity_counts=hub_entity_counts)
+        check_node_results(QID, results, interesting_entities)
+        result = build_subgraph_result(interesting_entities, results)
 
-        subgraph_Steiner = build_minimal_subgraph_Steiner(graph, interesting_entities)
-        subgraph_Steiner_largest_connected = largest_connected_subgraph(subgraph_Steiner)
-
-        subgraph_Steiner_triples = edges_to_triples(subgraph_Steiner)
-        subgraph_Steiner_largest_connected_triples = edges_to_triples(subgraph_Steiner_largest_connected)
+        # logging.info(f"Finished processing QID: {QID}")
+        return QID, result
 
-        result = {
-            'subgraph_Steiner': subgraph_Steiner_triples,
-            'subgraph_Steiner_length': len(subgraph_Steiner_triples),
-            'subgraph_Steiner_largest_connected': subgraph_Steiner_largest_connected_triples,
-            'subgraph_Steiner_largest_connected_length': len(subgraph_Steiner_largest_connected_triples)
-        }
+    except (QIDQueryError, SparqlQueryError) as e:
+        logging.warning(f"Queueing QID {QID} for retry: {e}")
+        return QID, RETRY
+    except Exception as e:
+        logging.error(f"Error processing QID {QID}: {e}")
+        return QID, None
 
-        # logging.info(f"Finished processing QID: {QID}")
+# Asyncio variant of process_qid
+async def aprocess_qid(QID, client):
+    try:
+        interesting_entities = await aget_interesting_entities(QID, data[QID]['entities'], client=client)
+        if frontier_max_levels > 1:
+            results, frontier_stats = await aexpand_frontier(interesting_entities, max_levels=frontier_max_levels,
+                                                             node_budget=frontier_node_budget, client=client,
+                                                             complete_hubs=complete_hub_neighbors,
+                                                             neighbor_budget=hub_neighbor_budget,
+                                                             entity_counts=hub_entity_counts)
+            log_frontier_stats(QID, frontier_stats)
+        else:
+            results = await aparallel_process_nodes_batched(interesting_entities, batch_size=neighbors_batch_size,
+                                                            client=client, complete_hubs=complete_hub_neighbors,
+                                                            neighbor_budget=hub_neighbor_budget,
+                                                            entity_counts=hub_entity_counts)
+        check_node_results(QID, results, interesting_entities)
+        result = build_subgraph_result(interesting_entities, results)
         return QID, result
 
+    except (QIDQueryError, SparqlQueryError) as e:
+        logging.warning(f"Queueing QID {QID} for retry: {e}")
+        return QID, RETRY
     except Exception as e:
         logging.error(f"Error processing QID {QID}: {e}")
         return QID, None
 
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f)
+
+def wait_before_retry(retry_qids, retry_round):
+    """
+    Wait until the SPARQL circuit closes (and a growing backoff) before retrying the failed QIDs.
+    """
+    logging.info(f"Retrying {len(retry_qids)} QIDs (round {retry_round + 1} of {qid_retry_rounds})")
+    if circuit_breaker is not None:
+        circuit_breaker.wait_until_closed()
+    time.sleep(qid_retry_backoff * 2 ** retry_round)
+
+def save_failed_qids(failed_qids):
+    """
+    Save the QIDs that still failed after the last retry round, so that they can be processed in a later run.
+    """
+    if not failed_qids:
+        return
+    failed_path = os.path.join(output_location, 'failed_qids.json')
+    save_results(failed_qids, failed_path)
+    logging.error(f"Gave up on {len(failed_qids)} QIDs after {qid_retry_rounds} retry rounds, saved to {failed_path}")
+
 # Process all QIDs using multithreading
 def process_all_qids(keys, save_interval=1000):
     final_results = {}
     batch_counter = 0
+    processed = 0
 
-    with ThreadPoolExecutor() as executor: #max_workers=10
-        futures = {executor.submit(process_qid, QID): QID for QID in keys}
-        
-        for idx, future in enumerate(tqdm(as_completed(futures), total=len(keys), desc="Processing QIDs")):
-            QID = futures[future]
-            try:
-                result = future.result()
-                if result[1] is not None:
-                    final_results[result[0]] = result[1]
-            except Exception as e:
-                logging.error(f"Exception in future for QID {QID}: {e}")
-
-            # Save intermediate results every `save_interval`
-            if (idx + 1) % save_interval == 0:
-                intermediate_path = os.path.join(output_intermediate_location, f'intermediate_results_batch_{batch_counter}.json')
-                with open(intermediate_path, 'w') as f:
-                    json.dump(final_results, f)
-                logging.info(f"Saved intermediate results to {intermediate_path}")
-                batch_counter += 1
-                final_results.clear()  # Clear memory to prevent RAM overflow
+    # The neighbor and QID lookups of all the QID workers share the I/O scheduler, which bounds the requests
+    # in flight against the endpoint and serves the QIDs fairly
+    pending = list(keys)
+    for retry_round in range(qid_retry_rounds + 1):
+        if retry_round > 0:
+            wait_before_retry(pending, retry_round - 1)
+        retry_qids = []
+        with ThreadPoolExecutor(max_workers=qid_workers) as executor: #max_workers=10
+            futures = {executor.submit(process_qid, QID): QID for QID in pending}
+            
+            for future in tqdm(as_completed(futures), total=len(pending), desc="Processing QIDs"):
+                QID = futures[future]
+                try:
+                    result = future.result()
+                    if result[1] is RETRY:
+                        # Queued for the next round instead of dropped
+                        retry_qids.append(QID)
+                        continue
+                    if result[1] is not None:
+                        final_results[result[0]] = result[1]
+                except Exception as e:
+                    logging.error(f"Exception in future for QID {QID}: {e}")
+                processed += 1
+
+                # Save intermediate results every `save_interval`
+                if processed % save_interval == 0:
+                    intermediate_path = os.path.join(output_intermediate_location, f'intermediate_results_batch_{batch_counter}.json')
+                    save_results(final_results, intermediate_path)
+                    logging.info(f"Saved intermediate results to {intermediate_path}")
+                    batch_counter += 1
+                    final_results.clear()  # Clear memory to prevent RAM overflow
+        pending = retry_qids
+        if not pending:
+            break
+    save_failed_qids(pending)
+
+    # Save final results
+    final_path = os.path.join(output_location, 'final_results.json')
+    save_results(final_results, final_path)
+    logging.info(f"Final results saved to {final_path}")
+
+# Process all QIDs on a single event loop
+async def aprocess_all_qids(keys, save_interval=1000):
+    final_results = {}
+    batch_counter = 0
+    processed = 0
+
+    # One client, hence one concurrency limit, for every lookup of every QID
+    async with AsyncSparqlClient(max_concurrency=async_max_concurrency, cache=sparql_cache,
+        router=replica_router, breaker=circuit_breaker) as client:
+        pending = list(keys)
+        for retry_round in range(qid_retry_rounds + 1):
+            if retry_round > 0:
+                # The wait blocks, but nothing else runs on the loop between rounds
+                wait_before_retry(pending, retry_round - 1)
+            retry_qids = []
+            tasks = [asyncio.ensure_future(aprocess_qid(QID, client)) for QID in pending]
+
+            for task in tqdm(asyncio.as_completed(tasks), total=len(pending), desc="Processing QIDs"):
+                QID, result = await task
+                if result is RETRY:
+                    retry_qids.append(QID)
+                    continue
+                if result is not None:
+                    final_results[QID] = result
+                processed += 1
+
+                # Save intermediate results every `save_interval`
+                if processed % save_interval == 0:
+                    intermediate_path = os.path.join(output_intermediate_location, f'intermediate_results_batch_{batch_counter}.json')
+                    save_results(final_results, intermediate_path)
+                    logging.info(f"Saved intermediate results to {intermediate_path}")
+                    batch_counter += 1
+                    final_results.clear()  # Clear memory to prevent RAM overflow
+            pending = retry_qids
+            if not pending:
+                break
+        save_failed_qids(pending)
 
     # Save final results
     final_path = os.path.join(output_location, 'final_results.json')
-    with open(final_path, 'w') as f:
-        json.dump(final_results, f)
+    save_results(final_results, final_path)
     logging.info(f"Final results saved to {final_path}")
-    
+
 # Load data
 data = load_json('./inputs/final_results_train10K_wiki40B.json')
 keys = list(data.keys())
 # Execute processing
-process_all_qids(keys, save_interval=500)  # Limit to first 10 for testing
+if use_async_io:
+    asyncio.run(aprocess_all_qids(keys, save_interval=500))
+else:
+    process_all_qids(keys, save_interval=500)  # Limit to first 10 for testing
+if sparql_cache is not None:
+    logging.info(f"SPARQL cache stats: {sparql_cache.stats()}")
+# Export the per-template SPARQL metrics (latency, bytes, rows, errors)
+sparql_metrics = get_default_metrics()
+with open(os.path.join(output_location, 'sparql_metrics.json'), 'w') as f:
+    f.write(sparql_metrics.to_json(indent=2))
+with open(os.path.join(output_location, 'sparql_metrics.prom'), 'w') as f:
+    f.write(sparql_metrics.to_prometheus())
+logging.info(f"SPARQL metrics saved to {output_location}")
+if replica_router is not None:
+    logging.info(f"SPARQL replica stats: {replica_router.stats()}")
+if circuit_breaker is not None:
+    logging.info(f"SPARQL circuit breaker stats: {circuit_breaker.stats()}")
+if not use_async_io:
+    logging.info(f"KG I/O scheduler stats: {get_default_io_scheduler().stats()}")
+if sparql_traffic_mode == "record":
+    get_default_client().recorder.close()
+    logging.info(f"SPARQL traffic recorded to {sparql_traffic_log}")
+elif sparql_traffic_mode == "replay":
+    logging.info(f"SPARQL replay stats: {get_default_client().traffic_log.stats()}")
@@ -0,0 +1,232 @@
+"""
+This module contains an executor for multi-subject VALUES queries with adaptive batch sizes.
+Queries like `get_triples_multiple_subjects_query` put every entity into one VALUES clause; when a batch hits
+many high-degree entities, the endpoint times out or returns a huge payload. The executor:
+- sizes the batches from the latency and the number of rows of the previous batches,
+- splits a batch in two and retries the halves when it times out or fails with a 5xx,
+- merges the partial results, so that a slow entity only loses its own rows.
+"""
+############################################################################################################
+# Importing necessary libraries
+import time
+import threading
+from typing import Callable, List
+
+import pandas as pd
+
+from kg.sparql_client import SparqlClient, SparqlQueryError, SparqlTimeoutError, get_default_client
+from kg.sparql_stream import get_triples_from_stream
+from kg.triple_frame import TripleFrame
+from kg.constants import ADAPTIVE_BATCH_INITIAL_SIZE, ADAPTIVE_BATCH_MAX_SIZE, ADAPTIVE_BATCH_TARGET_LATENCY, \
+    ADAPTIVE_BATCH_TARGET_ROWS, ADAPTIVE_BATCH_TIMEOUT
+
+# The batch size grows at most by this factor after a fast batch
+MAX_GROWTH_FACTOR = 2.0
+
+############################################################################################################
+# Functions
+
+def is_retryable_error(error: SparqlQueryError) -> bool:
+    """
+    Whether a failed batch should be split and retried: timeouts and server errors are,
+    client errors (e.g. a malformed query) are not.
+
+    Parameters:
+    ----------
+    error: SparqlQueryError
+        The error of the batch
+
+    Returns:
+    ----------
+    retryable: bool
+        True if the batch should be split and retried
+    """
+    if isinstance(error, SparqlTimeoutError):
+        return True
+    return error.status_code is not None and error.status_code >= 500
+
+############################################################################################################
+# Classes
+
+class AdaptiveBatchExecutor:
+    """
+    Runs a VALUES query over a list of entities in adaptively sized batches and merges the results.
+    The batch size is shared across calls, so an executor learns the cost of a query template over time.
+    Keep one executor per query template.
+    """
+    def __init__(self, client: SparqlClient = None, *, endpoint_url: str = None,
+        initial_batch_size: int = ADAPTIVE_BATCH_INITIAL_SIZE, min_batch_size: int = 1,
+        max_batch_size: int = ADAPTIVE_BATCH_MAX_SIZE, target_latency: float = ADAPTIVE_BATCH_TARGET_LATENCY,
+        target_rows: int = ADAPTIVE_BATCH_TARGET_ROWS, timeout: float = ADAPTIVE_BATCH_TIMEOUT,
+        template: str = None):
+        """
+        Initialize the executor.
+
+        Parameters:
+        ----------
+        client: SparqlClient
+            The SPARQL client to send the queries with. Defaults to the shared client.
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+        initial_batch_size: int
+            The number of entities in the first batch
+
+        min_batch_size, max_batch_size: int
+            The bounds of the batch size
+
+        target_latency: float
+            The latency (in seconds) a batch should take
+
+        target_rows: int
+            The number of rows a batch should return at most
+
+        timeout: float
+            The timeout (in seconds) of a batch, after which it is split. None waits indefinitely.
+
+        template: str
+            The template the queries are built from, recorded in the metrics (see `kg.sparql_metrics`)
+        """
+        if min_batch_size < 1 or max_batch_size < min_batch_size:
+            raise ValueError("Expected 1 <= min_batch_size <= max_batch_size")
+        self.client = client if client is not None else get_default_client()
+        self.endpoint_url = endpoint_url
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size = min(max(initial_batch_size, min_batch_size), max_batch_size)
+        self.target_latency = target_latency
+        self.target_rows = target_rows
+        self.timeout = timeout
+        self.template = template
+
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.splits = 0
+        self.failed_entities = 0
+
+    def _observe(self, num_entities: int, latency: float, num_rows: int) -> None:
+        """
+        Adjust the batch size from a successful batch, scaling its size towards the latency and row targets.
+        """
+        ratio = min(self.target_latency / max(latency, 1e-3), self.target_rows / max(num_rows, 1))
+        with self._lock:
+            self.batches += 1
+            # A small batch that was fast says little about larger ones, so growth is relative to the current size
+            upper = min(self.max_batch_size, int(self.batch_size * MAX_GROWTH_FACTOR))
+            self.batch_size = max(self.min_batch_size, min(upper, int(num_entities * ratio)))
+
+    def _shrink(self, num_entities: int) -> None:
+        """
+        Shrink the batch size after a batch of `num_entities` failed.
+        """
+        with self._lock:
+            self.splits += 1
+            self.batch_size = max(self.min_batch_size, min(self.batch_size, num_entities // 2))
+
+    def _fetch(self, query_sparql: str, columns_dict: dict, as_triple_frame: bool):
+        chunks = self.client.query_stream(query_sparql, endpoint_url=self.endpoint_url, timeout=self.timeout,
+            template=self.template)
+        if as_triple_frame:
+            triples = TripleFrame.from_stream(chunks, subject=columns_dict["subject"],
+                predicate=columns_dict["predicate"], _object=columns_dict["object"])
+        else:
+            triples = get_triples_from_stream(chunks, columns_dict=columns_dict)
+        self.client.metrics.record_rows(self.template, len(triples))
+        return triples
+
+    def _run_batch(self, batch: List[str], build_query: Callable[[List[str]], str],
+        columns_dict: dict, as_triple_frame: bool) -> list:
+        """
+        Run one batch, splitting it until its parts succeed. Entities that fail on their own are skipped.
+        """
+        frames = []
+        # Depth-first, right half pushed first, so that the results keep the order of the entities
+        pending = [batch]
+        while pending:
+            entities = pending.pop()
+            start = time.perf_counter()
+            try:
+                triples = self._fetch(build_query(entities), columns_dict, as_triple_frame)
+            except SparqlQueryError as e:
+                if not is_retryable_error(e):
+                    raise
+                self._shrink(len(entities))
+                if len(entities) == 1:
+                    with self._lock:
+                        self.failed_entities += 1
+                    print(f"Skipping {entities[0]} after the query failed on its own: {e}")
+                    continue
+                middle = len(entities) // 2
+                pending.append(entities[middle:])
+                pending.append(entities[:middle])
+                continue
+            self._observe(len(entities), time.perf_counter() - start, len(triples))
+            frames.append(triples)
+        return frames
+
+    def run(self, entities: List[str], build_query: Callable[[List[str]], str], *,
+        columns_dict: dict = None, as_triple_frame: bool = False):
+        """
+        Run a VALUES query over the entities and merge the results.
+
+        Parameters:
+        ----------
+        entities: List[str]
+            The entities, formatted for the VALUES clause (e.g. `<http://...>`)
+
+        build_query: Callable[[List[str]], str]
+            Builds the query for a batch of entities,
+            e.g. `lambda batch: get_triples_multiple_subjects_query(entities=batch, ...)`
+
+        columns_dict: dict
+            The mapping from SPARQL variables to DataFrame columns
+
+        as_triple_frame: bool
+            Whether to return a dictionary-encoded `TripleFrame` of the "subject", "predicate" and "object"
+            variables of `columns_dict` instead of a DataFrame
+
+        Returns:
+        ----------
+        triples: pd.DataFrame or TripleFrame
+            The merged results of the batches
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If a batch fails with an error that splitting cannot fix (e.g. a malformed query)
+        """
+        if columns_dict is None:
+            columns_dict = {
+                "subject": "subject",
+                "predicate": "predicate",
+                "object": "object"
+            }
+
+        frames = []
+        position = 0
+        while position < len(entities):
+            # The batch size is read per batch, so it adapts within a call
+            batch = entities[position:position + self.batch_size]
+            position += len(batch)
+            frames.extend(self._run_batch(batch, build_query, columns_dict, as_triple_frame))
+
+        if as_triple_frame:
+            return TripleFrame.concat(frames)
+        if not frames:
+            return pd.DataFrame(columns=list(columns_dict.values()))
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the executor.
+
+        Returns:
+        ----------
+        stats: dict
+            The current batch size, the successful batches, the splits and the skipped entities
+        """
+        return {"batch_size": self.batch_size, "batches": self.batches, "splits": self.splits,
+            "failed_entities": self.failed_entities}
@@ -0,0 +1,333 @@
+"""
+This module contains the asyncio access path to the YAGO SPARQL endpoint.
+It lets thousands of lookups be in flight from a single event loop, bounded by one global concurrency limit,
+instead of blocking one OS thread per request.
+"""
+############################################################################################################
+# Importing necessary libraries
+import json
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+import aiohttp
+
+from kg.constants import YAGO_ENDPOINT_URL, SPARQL_ASYNC_MAX_CONCURRENCY, SPARQL_REQUEST_TIMEOUT
+from kg.sparql_client import SparqlQueryError, SparqlTimeoutError, SparqlCircuitOpenError, SPARQL_JSON_FORMAT
+from kg.sparql_metrics import SparqlMetrics, get_default_metrics, count_bindings
+from kg.replica_router import ReplicaRouter, get_default_router
+from kg.circuit_breaker import CircuitBreaker, get_default_circuit_breaker
+from kg.sparql_cache import SparqlDiskCache, normalize_query
+from kg.single_flight import AsyncSingleFlight
+
+############################################################################################################
+# Classes
+
+class AsyncSparqlClient:
+    """
+    Asyncio counterpart of `SparqlClient`.
+    All the queries sent through the client share a single semaphore, so at most `max_concurrency`
+    requests are in flight at any time, regardless of how many coroutines are waiting.
+
+    The session and the semaphore are bound to the event loop they were created on;
+    they are re-created transparently if the client is used from a new event loop.
+    """
+    def __init__(self, endpoint_url: str = YAGO_ENDPOINT_URL, *,
+        max_concurrency: int = SPARQL_ASYNC_MAX_CONCURRENCY, timeout: float = SPARQL_REQUEST_TIMEOUT,
+        cache: SparqlDiskCache = None, single_flight: bool = True, metrics: SparqlMetrics = None,
+        router: ReplicaRouter = None, breaker: CircuitBreaker = None):
+        """
+        Initialize the AsyncSparqlClient object.
+
+        Parameters:
+        ----------
+        endpoint_url: str
+            The default SPARQL endpoint URL, used when a query does not specify one
+
+        max_concurrency: int
+            The maximum number of requests in flight at once
+
+        timeout: float
+            The timeout (in seconds) for a single request. None waits indefinitely.
+
+        cache: SparqlDiskCache
+            The on-disk result cache to read from and write to. None disables caching.
+
+        single_flight: bool
+            Whether concurrent identical queries share one request (and one decoded result).
+            Callers must then treat the results as read-only.
+
+        metrics: SparqlMetrics
+            The metrics to record the queries in. Defaults to the shared metrics.
+
+        router: ReplicaRouter
+            The router spreading the queries across read replicas of the endpoint. None sends every query
+            to the URL it is addressed to.
+
+        breaker: CircuitBreaker
+            The circuit breaker limiting the requests in flight (below `max_concurrency`) and rejecting requests
+            during outages. None sends every request.
+        """
+        self.endpoint_url = endpoint_url
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+        self.router = router
+        self.breaker = breaker
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self.single_flight = single_flight
+        self._loop = None
+        self._session = None
+        self._semaphore = None
+        self._single_flight = None
+
+    async def __aenter__(self) -> "AsyncSparqlClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _ensure_session(self) -> None:
+        """
+        Create the session and the semaphore for the running event loop, if not done already.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._loop is loop and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._single_flight = AsyncSingleFlight() if self.single_flight else None
+        self._loop = loop
+
+    async def query(self, query_sparql: str, *, endpoint_url: str = None, template: str = None) -> dict:
+        """
+        Query the SPARQL endpoint and return the decoded JSON result.
+        Concurrent identical queries are coalesced into one request, unless single-flight is disabled.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+        template: str
+            The template the query was built from, recorded in the metrics (see `kg.sparql_metrics`)
+
+        Returns:
+        ----------
+        response_json: dict
+            The decoded SPARQL JSON result
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If the request fails or the endpoint does not return 200
+        """
+        endpoint_url = endpoint_url or self.endpoint_url
+        if self.cache is not None:
+            # The cache lookups are local sqlite reads, cheap enough to run on the event loop
+            cache_key = self.cache.make_key(query_sparql, endpoint_url)
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                self.metrics.record_cache_hit(template)
+                return cached_response
+
+        else:
+            cache_key = None
+
+        self._ensure_session()
+        if self._single_flight is None:
+            return await self._fetch(query_sparql, endpoint_url, cache_key, template)
+        return await self._single_flight.do((endpoint_url, normalize_query(query_sparql)),
+            lambda: self._fetch(query_sparql, endpoint_url, cache_key, template))
+
+    async def _fetch(self, query_sparql: str, endpoint_url: str, cache_key: str, template: str = None) -> dict:
+        """
+        Send a query within the concurrency limit, decode its result and add it to the cache.
+        """
+        headers = {
+            "Content-Type": "application/sparql-query; charset=utf-8",
+            "Accept": SPARQL_JSON_FORMAT,
+        }
+        async with self._semaphore:
+            # Timed within the concurrency limit, so that the latency does not include the queueing
+            start = time.perf_counter()
+            try:
+                body = await self._post(query_sparql, endpoint_url, headers)
+                response_json = json.loads(body)
+            except Exception as e:
+                self.metrics.record(template, latency=time.perf_counter() - start, error=e)
+                raise
+            self.metrics.record(template, latency=time.perf_counter() - start, bytes_received=len(body),
+                rows=count_bindings(response_json))
+
+        if self.cache is not None:
+            self.cache.put_bytes(cache_key, body)
+        return response_json
+
+    async def _post(self, query_sparql: str, endpoint_url: str, headers: dict) -> bytes:
+        """
+        Send a query, to a replica if the client routes the endpoint, and return the response body.
+        """
+        slot = None
+        if self.breaker is not None:
+            slot = await self.breaker.aacquire()
+            if slot is None:
+                raise SparqlCircuitOpenError(f"The SPARQL circuit breaker rejected the query ({self.breaker.state})")
+        replica_url = None
+        if self.router is not None and self.router.routes(endpoint_url):
+            replica_url = endpoint_url = self.router.acquire()
+        start = time.perf_counter()
+        failed = False
+        try:
+            async with self._session.post(endpoint_url, headers=headers,
+                data=query_sparql.encode("utf-8")) as response:
+                if response.status != 200:
+                    failed = response.status >= 500
+                    raise SparqlQueryError(f"Error: {response.status}", status_code=response.status)
+                return await response.read()
+        except asyncio.TimeoutError as e:
+            failed = True
+            raise SparqlTimeoutError(f"The SPARQL query timed out: {e!r}") from e
+        except aiohttp.ClientError as e:
+            failed = True
+            raise SparqlQueryError(f"Error querying the SPARQL endpoint: {e!r}") from e
+        finally:
+            if replica_url is not None:
+                self.router.release(replica_url, time.perf_counter() - start, failed=failed)
+            if slot is not None:
+                self.breaker.release(slot, time.perf_counter() - start, failed=failed)
+
+    async def close(self) -> None:
+        """Close the session of the client."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+############################################################################################################
+# Functions
+
+_default_async_client = None
+
+def get_default_async_client() -> AsyncSparqlClient:
+    """
+    Get the process-wide AsyncSparqlClient, creating it on first use.
+    Every coroutine using the default client shares its concurrency limit.
+
+    Returns:
+    ----------
+    client: AsyncSparqlClient
+        The shared AsyncSparqlClient
+    """
+    global _default_async_client
+    if _default_async_client is None:
+        _default_async_client = AsyncSparqlClient(router=get_default_router(),
+            breaker=get_default_circuit_breaker())
+    return _default_async_client
+
+async def aquery_kg_endpoint(yago_endpoint_url: str, query_sparql: str, *,
+    client: AsyncSparqlClient = None, template: str = None) -> dict:
+    """
+    Asyncio variant of `kg.query.query_kg_endpoint`.
+
+    Parameters:
+    ----------
+    yago_endpoint_url: str
+        The YAGO endpoint URL
+
+    query_sparql: str
+        The SPARQL query
+
+    client: AsyncSparqlClient
+        The client to send the query with. Defaults to the shared client.
+
+    template: str
+        The template the query was built from, recorded in the metrics
+
+    Returns:
+    ----------
+    response: dict
+        The decoded SPARQL JSON result, or None if the query failed
+    """
+    if client is None:
+        client = get_default_async_client()
+
+    try:
+        return await client.query(query_sparql, endpoint_url=yago_endpoint_url, template=template)
+    except SparqlQueryError as e:
+        if e.status_code is None:
+            print(f"Error querying the YAGO knowledge graph: {e}")
+        return None
+    except Exception as e:
+        print(f"Error querying the YAGO knowledge graph: {e}")
+        return None
+
+async def agather_indexed(async_function: Callable[..., Awaitable[Any]], items: List[Any],
+    **kwargs) -> Dict[int, Any]:
+    """
+    Run `async_function` on every item concurrently and collect the results by index,
+    the same way the thread-based helpers in `kg.kg_functions` do.
+    Failures are reported as `{"error": ...}` instead of being raised.
+
+    Parameters:
+    ----------
+    async_function: Callable[..., Awaitable[Any]]
+        The coroutine function to call on each item
+
+    items: List[Any]
+        The items to process
+
+    kwargs:
+        Extra keyword arguments passed to every call
+
+    Returns:
+    ----------
+    results: Dict[int, Any]
+        The results, keyed by the index of the item
+    """
+    outputs = await asyncio.gather(*(async_function(item, **kwargs) for item in items),
+        return_exceptions=True)
+    return {
+        index: {"error": str(output)} if isinstance(output, Exception) else output
+        for index, output in enumerate(outputs)
+    }
+
+def run_async_batch(async_function: Callable[..., Awaitable[Any]], items: List[Any], *,
+    max_concurrency: int = SPARQL_ASYNC_MAX_CONCURRENCY, endpoint_url: str = YAGO_ENDPOINT_URL) -> Dict[int, Any]:
+    """
+    Batch driver for synchronous callers.
+    Runs `async_function(item, client=client)` for every item on a single event loop,
+    with a dedicated client bounded to `max_concurrency` requests in flight.
+
+    Parameters:
+    ----------
+    async_function: Callable[..., Awaitable[Any]]
+        The coroutine function to call on each item, e.g. `aprocess_node` or `aconvert_QID_yagoID`
+
+    items: List[Any]
+        The items to process
+
+    max_concurrency: int
+        The maximum number of requests in flight at once
+
+    endpoint_url: str
+        The SPARQL endpoint URL
+
+    Returns:
+    ----------
+    results: Dict[int, Any]
+        The results, keyed by the index of the item
+    """
+    async def _run():
+        async with AsyncSparqlClient(endpoint_url, max_concurrency=max_concurrency) as client:
+            return await agather_indexed(async_function, items, client=client)
+
+    return asyncio.run(_run())
@@ -0,0 +1,4 @@
+"""
+This package contains benchmark scripts for the KG access layer.
+Run them from the `src` directory, e.g. `python -m kg.benchmarks.result_formats --help`.
+"""
@@ -0,0 +1,90 @@
+"""
+Benchmark of the embedded local SPARQL store (see kg/local_store.py) against the HTTP endpoint.
+The same workload as `kg.benchmarks.query_hints` (without hints) is run against a live endpoint and against
+a local store loaded with a slice covering the same entities; the runs alternate between both backends.
+For each template, it reports the median latency and the number of rows of both backends. The row counts
+only match if the slice contains the whole neighborhood of the entities.
+
+Usage (from `src`):
+    python -m kg.local_store load --store_dir <store_dir> --ttl_paths <slice.ttl>
+    python -m kg.benchmarks.local_store --endpoint http://localhost:9999/bigdata/sparql --store_dir <store_dir>
+"""
+############################################################################################################
+# Importing necessary libraries
+import time
+import argparse
+import statistics
+from typing import Callable
+
+from kg.constants import YAGO_ENDPOINT_URL, LOCAL_STORE_DIR
+from kg.benchmarks.query_hints import get_workload
+from kg.local_store import LocalSparqlStore
+from kg.sparql_client import SparqlClient
+
+############################################################################################################
+# Functions
+
+def benchmark_template(backends: dict, build_query: Callable[[bool], str], repeat: int) -> dict:
+    """
+    Run the query of a template `repeat` times on every backend, alternating between them.
+
+    Parameters:
+    ----------
+    backends: dict
+        The clients to compare, by name ("http" and "local")
+
+    build_query: Callable[[bool], str]
+        Builds the query of the template with or without the hints
+
+    repeat: int
+        The number of runs per backend
+
+    Returns:
+    ----------
+    measurements: dict
+        The median latency (in milliseconds) and the number of rows, per backend
+    """
+    query = build_query(False)
+    latencies = {name: [] for name in backends}
+    rows = {}
+    for _ in range(repeat):
+        for name, client in backends.items():
+            start = time.perf_counter()
+            _, result_rows = client.query_rows(query)
+            latencies[name].append(time.perf_counter() - start)
+            rows[name] = len(result_rows)
+    return {name: {"ms": statistics.median(latencies[name]) * 1000, "rows": rows[name]} for name in backends}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the embedded local SPARQL store with the HTTP endpoint.")
+    parser.add_argument("--endpoint", type=str, default=YAGO_ENDPOINT_URL, help="SPARQL endpoint URL.")
+    parser.add_argument("--store_dir", type=str, default=LOCAL_STORE_DIR, help="Directory of the local store.")
+    parser.add_argument("--entities", type=str, nargs="+", default=["Italy", "Germany", "Albert_Einstein"],
+        help="YAGO entities (local names) used by the entity queries.")
+    parser.add_argument("--qids", type=str, nargs="+", default=["Q38", "Q183", "Q937"],
+        help="Wikidata QIDs used by the sameAs queries.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per template and backend.")
+    args = parser.parse_args()
+
+    backends = {
+        # Without single-flight or cache, so that every run reaches the endpoint
+        "http": SparqlClient(args.endpoint, single_flight=False),
+        "local": LocalSparqlStore(args.store_dir, read_only=True),
+    }
+    workload = get_workload(args.entities, args.qids)
+    # Warm up the connection and the caches of both backends before measuring
+    for build_query in workload.values():
+        for client in backends.values():
+            client.query_rows(build_query(False))
+
+    print(f"{'template':<18}{'http ms':>10}{'local ms':>10}{'speedup':>9}{'http rows':>11}{'local rows':>12}")
+    for template, build_query in workload.items():
+        m = benchmark_template(backends, build_query, args.repeat)
+        speedup = m["http"]["ms"] / m["local"]["ms"] if m["local"]["ms"] else float("nan")
+        print(f"{template:<18}{m['http']['ms']:>10.1f}{m['local']['ms']:>10.1f}{speedup:>9.2f}"
+            f"{m['http']['rows']:>11}{m['local']['rows']:>12}")
+        if m["http"]["rows"] != m["local"]["rows"]:
+            print(f"WARNING: the local store returned a different number of rows for {template}")
+
+if __name__ == "__main__":
+    main()
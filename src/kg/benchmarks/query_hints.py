@@ -0,0 +1,119 @@
+"""
+Benchmark of the Blazegraph query hints (see kg/query_hints.py) against a live endpoint.
+The same workload (direct-neighbors, multi-subject, description and sameAs queries) is run with and without
+the hints configured in `QUERY_HINTS`; the runs alternate, so that both modes see the same server state.
+For each template, it reports the median latency and the number of rows with and without the hints.
+
+Usage (from `src`):
+    python -m kg.benchmarks.query_hints --endpoint http://localhost:9999/bigdata/sparql --entities Italy Germany
+"""
+############################################################################################################
+# Importing necessary libraries
+import time
+import argparse
+import statistics
+from typing import Callable, Dict, List
+
+from kg.constants import YAGO_ENDPOINT_URL, PREFIXES
+from kg.kg_functions import get_yago_query_direct_neighbors_batch, get_yago_query_entity_label_batch
+from kg.query import get_triples_multiple_subjects_query, get_description_multiple_entities_query
+from kg.sparql_client import SparqlClient
+from kg.predicate_policy import get_random_walk_predicate_policy
+from kg.sparql_metrics import TEMPLATE_DIRECT_NEIGHBORS, TEMPLATE_MULTI_SUBJECT, TEMPLATE_DESCRIPTION, \
+    TEMPLATE_SAME_AS, count_bindings
+
+############################################################################################################
+# Functions
+
+def get_workload(entities: List[str], QIDs: List[str]) -> Dict[str, Callable[[bool], str]]:
+    """
+    Get the query builders of the workload, per template.
+
+    Parameters:
+    ----------
+    entities: List[str]
+        The YAGO entities (local names) to query
+
+    QIDs: List[str]
+        The Wikidata QIDs to resolve
+
+    Returns:
+    ----------
+    workload: Dict[str, Callable[[bool], str]]
+        For every template, a function building its query with (True) or without (False) the hints
+    """
+    entity_uris = [f"<{PREFIXES['yago']}{entity}>" for entity in entities]
+    return {
+        TEMPLATE_DIRECT_NEIGHBORS: lambda hints: get_yago_query_direct_neighbors_batch(
+            [f"yago:{entity}" for entity in entities], query_hints=hints),
+        TEMPLATE_MULTI_SUBJECT: lambda hints: get_triples_multiple_subjects_query(entity_uris,
+            prefixes=PREFIXES, invalid_properties=get_random_walk_predicate_policy().sparql_terms(),
+            filter_literals=False, columns_dict={}, query_hints=hints),
+        TEMPLATE_DESCRIPTION: lambda hints: get_description_multiple_entities_query(entity_uris,
+            query_hints=hints),
+        TEMPLATE_SAME_AS: lambda hints: get_yago_query_entity_label_batch(QIDs, query_hints=hints),
+    }
+
+def benchmark_template(client: SparqlClient, build_query: Callable[[bool], str], repeat: int) -> dict:
+    """
+    Run the query of a template `repeat` times with and without the hints, alternating between both.
+
+    Parameters:
+    ----------
+    client: SparqlClient
+        The client to send the queries with
+
+    build_query: Callable[[bool], str]
+        Builds the query with or without the hints
+
+    repeat: int
+        The number of runs per mode
+
+    Returns:
+    ----------
+    measurements: dict
+        The median latency (in milliseconds) and the number of rows of both modes
+    """
+    queries = {False: build_query(False), True: build_query(True)}
+    latencies = {False: [], True: []}
+    rows = {}
+    for _ in range(repeat):
+        for hints, query in queries.items():
+            start = time.perf_counter()
+            response = client.query(query)
+            latencies[hints].append(time.perf_counter() - start)
+            rows[hints] = count_bindings(response)
+    return {
+        "plain_ms": statistics.median(latencies[False]) * 1000,
+        "hinted_ms": statistics.median(latencies[True]) * 1000,
+        "plain_rows": rows[False],
+        "hinted_rows": rows[True],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the SPARQL queries with and without Blazegraph query hints.")
+    parser.add_argument("--endpoint", type=str, default=YAGO_ENDPOINT_URL, help="SPARQL endpoint URL.")
+    parser.add_argument("--entities", type=str, nargs="+", default=["Italy", "Germany", "Albert_Einstein"],
+        help="YAGO entities (local names) used by the entity queries.")
+    parser.add_argument("--qids", type=str, nargs="+", default=["Q38", "Q183", "Q937"],
+        help="Wikidata QIDs used by the sameAs queries.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per template and mode.")
+    args = parser.parse_args()
+
+    # Without single-flight or cache, so that every run reaches the endpoint
+    client = SparqlClient(args.endpoint, single_flight=False)
+    # Warm up the connection (and the endpoint's caches) before measuring
+    for build_query in get_workload(args.entities, args.qids).values():
+        client.query(build_query(False))
+
+    print(f"{'template':<18}{'plain ms':>10}{'hinted ms':>11}{'speedup':>9}{'plain rows':>12}{'hinted rows':>13}")
+    for template, build_query in get_workload(args.entities, args.qids).items():
+        m = benchmark_template(client, build_query, args.repeat)
+        speedup = m["plain_ms"] / m["hinted_ms"] if m["hinted_ms"] else float("nan")
+        print(f"{template:<18}{m['plain_ms']:>10.1f}{m['hinted_ms']:>11.1f}{speedup:>9.2f}"
+            f"{m['plain_rows']:>12}{m['hinted_rows']:>13}")
+        if m["plain_rows"] != m["hinted_rows"]:
+            print(f"WARNING: the hints changed the number of rows of {template}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark of the SPARQL result formats (JSON, TSV, CSV) against a live endpoint.
+For each format, it measures the bytes on the wire (compressed and decompressed), the download time,
+and the time to decode the body into rows.
+
+Usage (from `src`):
+    python -m kg.benchmarks.result_formats --endpoint http://localhost:9999/bigdata/sparql --entities Italy Germany
+"""
+############################################################################################################
+# Importing necessary libraries
+import gzip
+import time
+import zlib
+import argparse
+import statistics
+
+from kg.constants import YAGO_ENDPOINT_URL
+from kg.kg_functions import get_yago_query_direct_neighbors_batch
+from kg.sparql_client import SparqlClient
+from kg.sparql_formats import RESULT_FORMATS, decode_results
+
+############################################################################################################
+# Functions
+
+def _decompress(body: bytes, content_encoding: str) -> bytes:
+    if content_encoding == "gzip":
+        return gzip.decompress(body)
+    if content_encoding == "deflate":
+        return zlib.decompress(body)
+    return body
+
+def benchmark_format(client: SparqlClient, query: str, result_format: str, repeat: int) -> dict:
+    """
+    Run a query `repeat` times in a result format and collect the measurements.
+
+    Parameters:
+    ----------
+    client: SparqlClient
+        The client to send the query with
+
+    query: str
+        The SPARQL query
+
+    result_format: str
+        One of "json", "tsv" or "csv"
+
+    repeat: int
+        The number of runs
+
+    Returns:
+    ----------
+    measurements: dict
+        The median measurements of the runs
+    """
+    wire_bytes, body_bytes, download_times, decode_times, rows = [], [], [], [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post(query, accept=RESULT_FORMATS[result_format], stream=True)
+        # Read the body as sent on the wire, before decompression
+        raw_body = response.raw.read(decode_content=False)
+        download_times.append(time.perf_counter() - start)
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"The endpoint returned {response.status_code} for {result_format}")
+
+        body = _decompress(raw_body, response.headers.get("Content-Encoding", ""))
+        start = time.perf_counter()
+        _, decoded_rows = decode_results(body, result_format)
+        decode_times.append(time.perf_counter() - start)
+
+        wire_bytes.append(len(raw_body))
+        body_bytes.append(len(body))
+        rows = len(decoded_rows)
+
+    return {
+        "format": result_format,
+        "rows": rows,
+        "wire_bytes": int(statistics.median(wire_bytes)),
+        "body_bytes": int(statistics.median(body_bytes)),
+        "download_ms": statistics.median(download_times) * 1000,
+        "decode_ms": statistics.median(decode_times) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the SPARQL result formats on a direct-neighbors query.")
+    parser.add_argument("--endpoint", type=str, default=YAGO_ENDPOINT_URL, help="SPARQL endpoint URL.")
+    parser.add_argument("--entities", type=str, nargs="+", default=["Italy", "Germany", "Albert_Einstein"],
+        help="YAGO entities (local names) whose neighbors are queried.")
+    parser.add_argument("--query_file", type=str, default=None, help="Benchmark this query instead.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per format.")
+    args = parser.parse_args()
+
+    if args.query_file:
+        with open(args.query_file, "r") as f:
+            query = f.read()
+    else:
+        query = get_yago_query_direct_neighbors_batch([f"yago:{entity}" for entity in args.entities])
+
+    client = SparqlClient(args.endpoint)
+    print(f"{'format':<8}{'rows':>8}{'wire bytes':>14}{'body bytes':>14}{'download ms':>14}{'decode ms':>12}")
+    for result_format in RESULT_FORMATS:
+        m = benchmark_format(client, query, result_format, args.repeat)
+        print(f"{m['format']:<8}{m['rows']:>8}{m['wire_bytes']:>14}{m['body_bytes']:>14}"
+            f"{m['download_ms']:>14.1f}{m['decode_ms']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+This module contains the degree-bounded neighborhood expansion of hub entities.
+The neighbors of a hub (e.g. a country) are mostly irrelevant to the Steiner tree connecting the terminals,
+yet they inflate the graph construction and `steiner_tree`. The neighbor triples of an entity above the budget
+are reduced to:
+1. its edges toward the other terminals, which the Steiner tree needs (fetched with a dedicated query,
+   see `kg_functions.get_terminal_edges_batch`, so that they do not depend on the LIMIT of the neighbor query),
+2. predicate-stratified samples of the other triples: the remaining budget is shared evenly across the predicates,
+   and the neighbors of a predicate are sampled with weights growing with their entity counts (see `YagoDB`),
+   which favors well-connected neighbors.
+The samples are seeded per entity, so that the same neighbors give the same subgraph on every run.
+"""
+############################################################################################################
+# Importing necessary libraries
+import zlib
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+from kg.constants import YAGO_ENTITY_STORE_DB_PATH, HUB_NEIGHBOR_BUDGET, ENTITY_COUNT_BATCH_SIZE
+from kg.db.queries import get_entity_count_from_label_multiple_query_parameterized
+
+############################################################################################################
+# Classes
+
+class EntityCounts:
+    """
+    Read-only lookups of the entity counts of the YAGO entity database (the `items` table, see kg/db/yago_db.py),
+    or of a slice database (see kg/slice_extractor.py). Thread-safe: every thread opens its own connection.
+    The counts are static, so they are memoized.
+    """
+    def __init__(self, db_path: str = YAGO_ENTITY_STORE_DB_PATH, *, batch_size: int = ENTITY_COUNT_BATCH_SIZE):
+        """
+        Parameters:
+        ----------
+        db_path: str
+            The entity database
+
+        batch_size: int
+            The number of entities looked up with a single query, below the SQLite limit of query parameters
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._memo: Dict[str, int] = {}
+        self._memo_lock = threading.Lock()
+
+    def _cursor(self) -> sqlite3.Cursor:
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            cursor = self._local.cursor = connection.cursor()
+        return cursor
+
+    def get_counts(self, entity_labels: Iterable[str]) -> Dict[str, int]:
+        """
+        Get the counts of entities, looked up by label (the full URI).
+
+        Parameters:
+        ----------
+        entity_labels: Iterable[str]
+            The entity labels
+
+        Returns:
+        ----------
+        counts: Dict[str, int]
+            The count of every entity, 0 for the entities missing from the database
+        """
+        entity_labels = list(dict.fromkeys(entity_labels))
+        with self._memo_lock:
+            counts = {label: self._memo[label] for label in entity_labels if label in self._memo}
+        missing = [label for label in entity_labels if label not in counts]
+        if not missing:
+            return counts
+        found = {}
+        cursor = self._cursor()
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            query = get_entity_count_from_label_multiple_query_parameterized(entity_labels=batch)
+            for _, label, count in cursor.execute(query, batch).fetchall():
+                found[label] = count or 0
+        found = {label: found.get(label, 0) for label in missing}
+        with self._memo_lock:
+            self._memo.update(found)
+        counts.update(found)
+        return counts
+
+############################################################################################################
+# Functions
+
+def _neighbor(triple: tuple, entity: str) -> str:
+    """
+    The other end of a triple around `entity`.
+    """
+    return triple[2] if triple[0] == entity else triple[0]
+
+def _stratum_quotas(sizes: List[int], budget: int) -> List[int]:
+    """
+    Share the budget evenly across strata of the given sizes; the share a small stratum cannot use goes to
+    the larger ones.
+    """
+    quotas = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda index: sizes[index])
+    for position, index in enumerate(order):
+        share = remaining // (len(order) - position)
+        quotas[index] = min(sizes[index], share)
+        remaining -= quotas[index]
+    # The remainder of the integer division goes to the largest strata with room left
+    for index in reversed(order):
+        if remaining <= 0:
+            break
+        extra = min(remaining, sizes[index] - quotas[index])
+        quotas[index] += extra
+        remaining -= extra
+    return quotas
+
+def select_bounded_neighbors(triples: List[tuple], entity: str, *, terminal_edges: List[tuple] = None,
+    terminals: Set[str] = None, budget: int = HUB_NEIGHBOR_BUDGET, entity_counts: Dict[str, int] = None) -> List[tuple]:
+    """
+    Reduce the neighbor triples of an entity to a budget: the edges toward the terminals first,
+    then predicate-stratified samples weighted by the entity counts of the neighbors.
+
+    Parameters:
+    ----------
+    triples: List[tuple]
+        The (subject, predicate, object) neighbor triples of the entity
+
+    entity: str
+        The entity
+
+    terminal_edges: List[tuple]
+        The triples between the entity and the other terminals, kept first
+
+    terminals: Set[str]
+        The terminals. The triples of `triples` toward a terminal are kept first too.
+
+    budget: int
+        The maximum number of triples kept
+
+    entity_counts: Dict[str, int]
+        The entity counts of the neighbors. None samples the neighbors of a predicate uniformly.
+
+    Returns:
+    ----------
+    triples: List[tuple]
+        At most `budget` triples, unchanged if there are fewer
+    """
+    triples = [tuple(triple) for triple in triples]
+    terminal_edges = [tuple(triple) for triple in terminal_edges or []]
+    terminals = terminals or set()
+    if not terminal_edges and len(triples) <= budget:
+        return triples
+
+    selected = list(dict.fromkeys(terminal_edges + [triple for triple in triples
+        if _neighbor(triple, entity) in terminals and _neighbor(triple, entity) != entity]))[:budget]
+    selected_set = set(selected)
+    strata = defaultdict(list)
+    for triple in dict.fromkeys(triples):
+        if triple not in selected_set:
+            strata[triple[1]].append(triple)
+    remaining = budget - len(selected)
+    if remaining <= 0 or not strata:
+        return selected
+
+    predicates = sorted(strata)
+    quotas = _stratum_quotas([len(strata[predicate]) for predicate in predicates], remaining)
+    # Seeded per entity, so that the samples are reproducible
+    rng = np.random.default_rng(zlib.crc32(entity.encode("utf-8")))
+    for predicate, quota in zip(predicates, quotas):
+        stratum = strata[predicate]
+        if quota >= len(stratum):
+            selected.extend(stratum)
+            continue
+        if entity_counts is not None:
+            weights = np.array([entity_counts.get(_neighbor(triple, entity), 0) for triple in stratum], dtype=float)
+            # Every neighbor keeps a chance, even without a count
+            weights += 1.0
+            weights /= weights.sum()
+        else:
+            weights = None
+        chosen = rng.choice(len(stratum), size=quota, replace=False, p=weights)
+        selected.extend(stratum[index] for index in sorted(chosen.tolist()))
+    return selected
@@ -0,0 +1,351 @@
+"""
+This module contains a latency-aware circuit breaker for the SPARQL clients.
+When Blazegraph slows down (GC pauses, a heavy query), adding requests makes the stall worse. The breaker:
+- caps the number of requests in flight, cutting the cap when the p95 latency exceeds a threshold and
+  growing it back while the endpoint keeps up (additive increase, multiplicative decrease),
+- opens the circuit after several failed requests in a row, rejecting requests immediately instead of
+  piling them onto a failing endpoint,
+- lets a single probe request through once the open period expires (half-open), and closes the circuit
+  when the probe succeeds,
+- sheds the requests that wait too long for a slot.
+
+Rejected requests raise `kg.sparql_client.SparqlCircuitOpenError`, so that the callers can queue the work
+for a retry once the circuit closes (see `wait_until_closed`).
+"""
+############################################################################################################
+# Importing necessary libraries
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+from kg.constants import CIRCUIT_BREAKER_ENABLED, CIRCUIT_BREAKER_MAX_CONCURRENCY, \
+    CIRCUIT_BREAKER_MIN_CONCURRENCY, CIRCUIT_BREAKER_P95_THRESHOLD, CIRCUIT_BREAKER_WINDOW, \
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_OPEN_SECONDS, CIRCUIT_BREAKER_ACQUIRE_TIMEOUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# The concurrency limit is multiplied by this factor when the p95 latency exceeds the threshold
+DECREASE_FACTOR = 0.5
+# Number of latencies needed before the p95 latency is trusted
+MIN_LATENCY_SAMPLES = 10
+# Interval (in seconds) at which the asyncio clients poll for a free slot
+ASYNC_POLL_INTERVAL = 0.01
+
+############################################################################################################
+# Classes
+
+class CircuitSlot:
+    """
+    A slot taken with `CircuitBreaker.acquire`, passed back to `CircuitBreaker.release`.
+    The epoch (the number of times the circuit opened when the slot was taken) tells the requests sent before the
+    circuit opened apart, and `probe` marks the single request let through while the circuit is half-open.
+    """
+    __slots__ = ("epoch", "probe")
+
+    def __init__(self, epoch: int, probe: bool = False):
+        self.epoch = epoch
+        self.probe = probe
+
+class CircuitBreaker:
+    """
+    Adaptive concurrency limit and circuit breaker shared by the SPARQL clients. Thread-safe.
+    The clients acquire a slot before sending a request and release it with the outcome.
+    """
+    def __init__(self, *, max_concurrency: int = CIRCUIT_BREAKER_MAX_CONCURRENCY,
+        min_concurrency: int = CIRCUIT_BREAKER_MIN_CONCURRENCY,
+        p95_threshold: float = CIRCUIT_BREAKER_P95_THRESHOLD, window: int = CIRCUIT_BREAKER_WINDOW,
+        failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        open_seconds: float = CIRCUIT_BREAKER_OPEN_SECONDS,
+        acquire_timeout: float = CIRCUIT_BREAKER_ACQUIRE_TIMEOUT):
+        """
+        Initialize the CircuitBreaker object.
+
+        Parameters:
+        ----------
+        max_concurrency, min_concurrency: int
+            The bounds of the number of requests in flight
+
+        p95_threshold: float
+            The p95 latency (in seconds) above which the concurrency limit is cut
+
+        window: int
+            The number of recent latencies the p95 latency is computed over
+
+        failure_threshold: int
+            The number of failed requests in a row after which the circuit opens
+
+        open_seconds: float
+            How long (in seconds) the circuit stays open before a probe request is let through
+
+        acquire_timeout: float
+            How long (in seconds) a request waits for a slot before it is shed. None waits indefinitely.
+        """
+        if min_concurrency < 1 or max_concurrency < min_concurrency:
+            raise ValueError("Expected 1 <= min_concurrency <= max_concurrency")
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.p95_threshold = p95_threshold
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.acquire_timeout = acquire_timeout
+
+        self._condition = threading.Condition()
+        self._latencies = deque(maxlen=window)
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._state = CLOSED
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+        # Incremented every time the circuit opens
+        self._epoch = 0
+        self._consecutive_failures = 0
+        self._limit_before_open = float(max_concurrency)
+
+        self.opens = 0
+        self.decreases = 0
+        self.rejected = 0
+        self.shed = 0
+
+    @property
+    def state(self) -> str:
+        with self._condition:
+            self._update_state()
+            return self._state
+
+    @property
+    def limit(self) -> int:
+        """The current number of requests allowed in flight."""
+        return int(self._limit)
+
+    def _update_state(self) -> None:
+        """
+        Move an open circuit whose open period expired to half-open. Must be called with the lock held.
+        """
+        if self._state == OPEN and time.monotonic() >= self._opened_until:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+
+    def _open(self, reason: str) -> None:
+        """
+        Open the circuit. Must be called with the lock held.
+        """
+        if self._state == CLOSED:
+            self.opens += 1
+            self._limit_before_open = self._limit
+            print(f"Opening the SPARQL circuit for {self.open_seconds}s: {reason}")
+        self._state = OPEN
+        self._epoch += 1
+        self._opened_until = time.monotonic() + self.open_seconds
+        self._probe_in_flight = False
+        self._consecutive_failures = 0
+        self._condition.notify_all()
+
+    def _p95_latency(self) -> float:
+        """
+        The p95 of the recent latencies. Must be called with the lock held.
+        """
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def _try_acquire(self):
+        """
+        Take a slot without waiting. Must be called with the lock held.
+        Returns the slot if one was taken, False if the circuit rejects requests, None if every slot is taken.
+        """
+        self._update_state()
+        if self._state == OPEN or (self._state == HALF_OPEN and self._probe_in_flight):
+            self.rejected += 1
+            return False
+        if self._state == HALF_OPEN:
+            # A single probe tells whether the endpoint recovered
+            self._probe_in_flight = True
+            self._in_flight += 1
+            return CircuitSlot(self._epoch, probe=True)
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return CircuitSlot(self._epoch)
+        return None
+
+    def acquire(self, timeout: float = None) -> Optional[CircuitSlot]:
+        """
+        Take a slot for a request, waiting while the concurrency limit is reached.
+
+        Parameters:
+        ----------
+        timeout: float
+            How long (in seconds) to wait for a slot. Defaults to the acquire timeout of the breaker;
+            0 does not wait.
+
+        Returns:
+        ----------
+        slot: CircuitSlot
+            The slot of the request, which may then be sent (the slot must be passed to `release`),
+            or None if the circuit is open or no slot freed up in time
+        """
+        timeout = timeout if timeout is not None else self.acquire_timeout
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                acquired = self._try_acquire()
+                if acquired is not None:
+                    return acquired or None
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self.shed += 1
+                    return None
+                self._condition.wait(remaining)
+
+    async def aacquire(self, timeout: float = None) -> Optional[CircuitSlot]:
+        """
+        Asyncio variant of `acquire`. Waits for a slot without blocking the event loop.
+        """
+        timeout = timeout if timeout is not None else self.acquire_timeout
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._condition:
+                acquired = self._try_acquire()
+                if acquired is not None:
+                    return acquired or None
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.shed += 1
+                    return None
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+    def release(self, slot: CircuitSlot, latency: float, *, failed: bool = False) -> None:
+        """
+        Record the outcome of a request sent after `acquire`, and free its slot.
+        Only the probe decides whether a half-open circuit closes; the outcome of a request sent before the circuit
+        opened is ignored.
+
+        Parameters:
+        ----------
+        slot: CircuitSlot
+            The slot returned by `acquire`
+
+        latency: float
+            The time (in seconds) the request took
+
+        failed: bool
+            Whether the request failed (connection error, timeout or 5xx response)
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if slot.epoch != self._epoch:
+                # A request sent before the circuit opened: only its slot is freed
+                self._condition.notify_all()
+                return
+            if slot.probe:
+                if self._state != HALF_OPEN:
+                    return
+                if failed:
+                    self._open("the probe request failed")
+                    return
+                print("Closing the SPARQL circuit after a successful probe request")
+                self._state = CLOSED
+                self._probe_in_flight = False
+                # Resume at half the concurrency the endpoint handled before the outage, and grow from there
+                self._limit = max(float(self.min_concurrency), self._limit_before_open * DECREASE_FACTOR)
+                self._latencies.clear()
+                self._condition.notify_all()
+                return
+            if self._state != CLOSED:
+                return
+
+            if failed:
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._open(f"{self._consecutive_failures} failed requests in a row")
+                return
+            self._consecutive_failures = 0
+
+            self._latencies.append(latency)
+            if len(self._latencies) >= MIN_LATENCY_SAMPLES and self._p95_latency() > self.p95_threshold:
+                self._limit = max(float(self.min_concurrency), self._limit * DECREASE_FACTOR)
+                self.decreases += 1
+                # The latencies observed at the previous limit say nothing about the new one
+                self._latencies.clear()
+            else:
+                # Grows by about one slot per `limit` successful requests
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+    def wait_until_closed(self, timeout: float = None) -> bool:
+        """
+        Wait until the circuit accepts requests again, i.e. until its open period expires.
+        Used to retry queued work after an outage.
+
+        Parameters:
+        ----------
+        timeout: float
+            How long (in seconds) to wait at most. None waits until the open period expires.
+
+        Returns:
+        ----------
+        available: bool
+            True if the circuit is no longer open
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                self._update_state()
+                if self._state != OPEN:
+                    return True
+                remaining = self._opened_until - time.monotonic()
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.monotonic())
+                    if remaining <= 0:
+                        return False
+                self._condition.wait(max(remaining, 0.0))
+
+    def stats(self) -> dict:
+        """
+        Get the state and the counters of the breaker.
+
+        Returns:
+        ----------
+        stats: dict
+            The state of the circuit, the concurrency limit, the requests in flight, the recent p95 latency,
+            the number of times the circuit opened and the limit was cut, and the rejected and shed requests
+        """
+        with self._condition:
+            self._update_state()
+            return {
+                "state": self._state,
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "p95_latency": self._p95_latency() if self._latencies else None,
+                "opens": self.opens,
+                "decreases": self.decreases,
+                "rejected": self.rejected,
+                "shed": self.shed,
+            }
+
+
+############################################################################################################
+# Default circuit breaker
+
+_default_breaker = None
+_default_breaker_lock = threading.Lock()
+
+def get_default_circuit_breaker() -> CircuitBreaker:
+    """
+    Get the process-wide CircuitBreaker shared by the default SPARQL clients, creating it on first use.
+
+    Returns:
+    ----------
+    breaker: CircuitBreaker
+        The shared CircuitBreaker, or None if `CIRCUIT_BREAKER_ENABLED` is not set
+    """
+    global _default_breaker
+    if not CIRCUIT_BREAKER_ENABLED:
+        return None
+    if _default_breaker is None:
+        with _default_breaker_lock:
+            if _default_breaker is None:
+                _default_breaker = CircuitBreaker()
+    return _default_breaker
@@ -35,4 +35,165 @@ INVALID_PROPERTIES = {
     "schema:gtin",
     "schema:logo",
     "schema:geo"
-}
\ No newline at end of file
+}
+
+# Known YAGO predicates and their counts, used to compile the predicate-exclusion policy (see kg/predicate_policy.py)
+YAGO_PROPERTIES_PATH = os.path.join(os.path.dirname(__file__), "db/info/properties_with_counts.txt")
+
+# Predicate-exclusion policies of the query templates and the client-side filters (see kg/predicate_policy.py)
+# The default policy (neighbor, path and slice templates, and the Steiner pipeline): EXCLUDED_PREDICATES are
+# excluded exactly; a predicate containing one of EXCLUDED_PREDICATE_SUBSTRINGS (case-insensitive) is excluded too.
+# The substrings are compiled against the known YAGO predicates, so that the excluded predicates are filtered out
+# on the server, and never transferred.
+# TODO: Replace the constants with configuration variables
+EXCLUDED_PREDICATES = sorted(INVALID_PROPERTIES | {
+    "schema:about", "rdfs:label", "schema:sameAs", "rdf:type", "schema:description", "schema:alternateName",
+    "rdfs:subClassOf", "schema:startDate", "schema:endDate", "yago:follows", "schema:superEvent"
+})
+EXCLUDED_PREDICATE_SUBSTRINGS = [
+    "knowsLanguage", "location", "image", "about", "comment", "gtin", "url", "label", "postalCode", "isbn",
+    "sameAs", "mainEntityOfPage", "leiCode", "type", "dateCreated", "unemploymentRate", "length", "description",
+    "iswcCode", "iataCode", "logo", "alternateName", "geo", "subclassOf", "icaoCode", "humanDevelopmentIndex",
+    "startDate", "endDate", "follows", "superEvent"
+]
+# The random walk policy (multi-subject template) only excludes the invalid properties: the substrings above would
+# also drop predicates the walks follow, e.g. schema:recordLabel, schema:homeLocation or schema:locationCreated
+RANDOM_WALK_EXCLUDED_PREDICATES = sorted(INVALID_PROPERTIES)
+
+# Connection pool defaults for the SPARQL client (see kg/sparql_client.py)
+# The pool is grown at runtime to match the number of worker threads issuing queries.
+SPARQL_DEFAULT_POOL_SIZE = 10
+
+# Timeout (in seconds) for a single SPARQL request. None waits indefinitely.
+SPARQL_REQUEST_TIMEOUT = None
+
+# Maximum number of SPARQL requests in flight at once on the asyncio access path (see kg/async_client.py)
+SPARQL_ASYNC_MAX_CONCURRENCY = 64
+
+# On-disk SPARQL result cache (see kg/sparql_cache.py)
+# TODO: Replace the constants with configuration variables
+SPARQL_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "sparql")
+SPARQL_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Number of entities whose direct neighbors are fetched with a single VALUES query (see kg/kg_functions.py)
+NEIGHBORS_BATCH_SIZE = 10
+
+# Level-synchronous k-hop frontier expansion of the terminals (see `expand_frontier` in kg/kg_functions.py)
+# Every level fetches the neighbors of the whole frontier in one round of batched queries of FRONTIER_BATCH_SIZE
+# entities, run concurrently. The expansion stops once the terminals are connected, after FRONTIER_MAX_LEVELS levels
+# (level 1 is the 1-hop neighborhood of the terminals), or once FRONTIER_NODE_BUDGET entities have been expanded.
+FRONTIER_MAX_LEVELS = 2
+FRONTIER_NODE_BUDGET = 500
+FRONTIER_BATCH_SIZE = 100
+
+# Bidirectional path search between entity pairs (see kg/path_search.py)
+# Every round expands the smaller of the two frontiers with a batched query of up to PATH_SEARCH_BATCH_SIZE entities,
+# returning up to PATH_SEARCH_NEIGHBOR_LIMIT neighbors per entity on average. A frontier larger than
+# PATH_SEARCH_MAX_FRONTIER entities is cut, and the search is reported as truncated.
+PATH_SEARCH_MAX_HOPS = 4
+PATH_SEARCH_TOP_K = 5
+PATH_SEARCH_BATCH_SIZE = 200
+PATH_SEARCH_NEIGHBOR_LIMIT = 1000
+PATH_SEARCH_MAX_FRONTIER = 2000
+
+# Verification of the supporting paths of generated QA pairs (see kg/path_verification.py)
+# Number of (subject, predicate, object) triples checked against the KG with a single VALUES query
+PATH_VERIFY_BATCH_SIZE = 200
+
+# Degree-bounded neighborhood expansion of hub entities (see kg/bounded_expansion.py)
+# An entity with more than HUB_NEIGHBOR_BUDGET neighbor triples keeps its edges toward the other terminals,
+# then predicate-stratified samples weighted by the entity counts, up to HUB_NEIGHBOR_BUDGET triples.
+HUB_NEIGHBOR_BUDGET = 250
+# Number of entities whose counts are read from the entity database with a single query
+ENTITY_COUNT_BATCH_SIZE = 900
+
+# Shared I/O scheduler of the KG lookups (see kg/io_scheduler.py)
+# At most IO_SCHEDULER_ENDPOINT_LIMIT lookups run against an endpoint at once, on at most
+# IO_SCHEDULER_MAX_WORKERS long-lived threads; the callers waiting for a slot are served round-robin.
+IO_SCHEDULER_MAX_WORKERS = 32
+IO_SCHEDULER_ENDPOINT_LIMIT = 16
+# Number of recent wait times the p95 wait time is computed over
+IO_SCHEDULER_WAIT_WINDOW = 1000
+
+# Number of Wikidata QIDs resolved to YAGO URIs with a single VALUES query (see kg/kg_functions.py)
+QID_BATCH_SIZE = 200
+
+# Offline QID to YAGO URI index built from the YAGO TTL dump (see kg/qid_index.py)
+# TODO: Replace the constant with a configuration variable
+QID_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "qid_index")
+
+# Adaptive batching of multi-subject VALUES queries (see kg/adaptive_batching.py)
+# The batch size is adjusted so that one batch takes about the target latency and returns at most the target rows.
+# A batch that times out (or fails with a 5xx) is split in two and retried.
+ADAPTIVE_BATCH_INITIAL_SIZE = 100
+ADAPTIVE_BATCH_MAX_SIZE = 1000
+ADAPTIVE_BATCH_TARGET_LATENCY = 5.0
+ADAPTIVE_BATCH_TARGET_ROWS = 50000
+ADAPTIVE_BATCH_TIMEOUT = 60.0
+
+# Read replicas of the YAGO endpoint (see kg/replica_router.py)
+# Every replica must serve the same YAGO release. The queries sent to YAGO_ENDPOINT_URL (or to any replica)
+# are routed to the replica with the fewest outstanding requests.
+# TODO: Replace the constants with configuration variables
+YAGO_ENDPOINT_REPLICAS = [YAGO_ENDPOINT_URL]
+REPLICA_HEALTH_CHECK_INTERVAL = 10.0
+REPLICA_HEALTH_CHECK_TIMEOUT = 5.0
+# A replica is taken out of rotation when its average latency exceeds REPLICA_SLOW_LATENCY seconds,
+# or after REPLICA_MAX_CONSECUTIVE_FAILURES failed requests in a row, for REPLICA_EJECTION_SECONDS seconds
+REPLICA_SLOW_LATENCY = 10.0
+REPLICA_MAX_CONSECUTIVE_FAILURES = 3
+REPLICA_EJECTION_SECONDS = 30.0
+
+# Blazegraph query hints, per query template (see kg/query_hints.py)
+# The keys are the template names of kg/sparql_metrics.py; a template without hints is sent unchanged.
+# - analytic: run the query on the analytic (native memory) hash joins
+# - optimizer "None": keep the join order as written, i.e. start from the VALUES clause
+# TODO: Replace the constants with configuration variables
+QUERY_HINTS_ENABLED = False
+QUERY_HINTS = {
+    "direct-neighbors": {"analytic": "true", "optimizer": "None"},
+    "multi-subject": {"analytic": "true", "optimizer": "None"},
+    "description": {"optimizer": "None"},
+    "sameAs": {},
+    "path-search": {"analytic": "true", "optimizer": "None"},
+}
+
+# Paged retrieval of the neighbors of hub entities (see kg/paged_retrieval.py)
+# When a neighbors query hits its LIMIT, the neighbors are counted and fetched in ordered pages, in parallel,
+# up to PAGED_MAX_TRIPLES_PER_ENTITY triples per entity.
+PAGED_PAGE_SIZE = 1000
+PAGED_MAX_TRIPLES_PER_ENTITY = 20000
+PAGED_MAX_WORKERS = 4
+
+# Circuit breaker and load shedding of the SPARQL clients (see kg/circuit_breaker.py)
+# The number of requests in flight is cut (multiplicatively) when the p95 latency of the last
+# CIRCUIT_BREAKER_WINDOW requests exceeds CIRCUIT_BREAKER_P95_THRESHOLD seconds, and grows back (additively) while
+# the endpoint keeps up. After CIRCUIT_BREAKER_FAILURE_THRESHOLD failed requests in a row, the circuit opens and
+# requests are rejected for CIRCUIT_BREAKER_OPEN_SECONDS seconds, until a probe request succeeds.
+# A request waiting more than CIRCUIT_BREAKER_ACQUIRE_TIMEOUT seconds for a slot is rejected (shed).
+CIRCUIT_BREAKER_ENABLED = True
+CIRCUIT_BREAKER_MAX_CONCURRENCY = 64
+CIRCUIT_BREAKER_MIN_CONCURRENCY = 2
+CIRCUIT_BREAKER_P95_THRESHOLD = 10.0
+CIRCUIT_BREAKER_WINDOW = 50
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_OPEN_SECONDS = 15.0
+CIRCUIT_BREAKER_ACQUIRE_TIMEOUT = 300.0
+
+# Number of times the QIDs whose queries failed are retried, after the circuit closes, before they are given up
+# (see generate_subgraphs_Steiner.py)
+QID_RETRY_ROUNDS = 3
+
+# Directory of the embedded local SPARQL store, loaded from a YAGO slice (see kg/local_store.py)
+# TODO: Replace the constant with a configuration variable
+LOCAL_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "yago_local_store")
+
+# YAGO slices: the k-hop neighborhood of a set of seed entities (see kg/slice_extractor.py)
+# Every entity within SLICE_HOPS - 1 hops of a seed keeps up to SLICE_MAX_TRIPLES_PER_ENTITY of its triples;
+# the entities at SLICE_HOPS hops only keep their attributes (literals, types and sameAs links).
+# TODO: Replace the constants with configuration variables
+SLICE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "yago_slice")
+SLICE_HOPS = 2
+SLICE_MAX_TRIPLES_PER_ENTITY = 20000
+SLICE_BATCH_SIZE = 50
+SLICE_MAX_WORKERS = 4
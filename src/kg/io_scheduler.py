@@ -0,0 +1,385 @@
+"""
+This module contains the shared I/O scheduler of the KG lookups.
+Creating a ThreadPoolExecutor per call (inside the per-QID workers) makes the number of requests in flight
+against Blazegraph the product of the pool sizes. Instead, every lookup is submitted to one long-lived scheduler:
+- a hard cap on the number of tasks running per endpoint,
+- fair queuing: every caller (by default, the submitting thread) has its own FIFO queue, and the callers are
+  served round-robin, so that a caller with many tasks does not starve the others,
+- an optional per-caller cap on the tasks running at once,
+- metrics per endpoint: queue depth and wait time (from submission to start).
+
+A task submitted from a scheduler thread (e.g. the pages of a hub fetched while processing a batch) is queued
+like any other task, under the submitting worker, so that the idle workers run it in the free endpoint slots.
+While the submitting task waits for its result, its worker runs its own queued tasks in the slot of that task,
+so that nested submissions can neither deadlock nor exceed the cap.
+"""
+############################################################################################################
+# Importing necessary libraries
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable
+
+from kg.constants import IO_SCHEDULER_MAX_WORKERS, IO_SCHEDULER_ENDPOINT_LIMIT, IO_SCHEDULER_WAIT_WINDOW
+
+############################################################################################################
+# Classes
+
+class _TaskFuture(Future):
+    """
+    The future of a task. Waiting for its result from a worker thread runs the queued tasks of that worker meanwhile.
+    """
+    def __init__(self, scheduler: "IOScheduler"):
+        super().__init__()
+        self._scheduler = scheduler
+
+    def result(self, timeout: float = None):
+        if timeout is None and not self.done() and getattr(self._scheduler._local, "is_worker", False):
+            self._scheduler._help_until_done(self)
+        return super().result(timeout)
+
+class _Task:
+    __slots__ = ("fn", "args", "kwargs", "future", "endpoint", "caller", "submitted")
+
+    def __init__(self, fn, args, kwargs, endpoint, caller, future):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.endpoint = endpoint
+        self.caller = caller
+        self.submitted = time.monotonic()
+
+class _EndpointStats:
+    """
+    Counters of the tasks of an endpoint. Accessed with the lock of the scheduler held.
+    """
+    def __init__(self, window: int):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.inline = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.max_running = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waits = deque(maxlen=window)
+
+    def to_dict(self) -> dict:
+        waits = sorted(self.waits)
+        started = self.completed + self.failed + self.running
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "inline": self.inline,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "running": self.running,
+            "max_running": self.max_running,
+            "avg_wait": self.total_wait / started if started else None,
+            "p95_wait": waits[min(len(waits) - 1, math.ceil(0.95 * len(waits)) - 1)] if waits else None,
+            "max_wait": self.max_wait,
+        }
+
+class IOScheduler:
+    """
+    Long-lived, bounded scheduler of blocking I/O tasks, shared by the KG functions. Thread-safe.
+    """
+    def __init__(self, *, max_workers: int = IO_SCHEDULER_MAX_WORKERS,
+        endpoint_limit: int = IO_SCHEDULER_ENDPOINT_LIMIT, endpoint_limits: Dict[str, int] = None,
+        wait_window: int = IO_SCHEDULER_WAIT_WINDOW):
+        """
+        Initialize the IOScheduler object. The worker threads are started on demand.
+
+        Parameters:
+        ----------
+        max_workers: int
+            The maximum number of worker threads, across all the endpoints
+
+        endpoint_limit: int
+            The maximum number of tasks running at once against an endpoint
+
+        endpoint_limits: Dict[str, int]
+            Limits overriding `endpoint_limit` for specific endpoints
+
+        wait_window: int
+            The number of recent wait times the p95 wait time is computed over
+        """
+        if max_workers < 1 or endpoint_limit < 1:
+            raise ValueError("Expected max_workers >= 1 and endpoint_limit >= 1")
+        self.max_workers = max_workers
+        self.default_endpoint_limit = endpoint_limit
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.wait_window = wait_window
+
+        self._condition = threading.Condition()
+        # The queue of every caller with queued tasks, in round-robin order
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._caller_limits: Dict[Hashable, int] = {}
+        self._caller_running: Dict[Hashable, int] = {}
+        self._endpoints: Dict[str, _EndpointStats] = {}
+        self._workers = []
+        self._idle_workers = 0
+        self._shutdown = False
+        self._local = threading.local()
+
+    def endpoint_limit(self, endpoint: str) -> int:
+        """The maximum number of tasks running at once against an endpoint."""
+        return self.endpoint_limits.get(endpoint, self.default_endpoint_limit)
+
+    def _endpoint_stats(self, endpoint: str) -> _EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = _EndpointStats(self.wait_window)
+        return stats
+
+    ########################################################################################################
+    # Submission
+
+    def submit(self, fn: Callable, *args, endpoint: str = None, caller: Hashable = None,
+        caller_limit: int = None, **kwargs) -> Future:
+        """
+        Schedule `fn(*args, **kwargs)`.
+
+        Parameters:
+        ----------
+        fn: Callable
+            The task
+
+        endpoint: str
+            The endpoint the task queries, whose limit applies. None groups the task with the other tasks
+            without an endpoint.
+
+        caller: Hashable
+            The caller the task is queued for. Defaults to the submitting thread (for a nested task, the worker).
+
+        caller_limit: int
+            The maximum number of tasks of the caller running at once. None only applies the endpoint limit.
+
+        Returns:
+        ----------
+        future: Future
+            The future of the task
+        """
+        caller = caller if caller is not None else threading.get_ident()
+        task = _Task(fn, args, kwargs, endpoint, caller, _TaskFuture(self))
+        if getattr(self._local, "is_worker", False):
+            # A nested task: the worker may run it while waiting for it
+            self._local.callers.add(caller)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("The I/O scheduler is shut down")
+            queue = self._queues.get(caller)
+            if queue is None:
+                queue = self._queues[caller] = deque()
+            queue.append(task)
+            if caller_limit is not None:
+                self._caller_limits[caller] = caller_limit
+            stats = self._endpoint_stats(endpoint)
+            stats.submitted += 1
+            stats.queued += 1
+            stats.max_queued = max(stats.max_queued, stats.queued)
+            if self._idle_workers == 0 and len(self._workers) < self.max_workers:
+                self._start_worker()
+            # Both the idle workers and a worker waiting for its nested tasks may take the task
+            self._condition.notify_all()
+        return task.future
+
+    def _help_until_done(self, future: Future) -> None:
+        """
+        Run the queued tasks of the current worker thread in its slot, until `future` is done.
+        The worker is blocked on the future meanwhile, so that its slot is otherwise unused.
+        """
+        while True:
+            with self._condition:
+                task = None
+                while not future.done():
+                    task = self._next_own_task()
+                    if task is not None:
+                        break
+                    self._condition.wait()
+                if task is None:
+                    return
+                stats = self._start_task(task, in_slot=False)
+            self._run_task(task, stats, in_slot=False)
+
+    ########################################################################################################
+    # Workers
+
+    def _start_worker(self) -> None:
+        """
+        Start a worker thread. Must be called with the lock held.
+        """
+        worker = threading.Thread(target=self._work, name=f"kg-io-{len(self._workers)}", daemon=True)
+        self._workers.append(worker)
+        worker.start()
+
+    def _next_task(self):
+        """
+        Pop the next task whose endpoint and caller have a free slot, serving the callers round-robin.
+        Must be called with the lock held.
+        """
+        for caller, queue in self._queues.items():
+            task = queue[0]
+            if self._endpoint_stats(task.endpoint).running >= self.endpoint_limit(task.endpoint):
+                continue
+            caller_limit = self._caller_limits.get(caller)
+            if caller_limit is not None and self._caller_running.get(caller, 0) >= caller_limit:
+                continue
+            queue.popleft()
+            if queue:
+                # The caller goes to the back of the rotation
+                self._queues.move_to_end(caller)
+            else:
+                del self._queues[caller]
+            return task
+        return None
+
+    def _next_own_task(self):
+        """
+        Pop the next task submitted by the current worker thread whose caller has a free slot. The endpoint limit
+        does not apply: the task runs in the slot of the task waiting for it. Must be called with the lock held.
+        """
+        for caller in self._local.callers:
+            queue = self._queues.get(caller)
+            if not queue:
+                continue
+            caller_limit = self._caller_limits.get(caller)
+            if caller_limit is not None and self._caller_running.get(caller, 0) >= caller_limit:
+                continue
+            task = queue.popleft()
+            if not queue:
+                del self._queues[caller]
+            return task
+        return None
+
+    def _start_task(self, task: _Task, in_slot: bool = True) -> _EndpointStats:
+        """
+        Account for the start of a task. `in_slot` is False for a task run in the slot of the task waiting for it.
+        Must be called with the lock held.
+        """
+        stats = self._endpoint_stats(task.endpoint)
+        wait = time.monotonic() - task.submitted
+        stats.queued -= 1
+        if in_slot:
+            stats.running += 1
+            stats.max_running = max(stats.max_running, stats.running)
+        else:
+            stats.inline += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        stats.waits.append(wait)
+        self._caller_running[task.caller] = self._caller_running.get(task.caller, 0) + 1
+        return stats
+
+    def _run_task(self, task: _Task, stats: _EndpointStats, in_slot: bool = True) -> None:
+        """
+        Run a started task and account for its end.
+        """
+        failed = False
+        if task.future.set_running_or_notify_cancel():
+            try:
+                task.future.set_result(task.fn(*task.args, **task.kwargs))
+            except BaseException as e:
+                failed = True
+                task.future.set_exception(e)
+
+        with self._condition:
+            if in_slot:
+                stats.running -= 1
+            if failed:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+            running = self._caller_running[task.caller] - 1
+            if running:
+                self._caller_running[task.caller] = running
+            else:
+                del self._caller_running[task.caller]
+                if task.caller not in self._queues:
+                    self._caller_limits.pop(task.caller, None)
+            # A slot freed up: the tasks it blocked may run now
+            self._condition.notify_all()
+
+    def _work(self) -> None:
+        self._local.is_worker = True
+        # The callers of the tasks submitted by the running task
+        self._local.callers = set()
+        while True:
+            with self._condition:
+                task = self._next_task()
+                while task is None:
+                    if self._shutdown:
+                        return
+                    self._idle_workers += 1
+                    self._condition.wait()
+                    self._idle_workers -= 1
+                    task = self._next_task()
+                stats = self._start_task(task)
+            self._run_task(task, stats)
+            self._local.callers.clear()
+
+    ########################################################################################################
+    # Metrics and lifecycle
+
+    def stats(self) -> dict:
+        """
+        Get the metrics of the scheduler.
+
+        Returns:
+        ----------
+        stats: dict
+            The number of workers and of callers with queued tasks, and per endpoint: the tasks submitted,
+            completed, failed and run by the worker waiting for them, the current and maximum queue depth and
+            running tasks, and the average, p95 and maximum wait time (in seconds)
+        """
+        with self._condition:
+            return {
+                "workers": len(self._workers),
+                "queued_callers": len(self._queues),
+                "endpoints": {str(endpoint): stats.to_dict() for endpoint, stats in self._endpoints.items()},
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the workers once the queued tasks are done.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                if worker is not threading.current_thread():
+                    worker.join()
+
+
+############################################################################################################
+# Default scheduler
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_default_io_scheduler() -> IOScheduler:
+    """
+    Get the process-wide IOScheduler shared by the KG functions, creating it on first use.
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = IOScheduler()
+    return _default_scheduler
+
+def set_default_io_scheduler(scheduler: IOScheduler) -> None:
+    """
+    Replace the process-wide IOScheduler, e.g. to change its limits.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        _default_scheduler = scheduler
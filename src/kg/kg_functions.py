@@ -2,15 +2,31 @@
 This module contains utility functions for interacting with the YAGO knowledge graph.
 In order to work with your own endpoint, you may need to modify the `yago_endpoint_url` variable.
 """
+import re
 import json
-from kg.query import query_kg, query_kg_endpoint, get_triples_from_response
-from concurrent.futures import ThreadPoolExecutor
-from typing import List
+import threading
+from kg.query import query_kg, query_kg_endpoint, query_kg_rows, get_triples_from_response
+from kg.sparql_formats import rows_to_triples_with_main_entity
+from kg.sparql_client import SparqlQueryError, get_default_client
+from kg.async_client import AsyncSparqlClient, aquery_kg_endpoint, agather_indexed
+from kg.sparql_metrics import TEMPLATE_DIRECT_NEIGHBORS, TEMPLATE_SAME_AS
+from kg.query_hints import add_query_hints, use_query_hints
+from kg.paged_retrieval import count_rows, fetch_pages
+from kg.qid_index import QIDIndex
+from kg.predicate_policy import get_default_predicate_policy
+from kg.io_scheduler import get_default_io_scheduler
+from kg.bounded_expansion import EntityCounts, select_bounded_neighbors
+import asyncio
+from typing import Dict, List, Optional
 
-# TODO: Move this to a config file
-yago_endpoint_url = "http://localhost:9999/bigdata/sparql"
-# TODO: Make this a configurable option
-exclude_props = ['schema:image','schema:about', 'rdfs:comment', 'schema:gtin', 'schema:url', 'rdfs:label', 'schema:postalCode', 'schema:isbn', 'schema:sameAs', 'schema:mainEntityOfPage', 'schema:leiCode', 'rdf:type', 'schema:dateCreated', 'yago:unemploymentRate', 'yago:length', 'schema:description', 'yago:iswcCode', 'schema:iataCode', 'schema:logo', 'schema:alternateName', 'schema:geo', 'rdfs:subclassOf', 'schema:icaoCode', 'yago:humanDevelopmentIndex', 'owl:sameAs', 'schema:dateCreated', 'schema:startDate', 'schema:endDate', 'yago:follows', 'schema:superEvent']
+from kg.constants import YAGO_ENDPOINT_URL, NEIGHBORS_BATCH_SIZE, QID_BATCH_SIZE, PAGED_PAGE_SIZE, \
+    PAGED_MAX_TRIPLES_PER_ENTITY, PAGED_MAX_WORKERS, HUB_NEIGHBOR_BUDGET, FRONTIER_MAX_LEVELS, FRONTIER_NODE_BUDGET, \
+    FRONTIER_BATCH_SIZE
+
+# Queries sent to this URL are routed across the replicas in `YAGO_ENDPOINT_REPLICAS` (see kg/replica_router.py)
+yago_endpoint_url = YAGO_ENDPOINT_URL
+# The excluded predicates of the unified policy (see kg/predicate_policy.py), as SPARQL terms
+exclude_props = get_default_predicate_policy().sparql_terms()
 
 def load_json(file_path):
     """
@@ -100,7 +116,8 @@ def extract_ids_with_prefix(entries):
 #     """
 #     return query_template.format(entity_id=entity_id, max_limit=max_limit)
 
-def get_yago_query_direct_neighbors(entity_id, max_limit=1000, exclude_properties=exclude_props, format_yago_prefix=True):
+def get_yago_query_direct_neighbors(entity_id, max_limit=1000, exclude_properties=exclude_props, format_yago_prefix=True,
+    query_hints=None, order_by=False, offset=0):
     """
     Generates a SPARQL query for a given YAGO entity ID, with an option to exclude specific properties.
 
@@ -109,6 +126,9 @@ def get_yago_query_direct_neighbors(entity_id, max_limit=1000, exclude_propertie
         max_limit (int): Maximum number of results to return.
         exclude_properties (list): List of properties to exclude.
         format_yago_prefix (bool): Whether to format the entity ID to use the YAGO prefix.
+        query_hints (bool): Whether to add the Blazegraph query hints. Defaults to `QUERY_HINTS_ENABLED`.
+        order_by (bool): Whether to order the results, which paging through them with `offset` requires.
+        offset (int): Number of results to skip.
 
     Returns:
         str: A SPARQL query as a string.
@@ -128,6 +148,9 @@ def get_yago_query_direct_neighbors(entity_id, max_limit=1000, exclude_propertie
     
     # Dynamically create the FILTER clause
     exclude_filter = "FILTER (?pred NOT IN ({}))".format(", ".join(exclude_properties))
+    # Paged retrieval needs a deterministic order over all the variables (see kg/paged_retrieval.py)
+    order_clause = "ORDER BY ?pred ?sub ?obj\n    " if order_by else ""
+    offset_clause = f" OFFSET {offset}" if offset else ""
     
     query_template = f"""
     PREFIX schema: <http://schema.org/>
@@ -145,8 +168,156 @@ def get_yago_query_direct_neighbors(entity_id, max_limit=1000, exclude_propertie
         }}
         {exclude_filter}
     }}
-    LIMIT {max_limit}
+    {order_clause}LIMIT {max_limit}{offset_clause}
+    """
+    if use_query_hints(query_hints):
+        query_template = add_query_hints(query_template, TEMPLATE_DIRECT_NEIGHBORS)
+    return query_template
+
+def get_yago_query_direct_neighbors_count(entity_id, exclude_properties=exclude_props):
+    """
+    Generates a SPARQL query counting the direct neighbors of a YAGO entity,
+    i.e. the results of `get_yago_query_direct_neighbors` without its LIMIT.
+
+    Args:
+        entity_id (str): The YAGO entity, as a SPARQL term (prefixed name or <URI>).
+        exclude_properties (list): List of properties to exclude.
+
+    Returns:
+        str: A SPARQL query as a string, returning the count in ?count.
+    """
+    exclude_filter = "FILTER (?pred NOT IN ({}))".format(", ".join(exclude_properties))
+    query_template = f"""
+    PREFIX schema: <http://schema.org/>
+    PREFIX yago: <http://yago-knowledge.org/resource/>
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+    SELECT (COUNT(*) AS ?count) WHERE {{
+        SELECT DISTINCT ?sub ?pred ?obj WHERE {{
+            {{
+                {entity_id} ?pred ?obj .
+            }}
+            UNION
+            {{
+                ?sub ?pred {entity_id} .
+            }}
+            {exclude_filter}
+        }}
+    }}
+    """
+    return query_template
+
+
+def format_entity_for_values(entity_id):
+    """
+    Formats a YAGO entity for use in a VALUES clause.
+    Full URIs are wrapped in angle brackets, which (unlike prefixed names) accept any local name.
+
+    Args:
+        entity_id (str): The YAGO entity ID, either a full URI or a prefixed name.
+
+    Returns:
+        str: The entity as a SPARQL term.
+    """
+    if entity_id.startswith('http://') or entity_id.startswith('https://'):
+        return f"<{entity_id}>"
+    return entity_id
+
+def get_yago_query_direct_neighbors_batch(entity_ids, max_limit=1000, exclude_properties=exclude_props,
+    query_hints=None):
+    """
+    Generates a single SPARQL query for the direct neighbors of multiple YAGO entities.
+    The entities are bound through a VALUES clause, and every binding carries the entity it belongs to
+    in the ?entity column, so that the results can be split back per entity.
+
+    Args:
+        entity_ids (list): The YAGO entity IDs.
+        max_limit (int): Maximum number of results to return per entity, on average.
+            The limit applies to the whole batch, so a hub entity can use up the share of the others
+            (`process_nodes_batch` re-queries the entities of a full batch one by one).
+        exclude_properties (list): List of properties to exclude.
+        query_hints (bool): Whether to add the Blazegraph query hints. Defaults to `QUERY_HINTS_ENABLED`.
+
+    Returns:
+        str: A SPARQL query as a string.
+    """
+    if exclude_properties is None:
+        exclude_properties = [
+            "rdfs:comment", "rdfs:label", "rdf:type", 
+            "schema:description", "schema:alternateName", 
+            "schema:mainEntityOfPage", "schema:image", "schema:sameAs"
+        ]
+    exclude_filter = "FILTER (?pred NOT IN ({}))".format(", ".join(exclude_properties))
+    values = " ".join(format_entity_for_values(entity_id) for entity_id in entity_ids)
+
+    query_template = f"""
+    PREFIX schema: <http://schema.org/>
+    PREFIX yago: <http://yago-knowledge.org/resource/>
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+
+    SELECT DISTINCT ?entity ?sub ?pred ?obj WHERE {{
+        VALUES ?entity {{ {values} }}
+        {{
+            ?entity ?pred ?obj .
+        }}
+        UNION
+        {{
+            ?sub ?pred ?entity .
+        }}
+        {exclude_filter}
+    }}
+    LIMIT {max_limit * len(entity_ids)}
+    """
+    if use_query_hints(query_hints):
+        query_template = add_query_hints(query_template, TEMPLATE_DIRECT_NEIGHBORS)
+    return query_template
+
+def get_yago_query_terminal_edges_batch(entity_ids, terminal_ids, exclude_properties=exclude_props, query_hints=None):
+    """
+    Generates a single SPARQL query for the edges between multiple YAGO entities and a set of terminals,
+    in both directions. The bindings have the same columns as `get_yago_query_direct_neighbors_batch`,
+    so that the results can be split per entity in the same way.
+
+    Args:
+        entity_ids (list): The YAGO entity IDs, e.g. the hub entities.
+        terminal_ids (list): The YAGO entity IDs of the terminals, e.g. all the interesting entities.
+        exclude_properties (list): List of properties to exclude.
+        query_hints (bool): Whether to add the Blazegraph query hints. Defaults to `QUERY_HINTS_ENABLED`.
+
+    Returns:
+        str: A SPARQL query as a string.
+    """
+    exclude_filter = "FILTER (?pred NOT IN ({}))".format(", ".join(exclude_properties)) if exclude_properties else ""
+    values = " ".join(format_entity_for_values(entity_id) for entity_id in entity_ids)
+    terminal_values = " ".join(format_entity_for_values(terminal_id) for terminal_id in terminal_ids)
+
+    query_template = f"""
+    PREFIX schema: <http://schema.org/>
+    PREFIX yago: <http://yago-knowledge.org/resource/>
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+
+    SELECT DISTINCT ?entity ?sub ?pred ?obj WHERE {{
+        VALUES ?entity {{ {values} }}
+        VALUES ?terminal {{ {terminal_values} }}
+        {{
+            ?entity ?pred ?terminal .
+            BIND (?terminal AS ?obj)
+        }}
+        UNION
+        {{
+            ?terminal ?pred ?entity .
+            BIND (?terminal AS ?sub)
+        }}
+        FILTER (?terminal != ?entity)
+        {exclude_filter}
+    }}
     """
+    if use_query_hints(query_hints):
+        query_template = add_query_hints(query_template, TEMPLATE_DIRECT_NEIGHBORS)
     return query_template
 
 
@@ -222,7 +393,7 @@ def get_yago_query_entity_label(QID):
 def convert_QID_yagoID(QID):
     query = get_yago_query_entity_label(QID)
     # response = query_kg(yago_endpoint_url, query)
-    response = query_kg_endpoint(yago_endpoint_url, query)
+    response = query_kg_endpoint(yago_endpoint_url, query, template=TEMPLATE_SAME_AS)
 
     if len(response["results"]["bindings"]) == 1:
         yagoID = response["results"]["bindings"][0]['yagoEntity']['value']#.replace('http://yago-knowledge.org/resource/', 'yago:')
@@ -231,6 +402,151 @@ def convert_QID_yagoID(QID):
         # print("Error converting QID to YagoID")
     return yagoID
 
+async def aconvert_QID_yagoID(QID, *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `convert_QID_yagoID`.
+    """
+    query = get_yago_query_entity_label(QID)
+    response = await aquery_kg_endpoint(yago_endpoint_url, query, client=client, template=TEMPLATE_SAME_AS)
+
+    if response is not None and len(response["results"]["bindings"]) == 1:
+        yagoID = response["results"]["bindings"][0]['yagoEntity']['value']
+    else:
+        yagoID = 'NA'
+    return yagoID
+
+def get_yago_query_entity_label_batch(QIDs, query_hints=None):
+    """
+    Generates a single SPARQL query retrieving the YAGO entity IDs of multiple Wikidata QIDs.
+
+    Args:
+            QIDs (list): Wiki entity IDs, e.g. ['Q42', 'Q64'].
+            query_hints (bool): Whether to add the Blazegraph query hints. Defaults to `QUERY_HINTS_ENABLED`.
+
+    Returns:
+            str: A SPARQL query as a string.
+    """
+    values = " ".join(f"wd:{QID}" for QID in QIDs)
+    query = f"""
+    PREFIX owl: <http://www.w3.org/2002/07/owl#>
+    PREFIX wd: <http://www.wikidata.org/entity/>
+
+    SELECT ?wikidataEntity ?yagoEntity
+    WHERE {{
+        VALUES ?wikidataEntity {{ {values} }}
+        ?yagoEntity owl:sameAs ?wikidataEntity .
+    }}
+    """
+    if use_query_hints(query_hints):
+        query = add_query_hints(query, TEMPLATE_SAME_AS)
+    return query
+
+# Process-wide memo of resolved QIDs. A QID maps to its YAGO URI, or to None if YAGO has no (unique) match.
+_qid_yago_memo: Dict[str, Optional[str]] = {}
+_qid_yago_memo_lock = threading.Lock()
+_qid_pattern = re.compile(r"^Q[0-9]+$")
+# Optional offline index answering the QID lookups without the SPARQL endpoint
+_qid_index: Optional[QIDIndex] = None
+
+def set_qid_index(qid_index: Optional[QIDIndex]) -> None:
+    """
+    Use an offline `QIDIndex` (see kg/qid_index.py) to resolve QIDs instead of the SPARQL endpoint.
+    Pass None to go back to querying the endpoint.
+    """
+    global _qid_index
+    _qid_index = qid_index
+
+def convert_QID_yagoID_offline(QID, qid_index: QIDIndex = None):
+    """
+    Variant of `convert_QID_yagoID` answered from an offline `QIDIndex`.
+    Returns 'NA' if the QID has no unique YAGO match, like `convert_QID_yagoID`.
+    """
+    qid_index = qid_index if qid_index is not None else _qid_index
+    yagoID = qid_index.lookup(QID)
+    return yagoID if yagoID is not None else 'NA'
+
+def _get_memoized_QIDs(list_QID: List[str]):
+    """
+    Split the QIDs into the ones already memoized (with their YAGO URIs) and the ones still to resolve.
+    Malformed QIDs are resolved to None without a query.
+    If an offline index is set, it resolves all the remaining QIDs.
+    """
+    resolved = {}
+    unresolved = []
+    with _qid_yago_memo_lock:
+        for QID in dict.fromkeys(list_QID):
+            if QID in _qid_yago_memo:
+                resolved[QID] = _qid_yago_memo[QID]
+            elif not isinstance(QID, str) or not _qid_pattern.match(QID):
+                resolved[QID] = None
+            else:
+                unresolved.append(QID)
+    if _qid_index is not None and unresolved:
+        resolved.update(_qid_index.lookup_many(unresolved))
+        unresolved = []
+    return resolved, unresolved
+
+def _parse_QID_batch_response(response, QIDs) -> Dict[str, Optional[str]]:
+    """
+    Map every QID of a batch to its YAGO URI, and memoize the results.
+    Like `convert_QID_yagoID`, a QID with several YAGO matches is treated as unresolved.
+    """
+    wikidata_prefix = 'http://www.wikidata.org/entity/'
+    matches = {QID: [] for QID in QIDs}
+    for result in response["results"]["bindings"]:
+        QID = result['wikidataEntity']['value'].replace(wikidata_prefix, '')
+        if QID in matches:
+            matches[QID].append(result['yagoEntity']['value'])
+    resolved = {QID: yago_ids[0] if len(yago_ids) == 1 else None for QID, yago_ids in matches.items()}
+    with _qid_yago_memo_lock:
+        _qid_yago_memo.update(resolved)
+    return resolved
+
+def convert_QIDs_yagoIDs_batch(QIDs: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Resolve a batch of QIDs with a single query.
+    Raises a SparqlQueryError if the query fails, so that the failure is not memoized as a miss.
+    """
+    query = get_yago_query_entity_label_batch(QIDs)
+    response = query_kg_endpoint(yago_endpoint_url, query, template=TEMPLATE_SAME_AS)
+    if response is None:
+        raise SparqlQueryError(f"Error converting a batch of {len(QIDs)} QIDs to YagoIDs")
+    return _parse_QID_batch_response(response, QIDs)
+
+def convert_QIDs_yagoIDs(list_QID: List[str], batch_size = QID_BATCH_SIZE,
+    max_workers_limit = 5) -> Dict[str, Optional[str]]:
+    """
+    Resolve Wikidata QIDs to YAGO URIs, `batch_size` QIDs per query.
+    Results are memoized process-wide, so every QID is resolved at most once.
+
+    Args:
+        list_QID (list): Wikidata QIDs, e.g. ['Q42', 'Q64'].
+        batch_size (int): Number of QIDs per query.
+        max_workers_limit (int): Maximum number of batches resolved concurrently, within the limit of
+            the shared I/O scheduler.
+
+    Returns:
+        dict: The YAGO URI of every QID. QIDs without a (unique) YAGO match map to None.
+
+    Raises:
+        SparqlQueryError: If a batch fails (e.g. the circuit is open). The batches that succeeded are memoized,
+            so that a retry only resolves the QIDs of the failed ones.
+    """
+    resolved, unresolved = _get_memoized_QIDs(list_QID)
+    batches = [unresolved[i:i + batch_size] for i in range(0, len(unresolved), batch_size)]
+    if batches:
+        futures = schedule_kg_lookups(convert_QIDs_yagoIDs_batch, batches, max_workers_limit)
+        failed = []
+        for future in futures:
+            try:
+                resolved.update(future.result())
+            except Exception as e:
+                print(e)
+                failed.extend(futures[future])
+        if failed:
+            raise SparqlQueryError(f"{len(failed)} of {len(unresolved)} QIDs could not be converted to YagoIDs")
+    return resolved
+
 def sparql_to_triples_with_main_entity(sparql_results, main_entity):
     triples = []
 
@@ -250,45 +566,489 @@ def sparql_to_triples_with_main_entity(sparql_results, main_entity):
     return triples
 
 
+def split_direct_neighbors_by_entity(sparql_results, entity_ids) -> Dict[str, list]:
+    """
+    Splits the bindings of a batched direct-neighbors query into one triple list per entity,
+    in the same format as `sparql_to_triples_with_main_entity`.
+
+    Args:
+        sparql_results (list): The bindings of a `get_yago_query_direct_neighbors_batch` query.
+        entity_ids (list): The entity IDs the query was built from.
+
+    Returns:
+        dict: The triples, keyed by entity ID. Every entity ID has an entry, possibly empty.
+    """
+    yago_prefix = 'http://yago-knowledge.org/resource/'
+    uri_to_entity = {}
+    for entity_id in entity_ids:
+        uri = entity_id.replace('yago:', yago_prefix, 1) if entity_id.startswith('yago:') else entity_id
+        uri_to_entity[uri] = entity_id
+
+    bindings_per_entity = {entity_id: [] for entity_id in entity_ids}
+    for result in sparql_results:
+        entity_id = uri_to_entity.get(result.get('entity', {}).get('value'))
+        if entity_id is not None:
+            bindings_per_entity[entity_id].append(result)
+
+    return {
+        entity_id: sparql_to_triples_with_main_entity(bindings, entity_id)
+        for entity_id, bindings in bindings_per_entity.items()
+    }
+
+def split_direct_neighbors_rows_by_entity(variables, rows, entity_ids) -> Dict[str, list]:
+    """
+    Tabular counterpart of `split_direct_neighbors_by_entity`, for results decoded with `kg.sparql_formats`.
+    """
+    yago_prefix = 'http://yago-knowledge.org/resource/'
+    uri_to_entity = {}
+    for entity_id in entity_ids:
+        uri = entity_id.replace('yago:', yago_prefix, 1) if entity_id.startswith('yago:') else entity_id
+        uri_to_entity[uri] = entity_id
+
+    entity_position = variables.index('entity')
+    rows_per_entity = {entity_id: [] for entity_id in entity_ids}
+    for row in rows:
+        entity_id = uri_to_entity.get(row[entity_position])
+        if entity_id is not None:
+            rows_per_entity[entity_id].append(row)
+
+    return {
+        entity_id: rows_to_triples_with_main_entity(variables, entity_rows, entity_id)
+        for entity_id, entity_rows in rows_per_entity.items()
+    }
+
 def get_yago_direct_neighbors(entity_id):
     # yagoID = convert_QID_yagoID(entity_id)
     query = get_yago_query_direct_neighbors(entity_id)
     # print(query)
-    response = query_kg_endpoint(yago_endpoint_url, query)
+    response = query_kg_endpoint(yago_endpoint_url, query, template=TEMPLATE_DIRECT_NEIGHBORS)
     
     return response, entity_id
 
-def process_node(node):
+def get_yago_direct_neighbors_paged(entity_id, page_size=PAGED_PAGE_SIZE, max_triples=PAGED_MAX_TRIPLES_PER_ENTITY,
+    max_workers=PAGED_MAX_WORKERS, known_truncated=False):
+    """
+    Gets the direct neighbors of an entity without the silent LIMIT truncation of `get_yago_direct_neighbors`.
+    A first page is fetched with the usual query; if it is full, the neighbors are counted and fetched
+    as ordered pages, in parallel, up to `max_triples`.
+
+    Args:
+        entity_id (str): The YAGO entity ID, either a full URI or a prefixed name.
+        page_size (int): Number of triples per page.
+        max_triples (int): Maximum number of triples fetched for the entity.
+        max_workers (int): Number of pages fetched concurrently.
+        known_truncated (bool): Whether a previous query already hit its LIMIT, which skips the first page.
+
+    Returns:
+        tuple: The triples, in the same format as `sparql_to_triples_with_main_entity`,
+            and whether they are complete (False if they were capped at `max_triples`).
+
+    Raises:
+        SparqlQueryError: If a query fails.
+    """
+    client = get_default_client()
+    entity_term = format_entity_for_values(entity_id)
+    if not known_truncated:
+        query = get_yago_query_direct_neighbors(entity_term, max_limit=page_size, format_yago_prefix=False)
+        variables, rows = client.query_rows(query, endpoint_url=yago_endpoint_url, template=TEMPLATE_DIRECT_NEIGHBORS)
+        if len(rows) < page_size:
+            return rows_to_triples_with_main_entity(variables, rows, entity_id), True
+
+    total = count_rows(get_yago_query_direct_neighbors_count(entity_term), client=client,
+        endpoint_url=yago_endpoint_url, template=TEMPLATE_DIRECT_NEIGHBORS)
+    variables, rows, complete = fetch_pages(
+        lambda limit, offset: get_yago_query_direct_neighbors(entity_term, max_limit=limit,
+            format_yago_prefix=False, order_by=True, offset=offset),
+        total, page_size=page_size, max_rows=max_triples, max_workers=max_workers, client=client,
+        endpoint_url=yago_endpoint_url, template=TEMPLATE_DIRECT_NEIGHBORS)
+    if not complete:
+        print(f"Capped the neighbors of {entity_id} at {max_triples} of {total} triples")
+    return rows_to_triples_with_main_entity(variables, rows, entity_id), complete
+
+def complete_truncated_neighbors(node_results, nodes):
+    """
+    Re-fetches, with `get_yago_direct_neighbors_paged`, the neighbors of the nodes of a batched query
+    that hit its LIMIT. The batch LIMIT is shared, so any node of the batch may have been cut off.
+    Nodes whose paged retrieval fails keep their truncated triples.
+    """
+    for node in nodes:
+        try:
+            node_results[node], _ = get_yago_direct_neighbors_paged(node,
+                known_truncated=len(node_results[node]) >= PAGED_PAGE_SIZE)
+        except Exception as e:
+            print(f"Paged retrieval failed for {node}, keeping its truncated neighbors: {e}")
+    return node_results
+
+def get_yago_direct_neighbors_capped(entity_id, max_limit=PAGED_PAGE_SIZE):
+    """
+    Gets up to `max_limit` direct neighbors of a single entity, in the same format as
+    `sparql_to_triples_with_main_entity`. Raises a SparqlQueryError if the query fails.
+    """
+    query = get_yago_query_direct_neighbors(format_entity_for_values(entity_id), max_limit=max_limit,
+        format_yago_prefix=False)
+    variables, rows = get_default_client().query_rows(query, endpoint_url=yago_endpoint_url,
+        template=TEMPLATE_DIRECT_NEIGHBORS)
+    return rows_to_triples_with_main_entity(variables, rows, entity_id)
+
+def requery_truncated_neighbors(node_results, nodes, max_limit=PAGED_PAGE_SIZE):
+    """
+    Re-queries, one by one and concurrently, the neighbors of the nodes of a batched query that hit its LIMIT,
+    so that every node gets its own LIMIT of `max_limit` triples instead of a share of the batch LIMIT, which
+    a hub can use up. Nodes whose query fails keep their triples from the batch.
+    """
+    futures = schedule_kg_lookups(get_yago_direct_neighbors_capped, nodes, PAGED_MAX_WORKERS, max_limit)
+    for future in futures:
+        node = futures[future]
+        try:
+            node_results[node] = future.result()
+        except Exception as e:
+            print(f"Re-querying the neighbors of {node} failed, keeping its truncated neighbors: {e}")
+    return node_results
+
+def page_hub_neighbors(complete_hubs, neighbor_budget) -> bool:
+    """
+    Whether the neighbors of hub nodes are fetched in pages. Not with a neighbor budget: the first page already
+    holds more triples than the budget keeps, so the COUNT and page queries would only fetch triples to drop.
+    """
+    return complete_hubs and neighbor_budget is None
+
+def get_terminal_edges_batch(nodes, terminals, result_format = "tsv"):
+    """
+    Gets the edges between nodes and a set of terminals with a single query.
+
+    Args:
+        nodes (list): The YAGO entity IDs, e.g. the hub entities.
+        terminals (list): The YAGO entity IDs of the terminals.
+        result_format (str): The SPARQL result format ("json", "tsv" or "csv").
+
+    Returns:
+        dict: The triples between every node and the terminals, keyed by node,
+            in the same format as `sparql_to_triples_with_main_entity`. None if the query failed.
+    """
+    query = get_yago_query_terminal_edges_batch(nodes, terminals)
+    result = query_kg_rows(yago_endpoint_url, query, result_format=result_format, template=TEMPLATE_DIRECT_NEIGHBORS)
+    if result is None:
+        return None
+    variables, rows = result
+    return split_direct_neighbors_rows_by_entity(variables, rows, nodes)
+
+def bound_hub_neighbors(node_results, terminals, neighbor_budget = HUB_NEIGHBOR_BUDGET,
+    entity_counts: EntityCounts = None):
+    """
+    Degree-bounded expansion: reduces the neighbors of the nodes above `neighbor_budget` triples (hubs)
+    to their edges toward the other terminals, then predicate-stratified samples weighted by the entity counts
+    (see kg/bounded_expansion.py), so that the Steiner input stays bounded whatever the degree of the hubs.
+
+    Args:
+        node_results (dict): The triples (or an error) of every node, keyed by node. Updated in place.
+        terminals (list): The terminals of the Steiner tree, e.g. all the candidate nodes.
+        neighbor_budget (int): The maximum number of triples kept per node.
+        entity_counts (EntityCounts): The entity counts weighting the samples. None samples uniformly.
+
+    Returns:
+        dict: The updated `node_results`.
+    """
+    hubs = [node for node, triples in node_results.items()
+        if isinstance(triples, list) and len(triples) > neighbor_budget]
+    if not hubs:
+        return node_results
+    terminal_set = set(terminals)
+    terminal_edges = get_terminal_edges_batch(hubs, list(dict.fromkeys(terminals)))
+    if terminal_edges is None:
+        print(f"Terminal edges query failed for {len(hubs)} hubs, keeping the terminal edges among their neighbors")
+        terminal_edges = {}
+
+    counts = None
+    if entity_counts is not None:
+        neighbors = {end for hub in hubs for triple in node_results[hub] for end in (triple[0], triple[2])}
+        try:
+            counts = entity_counts.get_counts(neighbors)
+        except Exception as e:
+            print(f"Entity counts lookup failed, sampling the hub neighbors uniformly: {e}")
+
+    for hub in hubs:
+        node_results[hub] = select_bounded_neighbors(node_results[hub], hub,
+            terminal_edges=terminal_edges.get(hub, []), terminals=terminal_set, budget=neighbor_budget,
+            entity_counts=counts)
+    return node_results
+
+async def aget_yago_direct_neighbors(entity_id, *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `get_yago_direct_neighbors`.
+    """
+    query = get_yago_query_direct_neighbors(entity_id)
+    response = await aquery_kg_endpoint(yago_endpoint_url, query, client=client,
+        template=TEMPLATE_DIRECT_NEIGHBORS)
+
+    return response, entity_id
+
+def process_node(node, complete_hubs = False):
     """
     Process a single candidate node by getting its neighbors and returning the result.
+    With `complete_hubs`, the neighbors of a node hitting the LIMIT are fetched in pages.
     """
     response, yagoID = get_yago_direct_neighbors(node)
     if response is not None:
         res = response["results"]["bindings"]
+        if complete_hubs and len(res) >= PAGED_PAGE_SIZE:
+            try:
+                return get_yago_direct_neighbors_paged(node, known_truncated=True)[0]
+            except Exception as e:
+                print(f"Paged retrieval failed for {node}, keeping its truncated neighbors: {e}")
         triples_list  = sparql_to_triples_with_main_entity(res, yagoID)
         # print("done")
         return triples_list
     else:
         return {"error": "not found"}
 
-def parallel_process_nodes(candidate_nodes: List[str], max_workers_limit = 5):
+async def aprocess_node(node, *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `process_node`.
+    """
+    response, yagoID = await aget_yago_direct_neighbors(node, client=client)
+    if response is not None:
+        res = response["results"]["bindings"]
+        return sparql_to_triples_with_main_entity(res, yagoID)
+    else:
+        return {"error": "not found"}
+
+def process_nodes_batch(nodes, result_format = "json", complete_hubs = False):
+    """
+    Process a batch of candidate nodes with a single query.
+    Returns the triples of every node, or an error for every node if the query failed.
+    With a tabular `result_format` ("tsv" or "csv"), the result is requested and decoded in that format.
+    The LIMIT of a batch is shared by its nodes: a batch hitting it has the neighbors of its nodes fetched again,
+    in pages with `complete_hubs` (see `get_yago_direct_neighbors_paged`), otherwise one by one with a LIMIT each
+    (see `requery_truncated_neighbors`), so that a hub does not silently cut off the other nodes.
+    """
+    max_limit = PAGED_PAGE_SIZE
+    query = get_yago_query_direct_neighbors_batch(nodes, max_limit=max_limit)
+    if result_format == "json":
+        response = query_kg_endpoint(yago_endpoint_url, query, template=TEMPLATE_DIRECT_NEIGHBORS)
+        if response is None:
+            return {node: {"error": "not found"} for node in nodes}
+        bindings = response["results"]["bindings"]
+        node_results = split_direct_neighbors_by_entity(bindings, nodes)
+        num_rows = len(bindings)
+    else:
+        result = query_kg_rows(yago_endpoint_url, query, result_format=result_format,
+            template=TEMPLATE_DIRECT_NEIGHBORS)
+        if result is None:
+            return {node: {"error": "not found"} for node in nodes}
+        variables, rows = result
+        node_results = split_direct_neighbors_rows_by_entity(variables, rows, nodes)
+        num_rows = len(rows)
+
+    if num_rows >= max_limit * len(nodes):
+        if complete_hubs:
+            node_results = complete_truncated_neighbors(node_results, nodes)
+        elif len(nodes) > 1:
+            node_results = requery_truncated_neighbors(node_results, nodes, max_limit)
+    return node_results
+
+def schedule_kg_lookups(fn, items, max_workers_limit = None, *args):
+    """
+    Submit `fn(item, *args)` for every item to the shared I/O scheduler (see kg/io_scheduler.py), which bounds
+    the lookups running against the endpoint across all the callers, and serves the callers fairly.
+
+    Args:
+        fn (callable): The lookup.
+        items (list): The items to look up.
+        max_workers_limit (int): Maximum number of lookups of this call running at once, within the
+            endpoint limit of the scheduler. None only applies the endpoint limit.
+        *args: The extra arguments of the lookup.
+
+    Returns:
+        dict: The future of every lookup, mapped to its item, in the order of the items.
+    """
+    scheduler = get_default_io_scheduler()
+    # Make sure every running lookup can hold on to a keep-alive connection
+    get_default_client().ensure_pool_size(scheduler.endpoint_limit(yago_endpoint_url))
+    return {scheduler.submit(fn, item, *args, endpoint=yago_endpoint_url, caller_limit=max_workers_limit): item
+        for item in items}
+
+def _split_in_batches(items: List[str], batch_size: int) -> List[List[str]]:
+    """
+    Deduplicate the items, keeping their order, and split them into batches of `batch_size`.
+    """
+    unique_items = list(dict.fromkeys(items))
+    return [unique_items[i:i + batch_size] for i in range(0, len(unique_items), batch_size)]
+
+def _fetch_nodes_batched(nodes, batch_size, max_workers_limit, result_format, complete_hubs):
+    """
+    Fetch the neighbors of the nodes in concurrent batches of `batch_size`.
+    Returns the triples (or an error) of every node, keyed by node.
+    """
+    batches = _split_in_batches(nodes, batch_size)
+    node_results = {}
+    futures = schedule_kg_lookups(process_nodes_batch, batches, max_workers_limit, result_format, complete_hubs)
+    for future in futures:
+        batch = futures[future]
+        try:
+            node_results.update(future.result())
+        except Exception as e:
+            node_results.update({node: {"error": str(e)} for node in batch})
+    return node_results
+
+def parallel_process_nodes_batched(candidate_nodes: List[str], batch_size = NEIGHBORS_BATCH_SIZE,
+    max_workers_limit = 5, result_format = "json", complete_hubs = False, neighbor_budget = None,
+    entity_counts: EntityCounts = None):
+    """
+    Batched variant of `parallel_process_nodes`.
+    Fetches the neighbors of `batch_size` nodes per query, so N nodes cost N / batch_size round trips.
+    Returns the results keyed by node index, in the same format as `parallel_process_nodes`.
+    `result_format` selects the SPARQL result format ("json", "tsv" or "csv").
+    `complete_hubs` fetches the neighbors of hub nodes in pages instead of truncating them at the LIMIT.
+    `neighbor_budget` bounds the triples of every node, with the candidate nodes as terminals
+    (see `bound_hub_neighbors`), weighting the samples with `entity_counts`. It disables `complete_hubs`.
+    """
+    node_results = _fetch_nodes_batched(candidate_nodes, batch_size, max_workers_limit, result_format,
+        page_hub_neighbors(complete_hubs, neighbor_budget))
+    if neighbor_budget is not None:
+        bound_hub_neighbors(node_results, candidate_nodes, neighbor_budget, entity_counts)
+    return {index: node_results[node] for index, node in enumerate(candidate_nodes)}
+
+# Level-synchronous k-hop frontier expansion
+# The 1-hop neighborhoods of the terminals leave the terminals two or more hops apart in separate components.
+# The frontier is expanded level by level, with the neighbors of the whole level fetched in one round of batched
+# queries, until the terminals share a component. The components are tracked with a union-find over the triples.
+
+def _find_component(parents: Dict[str, str], node: str) -> str:
+    """
+    The representative of the component of a node in the union-find `parents`, with path compression.
+    """
+    root = parents.setdefault(node, node)
+    while parents[root] != root:
+        root = parents[root]
+    while node != root:
+        parents[node], node = root, parents[node]
+    return root
+
+def _is_expandable(node) -> bool:
+    """
+    Whether the frontier can expand through a node: YAGO entities only, not literals or external resources.
+    """
+    return isinstance(node, str) and node.startswith('http://yago-knowledge.org/resource/')
+
+def _advance_frontier(level_results, terminals, node_results, visited, parents, stats, max_levels, node_budget):
+    """
+    Record the results of a level, merge the components they link, and select the next frontier:
+    the unvisited entities reached by the level, the most linked first, within the node budget.
+    Returns the next frontier, empty once the expansion stops (see `stats["stop_reason"]`).
+    """
+    node_results.update(level_results)
+    stats["levels"] += 1
+    new_nodes = {}
+    for triples in level_results.values():
+        if not isinstance(triples, list):
+            continue
+        for sub, _, obj in triples:
+            parents[_find_component(parents, sub)] = _find_component(parents, obj)
+            for node in (sub, obj):
+                if node not in visited and _is_expandable(node):
+                    new_nodes[node] = new_nodes.get(node, 0) + 1
+
+    # Terminals without any triple (unknown to the KG, or whose lookup failed) cannot be connected
+    reachable = [terminal for terminal in terminals if node_results.get(terminal)
+        and isinstance(node_results[terminal], list)]
+    stats["connected"] = len({_find_component(parents, terminal) for terminal in reachable}) <= 1
+    remaining = node_budget - len(visited)
+    if stats["connected"]:
+        stats["stop_reason"] = "connected"
+    elif stats["levels"] >= max_levels:
+        stats["stop_reason"] = "max_levels"
+    elif not new_nodes:
+        stats["stop_reason"] = "exhausted"
+    elif remaining <= 0:
+        stats["stop_reason"] = "node_budget"
+    else:
+        # sorted is stable: the entities linked as often keep their discovery order
+        frontier = sorted(new_nodes, key=lambda node: -new_nodes[node])[:remaining]
+        visited.update(frontier)
+        stats["frontier_sizes"].append(len(frontier))
+        return frontier
+    return []
+
+def _new_frontier_stats(terminals) -> dict:
+    return {"levels": 0, "frontier_sizes": [len(terminals)], "queries": 0, "failed_batches": [], "failed_nodes": 0,
+        "connected": False, "stop_reason": None}
+
+def _record_level_queries(stats, frontier, level_results, batch_size) -> None:
+    """
+    Count the queries of a level, and record its failed batches (level, number of entities), whose entities
+    are left out of the expansion.
+    """
+    level = stats["levels"] + 1
+    for batch in _split_in_batches(frontier, batch_size):
+        stats["queries"] += 1
+        if not any(isinstance(level_results.get(node), list) for node in batch):
+            stats["failed_batches"].append((level, len(batch)))
+            stats["failed_nodes"] += len(batch)
+
+def expand_frontier(terminals: List[str], max_levels = FRONTIER_MAX_LEVELS, node_budget = FRONTIER_NODE_BUDGET,
+    batch_size = FRONTIER_BATCH_SIZE, max_workers_limit = 5, result_format = "tsv", complete_hubs = False,
+    neighbor_budget = None, entity_counts: EntityCounts = None):
+    """
+    Level-synchronous k-hop expansion of the terminals: every level fetches the neighbors of the whole frontier
+    with one round of batched queries (run concurrently on the shared I/O scheduler), and the next frontier is
+    made of the entities reached for the first time. The expansion stops early once the terminals are connected,
+    or once `node_budget` entities have been expanded.
+
+    Args:
+        terminals (list): The YAGO entity URIs to connect, e.g. the interesting entities of a QID.
+        max_levels (int): Maximum number of levels. 1 only fetches the neighbors of the terminals, like
+            `parallel_process_nodes_batched`; terminals 2 * max_levels hops apart can be connected.
+        node_budget (int): Maximum number of entities expanded, terminals included.
+        batch_size (int): Number of entities whose neighbors are fetched with a single query.
+        max_workers_limit (int): Maximum number of queries of a level running at once.
+        result_format (str): The SPARQL result format ("json", "tsv" or "csv").
+        complete_hubs (bool): Whether to fetch the neighbors of hub entities in pages. Ignored with a neighbor budget.
+        neighbor_budget (int): The maximum number of triples kept per entity (see `bound_hub_neighbors`),
+            which keeps hubs from flooding the next frontier. None keeps all of them.
+        entity_counts (EntityCounts): The entity counts weighting the samples of the hub neighbors.
+
+    Returns:
+        tuple: The triples (or an error) of every expanded entity, keyed by entity, and the statistics of the
+            expansion: the number of levels, the frontier size of every level, the number of neighbor queries,
+            the failed batches (level, number of entities) and entities, whether the terminals are connected,
+            and why the expansion stopped. The failed lookups of the terminals are errors in the results,
+            those of the other entities only leave them out of the expansion.
+    """
+    terminals = list(dict.fromkeys(terminals))
+    node_results, parents, visited = {}, {}, set(terminals)
+    stats = _new_frontier_stats(terminals)
+    frontier = terminals
+    while frontier:
+        level_results = _fetch_nodes_batched(frontier, batch_size, max_workers_limit, result_format,
+            page_hub_neighbors(complete_hubs, neighbor_budget))
+        _record_level_queries(stats, frontier, level_results, batch_size)
+        if neighbor_budget is not None:
+            bound_hub_neighbors(level_results, terminals, neighbor_budget, entity_counts)
+        frontier = _advance_frontier(level_results, terminals, node_results, visited, parents, stats,
+            max_levels, node_budget)
+    return node_results, stats
+
+def parallel_process_nodes(candidate_nodes: List[str], max_workers_limit = 5, complete_hubs = False,
+    neighbor_budget = None, entity_counts: EntityCounts = None):
     """
     Parallelize the processing of candidate nodes using multithreading.
+    `neighbor_budget` bounds the triples of every node, with the candidate nodes as terminals
+    (see `bound_hub_neighbors`), weighting the samples with `entity_counts`. It disables `complete_hubs`.
     """
     results = {}
-    with ThreadPoolExecutor(max_workers=max_workers_limit) as executor:
-        # Submit all tasks
-        futures = {
-            executor.submit(process_node, node): index 
-            for index, node in enumerate(candidate_nodes)
-        }
-        # Collect results
-        for future in futures:
-            index = futures[future]
-            try:
-                results[index] = future.result()
-            except Exception as e:
-                results[index] = {"error": str(e)}
+    # Submit all tasks to the shared I/O scheduler
+    futures = schedule_kg_lookups(process_node, candidate_nodes, max_workers_limit,
+        page_hub_neighbors(complete_hubs, neighbor_budget))
+    # Collect results
+    for index, future in enumerate(futures):
+        try:
+            results[index] = future.result()
+        except Exception as e:
+            results[index] = {"error": str(e)}
+    if neighbor_budget is not None:
+        node_results = {node: results[index] for index, node in reversed(list(enumerate(candidate_nodes)))}
+        bound_hub_neighbors(node_results, candidate_nodes, neighbor_budget, entity_counts)
+        results = {index: node_results[node] for index, node in enumerate(candidate_nodes)}
     return results
 
 
@@ -298,19 +1058,126 @@ def parallel_convert_QID_yagoID(list_QID: List[str], max_workers_limit = 5):
     Parallelize the processing of candidate nodes using multithreading.
     """
     results = {}
-    with ThreadPoolExecutor(max_workers=max_workers_limit) as executor:
-        # Submit all tasks
-        futures = {
-            executor.submit(convert_QID_yagoID, node): index 
-            for index, node in enumerate(list_QID)
-        }
-        # Collect results
-        for future in futures:
-            index = futures[future]
-            try:
-                results[index] = future.result()
-            except Exception as e:
-                results[index] = {"error": str(e)}
+    # Submit all tasks to the shared I/O scheduler
+    futures = schedule_kg_lookups(convert_QID_yagoID, list_QID, max_workers_limit)
+    # Collect results
+    for index, future in enumerate(futures):
+        try:
+            results[index] = future.result()
+        except Exception as e:
+            results[index] = {"error": str(e)}
     return results
 
+async def aparallel_process_nodes(candidate_nodes: List[str], *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `parallel_process_nodes`.
+    The concurrency is bounded by the client instead of a per-call thread pool.
+    """
+    return await agather_indexed(aprocess_node, candidate_nodes, client=client)
+
+async def aprocess_nodes_batch(nodes, *, client: AsyncSparqlClient = None, complete_hubs = False):
+    """
+    Asyncio variant of `process_nodes_batch`.
+    The nodes of a full batch are fetched again on the (thread-based) SparqlClient, off the event loop.
+    """
+    max_limit = PAGED_PAGE_SIZE
+    query = get_yago_query_direct_neighbors_batch(nodes, max_limit=max_limit)
+    response = await aquery_kg_endpoint(yago_endpoint_url, query, client=client,
+        template=TEMPLATE_DIRECT_NEIGHBORS)
+    if response is None:
+        return {node: {"error": "not found"} for node in nodes}
+    bindings = response["results"]["bindings"]
+    node_results = split_direct_neighbors_by_entity(bindings, nodes)
+    if len(bindings) >= max_limit * len(nodes):
+        if complete_hubs:
+            node_results = await asyncio.to_thread(complete_truncated_neighbors, node_results, nodes)
+        elif len(nodes) > 1:
+            node_results = await asyncio.to_thread(requery_truncated_neighbors, node_results, nodes, max_limit)
+    return node_results
+
+async def _afetch_nodes_batched(nodes, batch_size, client, complete_hubs):
+    """
+    Asyncio variant of `_fetch_nodes_batched`.
+    """
+    batches = _split_in_batches(nodes, batch_size)
+    batch_results = await agather_indexed(aprocess_nodes_batch, batches, client=client,
+        complete_hubs=complete_hubs)
+    node_results = {}
+    for index, batch in enumerate(batches):
+        result = batch_results[index]
+        if not all(node in result for node in batch):
+            # The whole batch failed, report the error for every node
+            result = {node: result for node in batch}
+        node_results.update(result)
+    return node_results
+
+async def aparallel_process_nodes_batched(candidate_nodes: List[str], batch_size = NEIGHBORS_BATCH_SIZE, *,
+    client: AsyncSparqlClient = None, complete_hubs = False, neighbor_budget = None,
+    entity_counts: EntityCounts = None):
+    """
+    Asyncio variant of `parallel_process_nodes_batched`.
+    The bounding of the hub neighbors runs on the (thread-based) SparqlClient, off the event loop.
+    """
+    node_results = await _afetch_nodes_batched(candidate_nodes, batch_size, client,
+        page_hub_neighbors(complete_hubs, neighbor_budget))
+    if neighbor_budget is not None:
+        await asyncio.to_thread(bound_hub_neighbors, node_results, candidate_nodes, neighbor_budget, entity_counts)
+    return {index: node_results[node] for index, node in enumerate(candidate_nodes)}
+
+async def aexpand_frontier(terminals: List[str], max_levels = FRONTIER_MAX_LEVELS, node_budget = FRONTIER_NODE_BUDGET,
+    batch_size = FRONTIER_BATCH_SIZE, *, client: AsyncSparqlClient = None, complete_hubs = False,
+    neighbor_budget = None, entity_counts: EntityCounts = None):
+    """
+    Asyncio variant of `expand_frontier`.
+    The bounding of the hub neighbors runs on the (thread-based) SparqlClient, off the event loop.
+    """
+    terminals = list(dict.fromkeys(terminals))
+    node_results, parents, visited = {}, {}, set(terminals)
+    stats = _new_frontier_stats(terminals)
+    frontier = terminals
+    while frontier:
+        level_results = await _afetch_nodes_batched(frontier, batch_size, client,
+            page_hub_neighbors(complete_hubs, neighbor_budget))
+        _record_level_queries(stats, frontier, level_results, batch_size)
+        if neighbor_budget is not None:
+            await asyncio.to_thread(bound_hub_neighbors, level_results, terminals, neighbor_budget, entity_counts)
+        frontier = _advance_frontier(level_results, terminals, node_results, visited, parents, stats,
+            max_levels, node_budget)
+    return node_results, stats
 
+async def aconvert_QIDs_yagoIDs_batch(QIDs: List[str], *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `convert_QIDs_yagoIDs_batch`.
+    """
+    query = get_yago_query_entity_label_batch(QIDs)
+    response = await aquery_kg_endpoint(yago_endpoint_url, query, client=client, template=TEMPLATE_SAME_AS)
+    if response is None:
+        raise SparqlQueryError(f"Error converting a batch of {len(QIDs)} QIDs to YagoIDs")
+    return _parse_QID_batch_response(response, QIDs)
+
+async def aconvert_QIDs_yagoIDs(list_QID: List[str], batch_size = QID_BATCH_SIZE, *,
+    client: AsyncSparqlClient = None) -> Dict[str, Optional[str]]:
+    """
+    Asyncio variant of `convert_QIDs_yagoIDs`.
+    """
+    resolved, unresolved = _get_memoized_QIDs(list_QID)
+    batches = [unresolved[i:i + batch_size] for i in range(0, len(unresolved), batch_size)]
+    batch_results = await agather_indexed(aconvert_QIDs_yagoIDs_batch, batches, client=client)
+    failed = []
+    for index, batch in enumerate(batches):
+        result = batch_results[index]
+        if not all(QID in result for QID in batch):
+            print(result.get("error"))
+            failed.extend(batch)
+            continue
+        resolved.update(result)
+    if failed:
+        raise SparqlQueryError(f"{len(failed)} of {len(unresolved)} QIDs could not be converted to YagoIDs")
+    return resolved
+
+async def aparallel_convert_QID_yagoID(list_QID: List[str], *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `parallel_convert_QID_yagoID`.
+    The concurrency is bounded by the client instead of a per-call thread pool.
+    """
+    return await agather_indexed(aconvert_QID_yagoID, list_QID, client=client)
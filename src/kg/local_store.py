@@ -0,0 +1,354 @@
+"""
+This module contains an embedded, on-disk SPARQL backend for YAGO slices, built on Oxigraph (`pyoxigraph`).
+Hosting the full YAGO on Blazegraph takes a 36-hour load and a large instance; for development boxes and
+small jobs, a slice of YAGO (see the TTL slices of `kg/hosting`) loaded into an embedded store is enough.
+
+The `LocalSparqlStore` exposes the query interface of `SparqlClient` (`query`, `query_rows`, `query_stream`),
+so it can be passed as the `client` of `kg.query.query_kg_endpoint` and the other query functions, or installed
+as the default client with `kg.sparql_client.set_default_client`. The existing query templates run in-process,
+without HTTP or JSON encoding; `query_rows` reads the solutions directly into tuples.
+
+`pyoxigraph` is an optional dependency: `pip install pyoxigraph`.
+
+Usage (from `src`):
+    python -m kg.local_store load --store_dir <store_dir> --ttl_paths <slice.ttl>
+    python -m kg.local_store query --store_dir <store_dir> --query "SELECT * WHERE { ?s ?p ?o } LIMIT 10"
+"""
+############################################################################################################
+# Importing necessary libraries
+import os
+import json
+import gzip
+import time
+import argparse
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import pyoxigraph
+except ImportError:
+    pyoxigraph = None
+
+from kg.constants import LOCAL_STORE_DIR
+from kg.sparql_client import SparqlQueryError
+from kg.sparql_formats import get_accept_header
+from kg.sparql_metrics import SparqlMetrics, get_default_metrics
+
+XSD_STRING = "http://www.w3.org/2001/XMLSchema#string"
+
+############################################################################################################
+# Functions
+
+def _require_pyoxigraph() -> None:
+    if pyoxigraph is None:
+        raise ImportError("The local SPARQL store requires pyoxigraph: pip install pyoxigraph")
+
+def term_to_binding(term) -> Optional[dict]:
+    """
+    Convert an Oxigraph term to its SPARQL JSON binding, e.g. {"type": "uri", "value": "http://..."}.
+
+    Parameters:
+    ----------
+    term: pyoxigraph.NamedNode, pyoxigraph.BlankNode or pyoxigraph.Literal
+        The term. None for an unbound variable.
+
+    Returns:
+    ----------
+    binding: dict
+        The binding, or None for an unbound variable
+    """
+    if term is None:
+        return None
+    if isinstance(term, pyoxigraph.NamedNode):
+        return {"type": "uri", "value": term.value}
+    if isinstance(term, pyoxigraph.BlankNode):
+        return {"type": "bnode", "value": term.value}
+    binding = {"type": "literal", "value": term.value}
+    if term.language:
+        binding["xml:lang"] = term.language
+    elif term.datatype is not None and term.datatype.value != XSD_STRING:
+        binding["datatype"] = term.datatype.value
+    return binding
+
+############################################################################################################
+# Classes
+
+class LocalSparqlStore:
+    """
+    Embedded on-disk RDF store answering SPARQL queries in-process, with the query interface of `SparqlClient`.
+    Queries can run concurrently from several threads.
+    """
+    def __init__(self, store_dir: str = LOCAL_STORE_DIR, *, read_only: bool = False,
+        metrics: SparqlMetrics = None):
+        """
+        Open (or create) the store.
+
+        Parameters:
+        ----------
+        store_dir: str
+            The directory of the store
+
+        read_only: bool
+            Whether to open the store read-only, which lets several processes share it
+
+        metrics: SparqlMetrics
+            The metrics to record the queries in. Defaults to the shared metrics.
+        """
+        _require_pyoxigraph()
+        self.store_dir = store_dir
+        # Identifies the store like the endpoint of a SparqlClient, e.g. for the limits of the I/O scheduler
+        self.endpoint_url = f"file://{os.path.abspath(store_dir)}"
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+        if read_only:
+            self._store = pyoxigraph.Store.read_only(store_dir)
+        else:
+            os.makedirs(store_dir, exist_ok=True)
+            self._store = pyoxigraph.Store(store_dir)
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    ########################################################################################################
+    # Loading
+
+    def load(self, ttl_paths: List[str], *, optimize: bool = True) -> int:
+        """
+        Bulk-load Turtle files (optionally gzip-compressed) into the store.
+
+        Parameters:
+        ----------
+        ttl_paths: List[str]
+            The Turtle files, e.g. a YAGO slice
+
+        optimize: bool
+            Whether to compact the store after loading, which speeds up the queries
+
+        Returns:
+        ----------
+        num_triples: int
+            The number of triples in the store
+        """
+        for ttl_path in ttl_paths:
+            start = time.perf_counter()
+            if ttl_path.endswith(".gz"):
+                with gzip.open(ttl_path, "rb") as f:
+                    self._bulk_load(input=f)
+            else:
+                self._bulk_load(path=ttl_path)
+            print(f"Loaded {ttl_path} in {time.perf_counter() - start:.1f}s")
+        if optimize:
+            self._store.optimize()
+        return len(self._store)
+
+    def _bulk_load(self, *, input=None, path: str = None) -> None:
+        rdf_format = getattr(pyoxigraph, "RdfFormat", None)
+        if rdf_format is not None:
+            # pyoxigraph >= 0.4
+            self._store.bulk_load(input=input, path=path, format=rdf_format.TURTLE)
+        else:
+            self._store.bulk_load(input if input is not None else path, "text/turtle")
+
+    ########################################################################################################
+    # Queries
+
+    def _solutions(self, query_sparql: str):
+        """
+        Run a query and return its raw result, raising a SparqlQueryError if it fails.
+        """
+        try:
+            return self._store.query(query_sparql)
+        except (SyntaxError, ValueError, OSError) as e:
+            raise SparqlQueryError(f"Error querying the local SPARQL store: {e}") from e
+
+    def _run(self, query_sparql: str, template: str, read_result):
+        """
+        Run a query, read its result with `read_result(result)` and record the query in the metrics.
+        """
+        start = time.perf_counter()
+        try:
+            result = read_result(self._solutions(query_sparql))
+        except Exception as e:
+            self.metrics.record(template, latency=time.perf_counter() - start, error=e)
+            raise
+        return result, time.perf_counter() - start
+
+    @staticmethod
+    def _is_boolean(result) -> bool:
+        # pyoxigraph < 0.4 returns a bool, later versions a QueryBoolean
+        return isinstance(result, bool) or type(result).__name__ == "QueryBoolean"
+
+    def query(self, query_sparql: str, *, endpoint_url: str = None, template: str = None) -> dict:
+        """
+        Run a SELECT or ASK query and return the result as decoded SPARQL JSON, like `SparqlClient.query`.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            Ignored; accepted for compatibility with `SparqlClient`
+
+        template: str
+            The template the query was built from, recorded in the metrics (see `kg.sparql_metrics`)
+
+        Returns:
+        ----------
+        response_json: dict
+            The SPARQL JSON result
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If the query is invalid, or is not a SELECT or ASK query
+        """
+        def read_result(result) -> dict:
+            if self._is_boolean(result):
+                return {"head": {}, "boolean": bool(result)}
+            if not hasattr(result, "variables"):
+                raise SparqlQueryError("The local SPARQL store only answers SELECT and ASK queries")
+            variables = [variable.value for variable in result.variables]
+            bindings = []
+            for solution in result:
+                binding = {}
+                for position, variable in enumerate(variables):
+                    term = term_to_binding(solution[position])
+                    if term is not None:
+                        binding[variable] = term
+                bindings.append(binding)
+            return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+        response_json, latency = self._run(query_sparql, template, read_result)
+        self.metrics.record(template, latency=latency,
+            rows=len(response_json["results"]["bindings"]) if "results" in response_json else None)
+        return response_json
+
+    def query_rows(self, query_sparql: str, *, endpoint_url: str = None, result_format: str = "tsv",
+        timeout: float = None, template: str = None) -> Tuple[List[str], List[tuple]]:
+        """
+        Run a SELECT query and return its variables and rows of values, like `SparqlClient.query_rows`.
+        The solutions are read directly into tuples, whatever the result format.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            Ignored; accepted for compatibility with `SparqlClient`
+
+        result_format: str
+            One of "json", "tsv" or "csv". Validated, but it does not change the result.
+
+        timeout: float
+            Ignored; the query runs in-process
+
+        template: str
+            The template the query was built from, recorded in the metrics
+
+        Returns:
+        ----------
+        variables: List[str]
+            The variables of the result
+
+        rows: List[tuple]
+            One tuple of values per solution, with None for unbound values
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If the query is invalid, or is not a SELECT query
+        """
+        get_accept_header(result_format)
+
+        def read_result(result) -> tuple:
+            if not hasattr(result, "variables"):
+                raise SparqlQueryError("query_rows only answers SELECT queries")
+            variables = [variable.value for variable in result.variables]
+            positions = range(len(variables))
+            rows = []
+            for solution in result:
+                rows.append(tuple(term.value if term is not None else None
+                    for term in (solution[position] for position in positions)))
+            return variables, rows
+
+        (variables, rows), latency = self._run(query_sparql, template, read_result)
+        self.metrics.record(template, latency=latency, rows=len(rows))
+        return variables, rows
+
+    def query_stream(self, query_sparql: str, *, endpoint_url: str = None, accept: str = None,
+        chunk_size: int = 64 * 1024, timeout: float = None, template: str = None) -> Iterator[bytes]:
+        """
+        Run a query and yield its SPARQL JSON result in chunks, like `SparqlClient.query_stream`,
+        so that the streaming decoders of `kg.sparql_stream` work unchanged. Prefer `query_rows`,
+        which skips the JSON encoding.
+
+        Returns:
+        ----------
+        chunks: Iterator[bytes]
+            The SPARQL JSON result, in chunks
+        """
+        body = json.dumps(self.query(query_sparql, template=template)).encode("utf-8")
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    def ensure_pool_size(self, pool_size: int) -> None:
+        """No connections to pool; accepted for compatibility with `SparqlClient`."""
+
+    def close(self) -> None:
+        """Flush the pending writes of the store."""
+        if hasattr(self._store, "flush"):
+            self._store.flush()
+
+############################################################################################################
+# Functions
+
+def query_local_endpoint(store: LocalSparqlStore, query_sparql: str, *, template: str = None) -> dict:
+    """
+    Local counterpart of `kg.query.query_kg_endpoint`.
+
+    Parameters:
+    ----------
+    store: LocalSparqlStore
+        The store to query
+
+    query_sparql: str
+        The SPARQL query
+
+    template: str
+        The template the query was built from, recorded in the metrics
+
+    Returns:
+    ----------
+    response: dict
+        The SPARQL JSON result, or None if the query failed
+    """
+    try:
+        return store.query(query_sparql, template=template)
+    except Exception as e:
+        print(f"Error querying the local SPARQL store: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and query the embedded local SPARQL store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    load_parser = subparsers.add_parser("load", help="Bulk-load Turtle files into the store.")
+    load_parser.add_argument("--store_dir", type=str, default=LOCAL_STORE_DIR, help="Directory of the store.")
+    load_parser.add_argument("--ttl_paths", type=str, nargs="+", required=True,
+        help="Turtle files (optionally .gz) to load, e.g. a YAGO slice.")
+    load_parser.add_argument("--no_optimize", action="store_true", help="Skip the compaction after loading.")
+    query_parser = subparsers.add_parser("query", help="Run a SPARQL query against the store.")
+    query_parser.add_argument("--store_dir", type=str, default=LOCAL_STORE_DIR, help="Directory of the store.")
+    query_parser.add_argument("--query", type=str, required=True, help="The SPARQL query.")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        store = LocalSparqlStore(args.store_dir)
+        num_triples = store.load(args.ttl_paths, optimize=not args.no_optimize)
+        store.close()
+        print(f"The store in {args.store_dir} holds {num_triples} triples")
+    else:
+        store = LocalSparqlStore(args.store_dir, read_only=True)
+        print(json.dumps(store.query(args.query), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+This module contains the paged retrieval of large SPARQL results.
+The neighbor queries cap their results with a LIMIT, which silently truncates the neighbors of hub entities
+(e.g. countries). When a result hits its LIMIT, the rows are counted, and the result is fetched as
+deterministically ordered pages (ORDER BY ... LIMIT ... OFFSET ...), in parallel on the shared I/O scheduler
+(see kg/io_scheduler.py).
+The total number of rows fetched per result is capped, so that completeness costs a bounded number of
+parallel requests instead of one enormous serial query.
+"""
+############################################################################################################
+# Importing necessary libraries
+from typing import Callable, List, Tuple
+
+from kg.sparql_client import SparqlClient, get_default_client
+from kg.io_scheduler import get_default_io_scheduler
+from kg.constants import PAGED_PAGE_SIZE, PAGED_MAX_TRIPLES_PER_ENTITY, PAGED_MAX_WORKERS
+
+############################################################################################################
+# Functions
+
+def count_rows(count_query: str, *, client: SparqlClient = None, endpoint_url: str = None,
+    template: str = None) -> int:
+    """
+    Run a query returning the number of rows of a result in ?count, and return the count.
+
+    Parameters:
+    ----------
+    count_query: str
+        The count query
+
+    client: SparqlClient
+        The client to send the query with. Defaults to the shared client.
+
+    endpoint_url: str
+        The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+    template: str
+        The template the query was built from, recorded in the metrics
+
+    Returns:
+    ----------
+    count: int
+        The number of rows
+
+    Raises:
+    ----------
+    SparqlQueryError
+        If the query fails
+    """
+    client = client if client is not None else get_default_client()
+    variables, rows = client.query_rows(count_query, endpoint_url=endpoint_url, template=template)
+    return int(rows[0][variables.index("count")]) if rows else 0
+
+def fetch_pages(build_page_query: Callable[[int, int], str], total_rows: int, *,
+    page_size: int = PAGED_PAGE_SIZE, max_rows: int = PAGED_MAX_TRIPLES_PER_ENTITY,
+    max_workers: int = PAGED_MAX_WORKERS, client: SparqlClient = None, endpoint_url: str = None,
+    template: str = None, result_format: str = "tsv") -> Tuple[List[str], List[tuple], bool]:
+    """
+    Fetch a result as ordered pages, in parallel, up to `max_rows` rows.
+
+    Parameters:
+    ----------
+    build_page_query: Callable[[int, int], str]
+        Builds the query of a page from its limit and offset. The query must have a deterministic
+        ORDER BY over all its variables, so that the pages neither overlap nor miss rows.
+
+    total_rows: int
+        The number of rows of the result (see `count_rows`)
+
+    page_size: int
+        The number of rows per page
+
+    max_rows: int
+        The maximum number of rows to fetch. None fetches the whole result.
+
+    max_workers: int
+        The maximum number of pages fetched concurrently, within the endpoint limit of the I/O scheduler.
+        When called from a scheduler task (e.g. a batch of neighbor lookups), the pages take the free endpoint slots,
+        and that task fetches the remaining ones while it waits.
+
+    client: SparqlClient
+        The client to send the queries with. Defaults to the shared client.
+
+    endpoint_url: str
+        The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+    template: str
+        The template the queries were built from, recorded in the metrics
+
+    result_format: str
+        One of "json", "tsv" or "csv"
+
+    Returns:
+    ----------
+    variables: List[str]
+        The variables of the result
+
+    rows: List[tuple]
+        The rows of the pages, in order
+
+    complete: bool
+        False if the result was capped at `max_rows`
+
+    Raises:
+    ----------
+    SparqlQueryError
+        If a page fails
+    """
+    client = client if client is not None else get_default_client()
+    rows_to_fetch = total_rows if max_rows is None else min(total_rows, max_rows)
+    pages = [(offset, min(page_size, rows_to_fetch - offset)) for offset in range(0, rows_to_fetch, page_size)]
+
+    def fetch_page(page: Tuple[int, int]) -> tuple:
+        offset, limit = page
+        return client.query_rows(build_page_query(limit, offset), endpoint_url=endpoint_url,
+            result_format=result_format, template=template)
+
+    variables, rows = [], []
+    scheduler = get_default_io_scheduler()
+    futures = [scheduler.submit(fetch_page, page, endpoint=endpoint_url or client.endpoint_url,
+        caller_limit=max(1, max_workers)) for page in pages]
+    # The futures are in the order of the pages
+    for future in futures:
+        page_variables, page_rows = future.result()
+        variables = page_variables
+        rows.extend(page_rows)
+    return variables, rows, rows_to_fetch == total_rows
@@ -0,0 +1,359 @@
+"""
+This module contains the bidirectional path search between pairs of YAGO entities, e.g. to validate or generate
+multi-hop questions, without pulling whole neighborhoods into networkx.
+A breadth-first search is run from both entities at once. Every round expands the smaller of the two frontiers
+with one batched query, which returns the IRI neighbors of all the frontier entities in both directions, with the
+excluded predicates (see kg/predicate_policy.py) filtered on the server. Once the frontiers meet, the shortest
+predicate paths are assembled from the parents recorded on both sides.
+
+The paths found are those whose every entity is at its shortest distance from the end it was reached from:
+the shortest paths, and the longer paths through the entities where the frontiers met in later rounds.
+The frontier sizes, the queries and the rounds (round trips) are recorded for every search.
+"""
+############################################################################################################
+# Importing necessary libraries
+import time
+import argparse
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+from kg.sparql_client import SparqlClient, SparqlQueryError, get_default_client
+from kg.sparql_metrics import TEMPLATE_PATH_SEARCH
+from kg.query_hints import add_query_hints, use_query_hints
+from kg.io_scheduler import get_default_io_scheduler
+from kg.predicate_policy import PredicatePolicy, get_default_predicate_policy
+from kg.prefix import get_url_from_prefix_and_id
+from kg.constants import PREFIXES, YAGO_ENDPOINT_URL, PATH_SEARCH_MAX_HOPS, PATH_SEARCH_TOP_K, \
+    PATH_SEARCH_BATCH_SIZE, PATH_SEARCH_NEIGHBOR_LIMIT, PATH_SEARCH_MAX_FRONTIER
+
+############################################################################################################
+# Functions
+
+def to_entity_uri(entity: str) -> str:
+    """
+    Get the URI of an entity given as a URI, a `<URI>` term or a prefixed name (e.g. `yago:Paris`).
+    """
+    if entity.startswith("<") and entity.endswith(">"):
+        return entity[1:-1]
+    return get_url_from_prefix_and_id(PREFIXES, entity)
+
+def get_path_frontier_query(entity_uris: List[str], policy: PredicatePolicy = None,
+    neighbor_limit: int = PATH_SEARCH_NEIGHBOR_LIMIT, query_hints: bool = None) -> str:
+    """
+    Generate the query expanding a frontier: the IRI neighbors of the entities, in both directions.
+
+    Parameters:
+    ----------
+    entity_uris: List[str]
+        The URIs of the frontier entities
+
+    policy: PredicatePolicy
+        The predicate-exclusion policy, applied on the server. Defaults to the shared policy.
+
+    neighbor_limit: int
+        The maximum number of neighbors per entity, on average. The LIMIT applies to the whole batch.
+
+    query_hints: bool
+        Whether to add the Blazegraph query hints. Defaults to `QUERY_HINTS_ENABLED`.
+
+    Returns:
+    ----------
+    query: str
+        The query, whose rows are (?entity, ?pred, ?neighbor, ?dir), with ?dir "out" for the triples
+        (?entity, ?pred, ?neighbor) and "in" for the triples (?neighbor, ?pred, ?entity)
+    """
+    policy = policy if policy is not None else get_default_predicate_policy()
+    values = " ".join(f"<{uri}>" for uri in entity_uris)
+    query = f"""
+    SELECT DISTINCT ?entity ?pred ?neighbor ?dir WHERE {{
+        VALUES ?entity {{ {values} }}
+        {{
+            ?entity ?pred ?neighbor .
+            BIND ("out" AS ?dir)
+        }}
+        UNION
+        {{
+            ?neighbor ?pred ?entity .
+            BIND ("in" AS ?dir)
+        }}
+        FILTER (isIRI(?neighbor) && ?neighbor != ?entity)
+        {policy.sparql_filter("pred")}
+    }}
+    LIMIT {neighbor_limit * len(entity_uris)}
+    """
+    if use_query_hints(query_hints):
+        query = add_query_hints(query, TEMPLATE_PATH_SEARCH)
+    return query
+
+############################################################################################################
+# Classes
+
+class _SearchSide:
+    """
+    The breadth-first search from one end: the distance of every reached entity, the parents of every entity
+    (the entities and triples it was reached from at its distance), and the current frontier.
+    """
+    def __init__(self, root: str):
+        self.distances: Dict[str, int] = {root: 0}
+        self.parents: Dict[str, List[Tuple[str, tuple]]] = {root: []}
+        self.frontier: List[str] = [root]
+        self.depth = 0
+
+    def paths(self, entity: str) -> Iterator[List[tuple]]:
+        """
+        The shortest paths from the root to an entity, as lists of triples starting from the root.
+        """
+        if not self.parents[entity]:
+            yield []
+            return
+        for parent, triple in self.parents[entity]:
+            for path in self.paths(parent):
+                yield path + [triple]
+
+class PathSearch:
+    """
+    Bidirectional breadth-first path search over the SPARQL access layer. Thread-safe: the state of a search
+    is local to `find_paths`.
+    """
+    def __init__(self, client: SparqlClient = None, *, endpoint_url: str = None, policy: PredicatePolicy = None,
+        batch_size: int = PATH_SEARCH_BATCH_SIZE, neighbor_limit: int = PATH_SEARCH_NEIGHBOR_LIMIT,
+        max_frontier: int = PATH_SEARCH_MAX_FRONTIER, query_hints: bool = None):
+        """
+        Parameters:
+        ----------
+        client: SparqlClient
+            The client to send the queries with. Defaults to the shared client.
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to `YAGO_ENDPOINT_URL` with the shared client,
+            to the client's endpoint URL otherwise.
+
+        policy: PredicatePolicy
+            The predicate-exclusion policy. Defaults to the shared policy.
+
+        batch_size: int
+            The maximum number of frontier entities expanded with a single query. A larger frontier is expanded
+            with concurrent queries, still one round trip.
+
+        neighbor_limit: int
+            The maximum number of neighbors per frontier entity, on average
+
+        max_frontier: int
+            The maximum number of entities of a frontier. The entities beyond it are not expanded.
+
+        query_hints: bool
+            Whether to add the Blazegraph query hints. Defaults to `QUERY_HINTS_ENABLED`.
+        """
+        self._client = client
+        self.endpoint_url = endpoint_url or (client.endpoint_url if client is not None else YAGO_ENDPOINT_URL)
+        self.policy = policy if policy is not None else get_default_predicate_policy()
+        self.batch_size = batch_size
+        self.neighbor_limit = neighbor_limit
+        self.max_frontier = max_frontier
+        self.query_hints = query_hints
+
+    @property
+    def client(self) -> SparqlClient:
+        return self._client if self._client is not None else get_default_client()
+
+    def _expand_batch(self, entity_uris: List[str]) -> Tuple[List[tuple], bool]:
+        """
+        Get the (entity, triple, neighbor) edges of a batch of frontier entities,
+        and whether the query hit its LIMIT.
+        """
+        query = get_path_frontier_query(entity_uris, self.policy, self.neighbor_limit, self.query_hints)
+        variables, rows = self.client.query_rows(query, endpoint_url=self.endpoint_url,
+            template=TEMPLATE_PATH_SEARCH)
+        entity, pred, neighbor, direction = (variables.index(name) for name in ("entity", "pred", "neighbor", "dir"))
+        edges = []
+        for row in rows:
+            if row[direction] == "out":
+                triple = (row[entity], row[pred], row[neighbor])
+            else:
+                triple = (row[neighbor], row[pred], row[entity])
+            edges.append((row[entity], triple, row[neighbor]))
+        return edges, len(rows) >= self.neighbor_limit * len(entity_uris)
+
+    def _expand(self, frontier: List[str], stats: dict) -> List[tuple]:
+        """
+        Expand a frontier with one round of batched queries, run concurrently on the shared I/O scheduler.
+        """
+        batches = [frontier[i:i + self.batch_size] for i in range(0, len(frontier), self.batch_size)]
+        stats["rounds"] += 1
+        stats["queries"] += len(batches)
+        if len(batches) == 1:
+            results = [self._expand_batch(batches[0])]
+        else:
+            scheduler = get_default_io_scheduler()
+            futures = [scheduler.submit(self._expand_batch, batch, endpoint=self.endpoint_url) for batch in batches]
+            results = [future.result() for future in futures]
+        edges = []
+        for batch_edges, truncated in results:
+            edges.extend(batch_edges)
+            stats["truncated"] |= truncated
+        return edges
+
+    def find_paths(self, source: str, target: str, *, k: int = PATH_SEARCH_TOP_K,
+        max_hops: int = PATH_SEARCH_MAX_HOPS) -> dict:
+        """
+        Find the top-k shortest predicate paths between two entities.
+
+        Parameters:
+        ----------
+        source: str
+            The source entity, as a URI or a prefixed name
+
+        target: str
+            The target entity, as a URI or a prefixed name
+
+        k: int
+            The maximum number of paths returned
+
+        max_hops: int
+            The maximum number of triples of a path
+
+        Returns:
+        ----------
+        result: dict
+            The source and target URIs, the paths, shortest first, each with its number of hops, entities,
+            predicates and triples (in their KG direction), and the statistics of the search: the rounds,
+            the queries, the size of the frontier expanded in every round (and its side), whether a frontier
+            or a query was truncated, why the search stopped and the elapsed time
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If a query fails
+        """
+        start = time.perf_counter()
+        source, target = to_entity_uri(source), to_entity_uri(target)
+        stats = {"rounds": 0, "queries": 0, "frontier_sizes": [], "truncated": False, "stop_reason": None}
+        forward, backward = _SearchSide(source), _SearchSide(target)
+        paths: Dict[tuple, dict] = {}
+
+        if source == target:
+            paths[()] = self._make_path(source, [])
+            stats["stop_reason"] = "same_entity"
+        while stats["stop_reason"] is None:
+            if forward.depth + backward.depth >= max_hops:
+                stats["stop_reason"] = "max_hops"
+                break
+            if not forward.frontier or not backward.frontier:
+                stats["stop_reason"] = "exhausted"
+                break
+            # Expand the smaller frontier, which keeps the number of entities expanded (and rows fetched) low
+            side, other = (forward, backward) if len(forward.frontier) <= len(backward.frontier) \
+                else (backward, forward)
+            stats["frontier_sizes"].append(("forward" if side is forward else "backward", len(side.frontier)))
+            edges = self._expand(side.frontier, stats)
+
+            depth = side.depth + 1
+            next_frontier = []
+            for entity, triple, neighbor in edges:
+                distance = side.distances.get(neighbor)
+                if distance is None:
+                    side.distances[neighbor] = depth
+                    side.parents[neighbor] = [(entity, triple)]
+                    next_frontier.append(neighbor)
+                elif distance == depth and (entity, triple) not in side.parents[neighbor]:
+                    side.parents[neighbor].append((entity, triple))
+            side.depth = depth
+            # The entities cut from the frontier are not expanded, but the paths through them are kept
+            if len(next_frontier) > self.max_frontier:
+                stats["truncated"] = True
+            side.frontier = next_frontier[:self.max_frontier]
+
+            for entity in next_frontier:
+                if entity in other.distances:
+                    self._add_paths(paths, entity, forward, backward, k)
+            if paths:
+                stats["stop_reason"] = "found" if len(paths) >= k else None
+
+        stats["elapsed"] = time.perf_counter() - start
+        ranked = sorted(paths.values(), key=lambda path: path["hops"])[:k]
+        return {"source": source, "target": target, "paths": ranked, "stats": stats}
+
+    def _add_paths(self, paths: Dict[tuple, dict], entity: str, forward: _SearchSide, backward: _SearchSide,
+        k: int) -> None:
+        """
+        Add the paths through an entity reached from both ends, up to k of them.
+        """
+        source = next(iter(forward.distances))
+        for head in islice(forward.paths(entity), k):
+            for tail in islice(backward.paths(entity), k):
+                triples = head + tail[::-1]
+                path = self._make_path(source, triples)
+                # Only simple paths: an entity cannot appear twice
+                if path is not None and tuple(triples) not in paths:
+                    paths[tuple(triples)] = path
+
+    @staticmethod
+    def _make_path(source: str, triples: List[tuple]) -> dict:
+        """
+        Describe a path from `source`, or None if it is not simple.
+        """
+        entities = [source]
+        for sub, _, obj in triples:
+            entities.append(obj if sub == entities[-1] else sub)
+        if len(set(entities)) < len(entities):
+            return None
+        return {"hops": len(triples), "entities": entities, "predicates": [triple[1] for triple in triples],
+            "triples": triples}
+
+    def find_paths_many(self, pairs: List[Tuple[str, str]], *, k: int = PATH_SEARCH_TOP_K,
+        max_hops: int = PATH_SEARCH_MAX_HOPS, max_workers_limit: int = None) -> List[dict]:
+        """
+        Find the paths of many entity pairs concurrently, on the shared I/O scheduler.
+
+        Parameters:
+        ----------
+        pairs: List[Tuple[str, str]]
+            The (source, target) pairs
+
+        k: int
+            The maximum number of paths returned per pair
+
+        max_hops: int
+            The maximum number of triples of a path
+
+        max_workers_limit: int
+            The maximum number of searches running at once. None only applies the endpoint limit.
+
+        Returns:
+        ----------
+        results: List[dict]
+            The result of every pair (see `find_paths`), in order. A failed search has an "error" instead of paths.
+        """
+        scheduler = get_default_io_scheduler()
+        self.client.ensure_pool_size(scheduler.endpoint_limit(self.endpoint_url))
+        futures = [scheduler.submit(self.find_paths, source, target, k=k, max_hops=max_hops,
+            endpoint=self.endpoint_url, caller_limit=max_workers_limit) for source, target in pairs]
+        results = []
+        for (source, target), future in zip(pairs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"source": to_entity_uri(source), "target": to_entity_uri(target), "error": str(e)})
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the shortest predicate paths between two YAGO entities.")
+    parser.add_argument("source", type=str, help="The source entity, as a URI or a prefixed name.")
+    parser.add_argument("target", type=str, help="The target entity, as a URI or a prefixed name.")
+    parser.add_argument("--k", type=int, default=PATH_SEARCH_TOP_K, help="Maximum number of paths.")
+    parser.add_argument("--max_hops", type=int, default=PATH_SEARCH_MAX_HOPS, help="Maximum number of hops of a path.")
+    parser.add_argument("--endpoint", type=str, default=None, help="SPARQL endpoint URL.")
+    args = parser.parse_args()
+
+    client = SparqlClient(args.endpoint) if args.endpoint else None
+    try:
+        result = PathSearch(client).find_paths(args.source, args.target, k=args.k, max_hops=args.max_hops)
+    except SparqlQueryError as e:
+        print(f"Error searching the paths: {e}")
+        return
+    for path in result["paths"]:
+        print(f"{path['hops']} hops: " + " ".join(f"{sub} {pred} {obj} ." for sub, pred, obj in path["triples"]))
+    print(f"Stats: {result['stats']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+This module contains the verification of the supporting paths of generated QA pairs against the KG.
+`gen_qa_prompt` asks the LLM for a `supporting_path` of (subject, predicate, object) triples for every answer,
+written with the pruned labels of the subgraph (e.g. `Paris`, `birthPlace`). Before any annotator LLM is paid for,
+the paths are checked:
+1. every label is normalized back to its URI with the triple index of the subgraph (like `get_full_uri`, trying the
+   label as is, then encoded with `encode_to_underscored_unicode`); a label that matches nothing is hallucinated,
+2. the triples of a whole dataset split are checked against the KG with batched VALUES queries, run concurrently
+   on the shared I/O scheduler. The results are memoized per triple, so that a triple shared by many QA pairs
+   is checked once, and the triples of the subgraph, fetched from the KG, are not checked again,
+3. the triples must form a chain, and the answer must be one of its entities.
+"""
+############################################################################################################
+# Importing necessary libraries
+import ast
+import json
+import argparse
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from kg.sparql_client import SparqlClient, SparqlQueryError, get_default_client
+from kg.sparql_metrics import TEMPLATE_TRIPLE_CHECK
+from kg.io_scheduler import get_default_io_scheduler
+from kg.path_search import to_entity_uri
+from kg.subgraph_functions import encode_to_underscored_unicode
+from kg.constants import YAGO_ENDPOINT_URL, PATH_VERIFY_BATCH_SIZE
+
+# Reasons a supporting path is rejected
+REJECT_EMPTY_PATH = "empty_path"
+REJECT_UNRESOLVED_LABEL = "unresolved_label"
+REJECT_NOT_IN_KG = "not_in_kg"
+REJECT_DISCONNECTED = "disconnected"
+REJECT_ANSWER_NOT_IN_PATH = "answer_not_in_path"
+
+############################################################################################################
+# Functions
+
+def parse_subgraph(subgraph) -> List[tuple]:
+    """
+    Get the (subject, predicate, object) triples of a subgraph given as a list of lists or tuples,
+    a list of {'subject', 'predicate', 'object'} dicts, or the string of such a list (JSON or Python literal).
+    """
+    if isinstance(subgraph, str):
+        try:
+            subgraph = json.loads(subgraph)
+        except json.JSONDecodeError:
+            subgraph = ast.literal_eval(subgraph)
+    return [(triple["subject"], triple["predicate"], triple["object"]) if isinstance(triple, dict)
+        else tuple(triple[:3]) for triple in subgraph or []]
+
+def _prune(term: str) -> str:
+    return term.rsplit('/', 1)[-1]
+
+def get_sparql_term(term: str) -> Optional[str]:
+    """
+    The SPARQL term of a URI, or None for a literal, which is only checked against the subgraph.
+    """
+    if term.startswith('http://') or term.startswith('https://'):
+        return f"<{term}>"
+    return None
+
+def get_triple_check_query(triples: List[tuple]) -> str:
+    """
+    Generate the query returning which of the (subject, predicate, object) URI triples are in the KG.
+    """
+    values = "\n        ".join(f"({get_sparql_term(sub)} {get_sparql_term(pred)} {get_sparql_term(obj)})"
+        for sub, pred, obj in triples)
+    return f"""
+    SELECT ?sub ?pred ?obj WHERE {{
+        VALUES (?sub ?pred ?obj) {{
+        {values}
+        }}
+        ?sub ?pred ?obj .
+    }}
+    """
+
+############################################################################################################
+# Classes
+
+class SubgraphTripleIndex:
+    """
+    The triples of a subgraph, and the lookup from the labels of its entities and predicates (full or pruned)
+    to their URIs.
+    """
+    def __init__(self, subgraph):
+        """
+        Parameters:
+        ----------
+        subgraph: list or str
+            The triples of the subgraph (see `parse_subgraph`)
+        """
+        self.triples = set(parse_subgraph(subgraph))
+        self.entities: Dict[str, str] = {}
+        self.predicates: Dict[str, str] = {}
+        for sub, pred, obj in self.triples:
+            for term, index in ((sub, self.entities), (pred, self.predicates), (obj, self.entities)):
+                index.setdefault(term, term)
+                index.setdefault(_prune(term), term)
+
+    def resolve(self, label, predicate: bool = False) -> Optional[str]:
+        """
+        Get the URI (or literal) of a label of the subgraph.
+
+        Parameters:
+        ----------
+        label: str
+            The label written by the LLM: a URI, a prefixed name or a pruned label
+
+        predicate: bool
+            Whether the label is a predicate
+
+        Returns:
+        ----------
+        term: Optional[str]
+            The term, or None if the label is not in the subgraph (and is not a URI)
+        """
+        if not isinstance(label, str) or not label.strip():
+            return None
+        label = label.strip()
+        index = self.predicates if predicate else self.entities
+        uri = to_entity_uri(label)
+        for candidate in (label, uri, encode_to_underscored_unicode(label)):
+            if candidate in index:
+                return index[candidate]
+        # A URI outside the subgraph is left for the KG to confirm or reject
+        return uri if get_sparql_term(uri) is not None else None
+
+class PathVerifier:
+    """
+    Verifier of the supporting paths of generated QA pairs. Thread-safe: the memo of checked triples is shared.
+    """
+    def __init__(self, client: SparqlClient = None, *, endpoint_url: str = None,
+        batch_size: int = PATH_VERIFY_BATCH_SIZE, allow_reversed: bool = True, max_workers_limit: int = None):
+        """
+        Parameters:
+        ----------
+        client: SparqlClient
+            The client to send the queries with. Defaults to the shared client.
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to `YAGO_ENDPOINT_URL` with the shared client,
+            to the client's endpoint URL otherwise.
+
+        batch_size: int
+            The number of triples checked with a single query
+
+        allow_reversed: bool
+            Whether a triple whose subject and object are swapped is accepted (in its KG direction)
+
+        max_workers_limit: int
+            The maximum number of queries running at once. None only applies the endpoint limit.
+        """
+        self._client = client
+        self.endpoint_url = endpoint_url or (client.endpoint_url if client is not None else YAGO_ENDPOINT_URL)
+        self.batch_size = batch_size
+        self.allow_reversed = allow_reversed
+        self.max_workers_limit = max_workers_limit
+        self._memo: Dict[tuple, bool] = {}
+        self._memo_lock = threading.Lock()
+        self.stats = {"triples_checked": 0, "queries": 0, "memo_hits": 0}
+
+    @property
+    def client(self) -> SparqlClient:
+        return self._client if self._client is not None else get_default_client()
+
+    ########################################################################################################
+    # KG checks
+
+    def _check_batch(self, triples: List[tuple]) -> set:
+        variables, rows = self.client.query_rows(get_triple_check_query(triples), endpoint_url=self.endpoint_url,
+            template=TEMPLATE_TRIPLE_CHECK)
+        positions = [variables.index(name) for name in ("sub", "pred", "obj")]
+        return {tuple(row[position] for position in positions) for row in rows}
+
+    def check_triples(self, triples: Iterable[tuple]) -> Dict[tuple, bool]:
+        """
+        Check which URI triples are in the KG, with batched queries for the triples not memoized yet.
+
+        Parameters:
+        ----------
+        triples: Iterable[tuple]
+            The (subject, predicate, object) URI triples
+
+        Returns:
+        ----------
+        found: Dict[tuple, bool]
+            Whether every triple is in the KG
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If a query fails. The triples of the failed batches are not memoized.
+        """
+        triples = list(dict.fromkeys(triples))
+        with self._memo_lock:
+            found = {triple: self._memo[triple] for triple in triples if triple in self._memo}
+            self.stats["memo_hits"] += len(found)
+        missing = [triple for triple in triples if triple not in found]
+        if not missing:
+            return found
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        scheduler = get_default_io_scheduler()
+        self.client.ensure_pool_size(scheduler.endpoint_limit(self.endpoint_url))
+        futures = [scheduler.submit(self._check_batch, batch, endpoint=self.endpoint_url,
+            caller_limit=self.max_workers_limit) for batch in batches]
+        checked = {}
+        error = None
+        # Wait for every batch, so that the successful ones are memoized even if another one failed
+        for batch, future in zip(batches, futures):
+            try:
+                in_kg = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            checked.update({triple: triple in in_kg for triple in batch})
+        with self._memo_lock:
+            self._memo.update(checked)
+            self.stats["triples_checked"] += len(checked)
+            self.stats["queries"] += len(batches)
+        if error is not None:
+            raise error
+        found.update(checked)
+        return found
+
+    ########################################################################################################
+    # Verification
+
+    def _normalize(self, qa_pair: dict, index: SubgraphTripleIndex) -> dict:
+        """
+        Normalize the supporting path of a QA pair to URI triples, and list the labels that do not resolve.
+        """
+        path = qa_pair.get("supporting_path") or []
+        normalized, unresolved = [], []
+        for triple in path:
+            if isinstance(triple, dict):
+                labels = (triple.get("subject"), triple.get("predicate"), triple.get("object"))
+            elif isinstance(triple, (list, tuple)) and len(triple) == 3:
+                labels = tuple(triple)
+            else:
+                labels = (None, None, None)
+            terms = (index.resolve(labels[0]), index.resolve(labels[1], predicate=True), index.resolve(labels[2]))
+            unresolved.extend(label for label, term in zip(labels, terms) if term is None)
+            normalized.append(terms)
+        return {"path": normalized, "unresolved": unresolved}
+
+    def _candidates(self, triple: tuple) -> List[tuple]:
+        sub, pred, obj = triple
+        return [triple, (obj, pred, sub)] if self.allow_reversed else [triple]
+
+    def verify_split(self, records: List[Tuple[object, List[dict]]]) -> List[List[dict]]:
+        """
+        Verify the supporting paths of the QA pairs of a whole dataset split.
+        The triples outside the subgraphs are checked against the KG together, in batched queries.
+
+        Parameters:
+        ----------
+        records: List[Tuple[object, List[dict]]]
+            The (subgraph, QA pairs) of every record, with the QA pairs as returned for `gen_qa_prompt`
+
+        Returns:
+        ----------
+        verdicts: List[List[dict]]
+            The verdict of every QA pair of every record: whether its path is valid, the reason it was rejected,
+            its URI triples (in their KG direction), and the labels and triples that were not found
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If a query fails
+        """
+        normalized = []
+        to_check = []
+        for subgraph, qa_pairs in records:
+            index = SubgraphTripleIndex(subgraph)
+            record_paths = [self._normalize(qa_pair, index) for qa_pair in qa_pairs or []]
+            for qa_pair, path in zip(qa_pairs or [], record_paths):
+                path["answer"] = index.resolve(qa_pair.get("answer"))
+                for triple in path["path"]:
+                    if None in triple:
+                        continue
+                    candidates = self._candidates(triple)
+                    if any(candidate in index.triples for candidate in candidates):
+                        continue
+                    to_check.extend(candidate for candidate in candidates
+                        if all(get_sparql_term(term) is not None for term in candidate))
+            normalized.append((index, record_paths))
+        in_kg = self.check_triples(to_check)
+
+        verdicts = []
+        for index, record_paths in normalized:
+            verdicts.append([self._verdict(path, index, in_kg) for path in record_paths])
+        return verdicts
+
+    def _verdict(self, path: dict, index: SubgraphTripleIndex, in_kg: Dict[tuple, bool]) -> dict:
+        verdict = {"valid": False, "reason": None, "triples": [], "unresolved": path["unresolved"], "missing": []}
+        if not path["path"]:
+            verdict["reason"] = REJECT_EMPTY_PATH
+            return verdict
+        if path["unresolved"]:
+            verdict["reason"] = REJECT_UNRESOLVED_LABEL
+            return verdict
+        for triple in path["path"]:
+            found = next((candidate for candidate in self._candidates(triple)
+                if candidate in index.triples or in_kg.get(candidate)), None)
+            if found is None:
+                verdict["missing"].append(triple)
+            else:
+                verdict["triples"].append(found)
+        if verdict["missing"]:
+            verdict["reason"] = REJECT_NOT_IN_KG
+            return verdict
+        # Every triple must share an entity with the previous one
+        for previous, triple in zip(verdict["triples"], verdict["triples"][1:]):
+            if not {previous[0], previous[2]} & {triple[0], triple[2]}:
+                verdict["reason"] = REJECT_DISCONNECTED
+                return verdict
+        if path["answer"] not in {term for triple in verdict["triples"] for term in (triple[0], triple[2])}:
+            verdict["reason"] = REJECT_ANSWER_NOT_IN_PATH
+            return verdict
+        verdict["valid"] = True
+        return verdict
+
+    def verify(self, subgraph, qa_pairs: List[dict]) -> List[dict]:
+        """
+        Verify the supporting paths of the QA pairs of a single subgraph (see `verify_split`).
+        """
+        return self.verify_split([(subgraph, qa_pairs)])[0]
+
+def filter_verified_qa_pairs(qa_pairs: List[dict], verdicts: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """
+    Split QA pairs into the verified ones, with their URI triples in `supporting_path_uri`,
+    and the rejected ones, with the reason in `rejection_reason`.
+    """
+    verified, rejected = [], []
+    for qa_pair, verdict in zip(qa_pairs, verdicts):
+        if verdict["valid"]:
+            verified.append({**qa_pair, "supporting_path_uri": [list(triple) for triple in verdict["triples"]]})
+        else:
+            rejected.append({**qa_pair, "rejection_reason": verdict["reason"]})
+    return verified, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the supporting paths of generated QA pairs against the KG.")
+    parser.add_argument("--input", type=str, required=True,
+        help="JSON lines file with a `subgraph` and the `qa_pairs` generated for it per line.")
+    parser.add_argument("--output", type=str, required=True,
+        help="JSON lines file to write the records to, with the verified `qa_pairs` and the `rejected_qa_pairs`.")
+    parser.add_argument("--endpoint", type=str, default=None, help="SPARQL endpoint URL.")
+    parser.add_argument("--strict_direction", action="store_true",
+        help="Reject the triples whose subject and object are swapped.")
+    args = parser.parse_args()
+
+    with open(args.input, "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    client = SparqlClient(args.endpoint) if args.endpoint else None
+    verifier = PathVerifier(client, allow_reversed=not args.strict_direction)
+    try:
+        verdicts = verifier.verify_split([(record["subgraph"], record.get("qa_pairs")) for record in records])
+    except SparqlQueryError as e:
+        print(f"Error checking the supporting paths against the KG: {e}")
+        return
+
+    num_verified = num_rejected = 0
+    with open(args.output, "w") as f:
+        for record, record_verdicts in zip(records, verdicts):
+            verified, rejected = filter_verified_qa_pairs(record.get("qa_pairs") or [], record_verdicts)
+            num_verified += len(verified)
+            num_rejected += len(rejected)
+            f.write(json.dumps({**record, "qa_pairs": verified, "rejected_qa_pairs": rejected}) + "\n")
+    print(f"Verified {num_verified} QA pairs, rejected {num_rejected}. Stats: {verifier.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+This module contains the predicate-exclusion policy shared by the query templates and the client-side filters.
+The policy combines exact predicates and case-insensitive substrings (like `subgraph_functions.filter_triples_by_predicates`).
+It is compiled once against the known YAGO predicates (`db/info/properties_with_counts.txt`) into:
+- a server-side FILTER (`?pred NOT IN (...)`) for every template that binds a predicate variable, so that
+  the excluded triples never cross the wire,
+- a precomputed allow-set of predicate codes for a `URIDictionary`, so that `TripleFrame`s are filtered with a
+  single `np.isin`. Predicates outside the known ones are tested against the policy once, on first sight.
+"""
+############################################################################################################
+# Importing necessary libraries
+import ast
+import threading
+import weakref
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from kg.constants import PREFIXES, YAGO_PREFIXES_PATH, YAGO_PROPERTIES_PATH, EXCLUDED_PREDICATES, \
+    EXCLUDED_PREDICATE_SUBSTRINGS, RANDOM_WALK_EXCLUDED_PREDICATES
+from kg.prefix import get_prefixes, get_url_from_prefix_and_id
+from kg.triple_frame import TripleFrame, URIDictionary, get_default_uri_dictionary
+
+############################################################################################################
+# Functions
+
+def read_yago_properties(properties_path: str = YAGO_PROPERTIES_PATH, prefixes: dict = None) -> List[str]:
+    """
+    Read the known YAGO predicates, one `('schema:author', None, 3932471)` tuple per line.
+
+    Parameters:
+    ----------
+    properties_path: str
+        The file of the predicates and their counts
+
+    prefixes: dict
+        The prefixes to expand the predicates with. Defaults to the YAGO prefixes.
+
+    Returns:
+    ----------
+    predicates: List[str]
+        The distinct predicate URIs
+    """
+    prefixes = prefixes if prefixes is not None else get_prefixes(YAGO_PREFIXES_PATH)
+    predicates = []
+    with open(properties_path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                predicate = ast.literal_eval(line)[0]
+            except (ValueError, SyntaxError, IndexError) as e:
+                print(f"Skipping the malformed predicate line {line!r}: {e}")
+                continue
+            predicates.append(get_url_from_prefix_and_id(prefixes, predicate))
+    return list(dict.fromkeys(predicates))
+
+############################################################################################################
+# Classes
+
+class PredicatePolicy:
+    """
+    Compiled predicate-exclusion policy. Immutable once built, except for the per-dictionary code caches,
+    which are thread-safe.
+    """
+    def __init__(self, excluded: Iterable[str] = (), excluded_substrings: Iterable[str] = (), *,
+        vocabulary: Iterable[str] = None, prefixes: dict = PREFIXES):
+        """
+        Compile the policy.
+
+        Parameters:
+        ----------
+        excluded: Iterable[str]
+            The predicates to exclude exactly, as prefixed names (e.g. `schema:image`) or URIs
+
+        excluded_substrings: Iterable[str]
+            A predicate URI containing one of the substrings (case-insensitive) is excluded
+
+        vocabulary: Iterable[str]
+            The known predicate URIs, against which the substrings are compiled. Defaults to the YAGO predicates.
+
+        prefixes: dict
+            The prefixes to expand the prefixed names with
+        """
+        self.substrings = tuple(dict.fromkeys(substring.lower() for substring in excluded_substrings))
+        self.vocabulary = list(vocabulary) if vocabulary is not None else read_yago_properties()
+        excluded_uris = {get_url_from_prefix_and_id(prefixes, predicate.strip("<>") if predicate.startswith("<")
+            else predicate) for predicate in excluded}
+        excluded_uris.update(predicate for predicate in self.vocabulary if self._matches_substring(predicate))
+        self.excluded_uris = frozenset(excluded_uris)
+        self.allowed_uris = frozenset(predicate for predicate in self.vocabulary if predicate not in self.excluded_uris)
+
+        self._lock = threading.Lock()
+        # Per dictionary: the codes known to be allowed and excluded. Weak, so that the per-call dictionaries
+        # (e.g. the dictionary of the triples of one QID) are released with their frames.
+        self._codes: "weakref.WeakKeyDictionary[URIDictionary, tuple]" = weakref.WeakKeyDictionary()
+
+    def _matches_substring(self, predicate: str) -> bool:
+        predicate = predicate.lower()
+        return any(substring in predicate for substring in self.substrings)
+
+    def is_excluded(self, predicate: Optional[str]) -> bool:
+        """
+        Whether a predicate URI is excluded by the policy.
+        """
+        if predicate is None:
+            return False
+        return predicate in self.excluded_uris or \
+            (predicate not in self.allowed_uris and self._matches_substring(predicate))
+
+    ########################################################################################################
+    # Server-side filtering
+
+    def sparql_terms(self) -> List[str]:
+        """
+        The excluded predicates as SPARQL terms (`<URI>`), sorted, e.g. for the `exclude_properties` arguments
+        of the query templates. They do not depend on the PREFIX declarations of the query.
+        """
+        return [f"<{predicate}>" for predicate in sorted(self.excluded_uris)]
+
+    def sparql_filter(self, variable: str = "pred") -> str:
+        """
+        The FILTER clause excluding the predicates bound to `?variable`, or an empty string if nothing is excluded.
+        """
+        if not self.excluded_uris:
+            return ""
+        return f"FILTER (?{variable} NOT IN ({', '.join(self.sparql_terms())}))"
+
+    ########################################################################################################
+    # Client-side filtering
+
+    def _get_codes(self, dictionary: URIDictionary) -> tuple:
+        """
+        Get the allowed and excluded predicate codes of a dictionary, precomputing the allowed codes of the
+        known predicates on first use.
+        """
+        with self._lock:
+            codes = self._codes.get(dictionary)
+            if codes is None:
+                allowed = set(dictionary.encode_many(sorted(self.allowed_uris)).tolist())
+                excluded = set(dictionary.lookup_many(sorted(self.excluded_uris)).tolist()) - {-1}
+                codes = self._codes[dictionary] = (allowed, excluded)
+        return codes
+
+    def allowed_codes(self, dictionary: URIDictionary = None) -> np.ndarray:
+        """
+        The codes of the allowed predicates in a dictionary, including the unknown predicates seen so far.
+
+        Parameters:
+        ----------
+        dictionary: URIDictionary
+            The dictionary. Defaults to the process-wide dictionary.
+
+        Returns:
+        ----------
+        codes: np.ndarray
+            The sorted int32 codes
+        """
+        dictionary = dictionary if dictionary is not None else get_default_uri_dictionary()
+        allowed, _ = self._get_codes(dictionary)
+        with self._lock:
+            return np.array(sorted(allowed), dtype=np.int32)
+
+    def filter_frame(self, triples: TripleFrame) -> TripleFrame:
+        """
+        Drop the triples of a TripleFrame whose predicate is excluded.
+        Only the predicates outside the precomputed codes are decoded and tested.
+
+        Parameters:
+        ----------
+        triples: TripleFrame
+            The triples
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The remaining triples
+        """
+        if not len(triples):
+            return triples
+        allowed, excluded = self._get_codes(triples.dictionary)
+        predicate_codes = np.unique(triples.predicates).tolist()
+        unknown = [code for code in predicate_codes if code not in allowed and code not in excluded]
+        if unknown:
+            with self._lock:
+                for code, predicate in zip(unknown, triples.dictionary.decode_many(unknown)):
+                    (excluded if self.is_excluded(predicate) else allowed).add(code)
+        excluded_codes = [code for code in predicate_codes if code in excluded]
+        if not excluded_codes:
+            return triples
+        return triples[~np.isin(triples.predicates, excluded_codes)]
+
+    def filter_triples(self, triples: Iterable[tuple]) -> List[tuple]:
+        """
+        Drop the (subject, predicate, object) triples whose predicate is excluded.
+        """
+        return [triple for triple in triples if not self.is_excluded(triple[1])]
+
+############################################################################################################
+# Shared policies
+# Every consumer picks its excluded set; the policies are compiled once per process, on first use.
+
+_POLICY_SETTINGS = {
+    "default": (EXCLUDED_PREDICATES, EXCLUDED_PREDICATE_SUBSTRINGS),
+    "random_walk": (RANDOM_WALK_EXCLUDED_PREDICATES, ()),
+}
+_policies: Dict[str, PredicatePolicy] = {}
+_policies_lock = threading.Lock()
+
+def get_predicate_policy(name: str = "default") -> PredicatePolicy:
+    """
+    Get a process-wide PredicatePolicy by name: "default" (`EXCLUDED_PREDICATES` and `EXCLUDED_PREDICATE_SUBSTRINGS`)
+    or "random_walk" (`RANDOM_WALK_EXCLUDED_PREDICATES`).
+    """
+    policy = _policies.get(name)
+    if policy is None:
+        with _policies_lock:
+            policy = _policies.get(name)
+            if policy is None:
+                excluded, excluded_substrings = _POLICY_SETTINGS[name]
+                policy = _policies[name] = PredicatePolicy(excluded, excluded_substrings)
+    return policy
+
+def get_default_predicate_policy() -> PredicatePolicy:
+    """
+    Get the default process-wide PredicatePolicy, shared by the neighbor, path and slice templates
+    and the Steiner pipeline.
+    """
+    return get_predicate_policy("default")
+
+def get_random_walk_predicate_policy() -> PredicatePolicy:
+    """
+    Get the process-wide PredicatePolicy of the random walks, which only excludes the invalid properties.
+    """
+    return get_predicate_policy("random_walk")
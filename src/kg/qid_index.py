@@ -0,0 +1,255 @@
+"""
+This module contains an offline, memory-mapped index from Wikidata QIDs to YAGO URIs.
+The `owl:sameAs` links to Wikidata are static per YAGO release, so they do not need a live SPARQL server:
+the builder streams the YAGO TTL dump once, and the lookups run a binary search over memory-mapped files.
+
+Index layout (in the index directory):
+- `qids.npy`: sorted numeric QIDs (uint64), e.g. 42 for Q42
+- `offsets.npy`: offsets (uint64) into the URI blob, one more than the number of QIDs
+- `uris.bin`: the URIs (without the common prefix), concatenated in the order of `qids.npy`
+- `meta.json`: the URI prefix and the number of entries
+
+Usage:
+    python -m kg.qid_index --ttl_paths <yago-facts.ttl> <yago-beyond-wikipedia.ttl> --index_dir <index_dir>
+"""
+############################################################################################################
+# Importing necessary libraries
+import os
+import json
+import mmap
+import argparse
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from kg.constants import QID_INDEX_DIR, PREFIXES
+from kg.db.constants import TTL_PATH, TTL_ALL_PATH
+
+WIKIDATA_ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+OWL_SAME_AS = "http://www.w3.org/2002/07/owl#sameAs"
+
+QIDS_FILE = "qids.npy"
+OFFSETS_FILE = "offsets.npy"
+URIS_FILE = "uris.bin"
+META_FILE = "meta.json"
+
+############################################################################################################
+# Builder
+
+def _expand_term(term: str, prefix_dict: dict) -> str:
+    """
+    Expand a TTL term (prefixed name or <URI>) to a full URI.
+    """
+    if term.startswith("<") and term.endswith(">"):
+        return term[1:-1]
+    prefix, _, local_name = term.partition(":")
+    if prefix in prefix_dict:
+        return f"{prefix_dict[prefix]}{local_name}"
+    return term
+
+def read_same_as_line(line: str, prefix_dict: dict) -> Optional[tuple]:
+    """
+    Read a line of a YAGO TTL file, and return its Wikidata `owl:sameAs` link if it has one.
+    Prefix declarations are added to `prefix_dict`.
+
+    Parameters:
+    ----------
+    line: str
+        The line of the TTL file
+
+    prefix_dict: dict
+        The prefixes declared so far
+
+    Returns:
+    ----------
+    link: tuple
+        The numeric QID and the YAGO URI, or None if the line is not a Wikidata `owl:sameAs` link
+    """
+    if line.startswith("@prefix"):
+        entities = line.split()
+        if len(entities) == 4:
+            prefix_dict[entities[1].rstrip(":")] = entities[2].strip("<>")
+        return None
+    # Cheap pre-filter, most of the lines are not sameAs links
+    if "sameAs" not in line:
+        return None
+    entities = line.split()
+    if len(entities) != 4:
+        return None
+    if _expand_term(entities[1], prefix_dict) != OWL_SAME_AS:
+        return None
+    target = _expand_term(entities[2], prefix_dict)
+    if not target.startswith(WIKIDATA_ENTITY_PREFIX):
+        return None
+    qid = target[len(WIKIDATA_ENTITY_PREFIX):]
+    if not (qid.startswith("Q") and qid[1:].isdigit()):
+        return None
+    return int(qid[1:]), _expand_term(entities[0], prefix_dict)
+
+def build_qid_index(ttl_paths: List[str], index_dir: str, *, uri_prefix: str = PREFIXES["yago"]) -> int:
+    """
+    Build the QID index from YAGO TTL files.
+    The TTL files are streamed once; the URIs are spooled to disk, so that the memory use is
+    about 24 bytes per link regardless of the URI lengths.
+
+    Parameters:
+    ----------
+    ttl_paths: List[str]
+        The YAGO TTL files to read the `owl:sameAs` links from
+
+    index_dir: str
+        The directory to write the index to
+
+    uri_prefix: str
+        The prefix stripped from the stored URIs
+
+    Returns:
+    ----------
+    count: int
+        The number of links in the index
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    spool_path = os.path.join(index_dir, URIS_FILE + ".unsorted")
+
+    qids = array("Q")
+    offsets = array("Q", [0])
+    position = 0
+    with open(spool_path, "wb") as spool:
+        for ttl_path in ttl_paths:
+            prefix_dict = dict()
+            with open(ttl_path, "r", encoding="utf-8") as f:
+                for line in tqdm(f, desc=f"Reading {os.path.basename(ttl_path)}"):
+                    link = read_same_as_line(line, prefix_dict)
+                    if link is None:
+                        continue
+                    qid, uri = link
+                    if uri.startswith(uri_prefix):
+                        uri = uri[len(uri_prefix):]
+                    encoded_uri = uri.encode("utf-8")
+                    spool.write(encoded_uri)
+                    position += len(encoded_uri)
+                    qids.append(qid)
+                    offsets.append(position)
+
+    count = len(qids)
+    qids = np.frombuffer(qids, dtype=np.uint64) if count else np.zeros(0, dtype=np.uint64)
+    offsets = np.frombuffer(offsets, dtype=np.uint64)
+    # Stable sort, so that duplicate QIDs keep the order of the dump
+    order = np.argsort(qids, kind="stable")
+
+    sorted_offsets = np.zeros(count + 1, dtype=np.uint64)
+    with open(spool_path, "rb") as spool, open(os.path.join(index_dir, URIS_FILE), "wb") as blob:
+        spool_map = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) if position else b""
+        position = 0
+        for i, index in enumerate(order):
+            uri = spool_map[offsets[index]:offsets[index + 1]]
+            blob.write(uri)
+            position += len(uri)
+            sorted_offsets[i + 1] = position
+        if position:
+            spool_map.close()
+    os.remove(spool_path)
+
+    np.save(os.path.join(index_dir, QIDS_FILE), qids[order])
+    np.save(os.path.join(index_dir, OFFSETS_FILE), sorted_offsets)
+    with open(os.path.join(index_dir, META_FILE), "w") as f:
+        json.dump({"uri_prefix": uri_prefix, "count": count}, f)
+    return count
+
+############################################################################################################
+# Lookup
+
+class QIDIndex:
+    """
+    Read-only, memory-mapped QID to YAGO URI index.
+    Lookups are binary searches over the memory-mapped files; only the pages touched are read from disk,
+    and the index can be shared by any number of threads.
+    """
+    def __init__(self, index_dir: str = QID_INDEX_DIR):
+        """
+        Open the index.
+
+        Parameters:
+        ----------
+        index_dir: str
+            The directory the index was built in
+        """
+        with open(os.path.join(index_dir, META_FILE), "r") as f:
+            meta = json.load(f)
+        self.uri_prefix = meta["uri_prefix"]
+        self._qids = np.load(os.path.join(index_dir, QIDS_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+        if meta["count"]:
+            self._uris = np.memmap(os.path.join(index_dir, URIS_FILE), dtype=np.uint8, mode="r")
+        else:
+            self._uris = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._qids)
+
+    def _uri_at(self, position: int) -> str:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return self.uri_prefix + self._uris[start:end].tobytes().decode("utf-8")
+
+    @staticmethod
+    def _parse_QID(QID: str) -> Optional[int]:
+        if isinstance(QID, str) and QID.startswith("Q") and QID[1:].isdigit():
+            return int(QID[1:])
+        return None
+
+    def lookup(self, QID: str) -> Optional[str]:
+        """
+        Get the YAGO URI of a QID.
+        Like `convert_QID_yagoID`, a QID with several YAGO matches is treated as unresolved.
+
+        Parameters:
+        ----------
+        QID: str
+            The Wikidata QID, e.g. 'Q42'
+
+        Returns:
+        ----------
+        uri: str
+            The YAGO URI, or None if the QID has no unique match
+        """
+        return self.lookup_many([QID])[QID]
+
+    def lookup_many(self, QIDs: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Get the YAGO URIs of multiple QIDs, with a single vectorized binary search.
+
+        Parameters:
+        ----------
+        QIDs: List[str]
+            The Wikidata QIDs
+
+        Returns:
+        ----------
+        uris: Dict[str, Optional[str]]
+            The YAGO URI of every QID, or None if the QID has no unique match
+        """
+        results = {QID: None for QID in QIDs}
+        parsed = [(QID, self._parse_QID(QID)) for QID in results]
+        parsed = [(QID, number) for QID, number in parsed if number is not None]
+        if not parsed or len(self._qids) == 0:
+            return results
+        numbers = np.fromiter((number for _, number in parsed), dtype=np.uint64, count=len(parsed))
+        left = np.searchsorted(self._qids, numbers, side="left")
+        right = np.searchsorted(self._qids, numbers, side="right")
+        for (QID, _), start, end in zip(parsed, left, right):
+            if end - start == 1:
+                results[QID] = self._uri_at(int(start))
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline QID to YAGO URI index.")
+    parser.add_argument("--ttl_paths", type=str, nargs="+", default=[TTL_PATH, TTL_ALL_PATH],
+        help="Paths to the YAGO TTL files.")
+    parser.add_argument("--index_dir", type=str, default=QID_INDEX_DIR, help="Directory to write the index to.")
+    args = parser.parse_args()
+
+    count = build_qid_index(args.ttl_paths, args.index_dir)
+    print(f"Indexed {count} Wikidata links in {args.index_dir}")
@@ -4,17 +4,23 @@ This module contains utility functions for the Yago Knowledge Graph.
 ############################################################################################################
 # Importing necessary libraries
 from typing import List, Set
-import requests
 import pandas as pd
 import urllib.parse
 
+from kg.constants import YAGO_ENDPOINT_URL, PAGED_MAX_TRIPLES_PER_ENTITY
+from kg.sparql_client import SparqlClient, SparqlQueryError, get_default_client
+from kg.sparql_stream import get_triples_from_stream, iter_triples
+from kg.sparql_metrics import TEMPLATE_MULTI_SUBJECT, TEMPLATE_DESCRIPTION
+from kg.query_hints import add_query_hints, use_query_hints
+from kg.paged_retrieval import count_rows, fetch_pages
+
 ############################################################################################################
 # Functions
 
 # SparQL functions
 def get_triples_multiple_subjects_query(entities: List[str] = None, *,
     lang: str = None, filter_literals: bool = True, prefixes: dict, invalid_properties: List[str] = None,
-    columns_dict: dict) -> str:
+    columns_dict: dict, query_hints: bool = None) -> str:
     """
     Generate a query to get the triples for a list of entities.
 
@@ -28,6 +34,10 @@ def get_triples_multiple_subjects_query(entities: List[str] = None, *,
 
     columns_dict: dict
         The columns dictionary
+
+    query_hints: bool
+        Whether to add the Blazegraph query hints of the template. Defaults to `QUERY_HINTS_ENABLED`.
+
     Returns:
     ----------
     query: str
@@ -61,11 +71,13 @@ def get_triples_multiple_subjects_query(entities: List[str] = None, *,
         {f"FILTER ({' && '.join(filters)})" if filters else ""}
     }}
     """
+    if use_query_hints(query_hints):
+        query = add_query_hints(query, TEMPLATE_MULTI_SUBJECT)
     return query
 
 
 def get_description_multiple_entities_query(entities: List[str] = None, *,
-    columns_dict: dict = None) -> str:
+    columns_dict: dict = None, query_hints: bool = None) -> str:
     """
     Generate a query to get the description for a list of entities.
 
@@ -77,6 +89,9 @@ def get_description_multiple_entities_query(entities: List[str] = None, *,
     columns_dict: dict
         The columns dictionary
 
+    query_hints: bool
+        Whether to add the Blazegraph query hints of the template. Defaults to `QUERY_HINTS_ENABLED`.
+
     Returns:
     ----------
     query: str
@@ -95,10 +110,13 @@ def get_description_multiple_entities_query(entities: List[str] = None, *,
         filter(lang(?{description}) = 'en')
     }}
     """
+    if use_query_hints(query_hints):
+        query = add_query_hints(query, TEMPLATE_DESCRIPTION)
     return query
 
 
-def query_kg(yago_endpoint_url: str, query_sparql: str) -> List[str]:
+def query_kg(yago_endpoint_url: str, query_sparql: str, *, client: SparqlClient = None,
+    template: str = None) -> List[str]:
     """Query the YAGO knowledge graph.
 
     Parameters:
@@ -109,51 +127,135 @@ def query_kg(yago_endpoint_url: str, query_sparql: str) -> List[str]:
     query_sparql: str
         The SPARQL query
 
+    client: SparqlClient
+        The SPARQL client to send the query with. Defaults to the shared client.
+
+    template: str
+        The template the query was built from, recorded in the metrics (see `kg.sparql_metrics`)
+
     Returns:
     ----------
     response: List[str]
         The response
     """
-    headers = {
-        "Content-Type": "application/sparql-query",
-        "Accept": "application/sparql-results+json",
-    }
+    if client is None:
+        client = get_default_client()
 
     try:
-        response = requests.post(yago_endpoint_url, headers=headers, data=query_sparql)
-        if response.status_code == 200:
-            response_json = response.json()  # Prints the JSON result
-            return response_json
+        return client.query(query_sparql, endpoint_url=yago_endpoint_url, template=template)
+    except SparqlQueryError as e:
+        if e.status_code is not None:
+            print(f"Error: {e.status_code}")
         else:
-            print(f"Error: {response.status_code}")
-            return None
+            print("Error querying the YAGO knowledge graph")
+            print(e)
+        return None
     except Exception as e:
-        print(f"Error querying the YAGO knowledge graph")
+        print("Error querying the YAGO knowledge graph")
         print(e)
         return None
     
-def query_kg_endpoint(yago_endpoint_url: str, query_sparql: str) -> List[str]:
-    headers = {
-        "Content-Type": "application/sparql-query; charset=utf-8",
-        "Accept": "application/sparql-results+json",
-    }
+def query_kg_endpoint(yago_endpoint_url: str, query_sparql: str, *, client: SparqlClient = None,
+    template: str = None) -> List[str]:
+    if client is None:
+        client = get_default_client()
 
     try:
-        # Encode query explicitly as UTF-8 bytes
-        response = requests.post(yago_endpoint_url, headers=headers, data=query_sparql.encode("utf-8"))
+        return client.query(query_sparql, endpoint_url=yago_endpoint_url, template=template)
+    except SparqlQueryError as e:
+        if e.status_code is None:
+            print(f"Error querying the YAGO knowledge graph: {e}")
+        return None
+    except Exception as e:
+        print(f"Error querying the YAGO knowledge graph: {e}")
+        return None
 
-        # Debugging: log the status code and response
-        # print(f"Response Status Code: {response.status_code}")
-        # print(f"Response Content: {response.text}")
+def query_kg_rows(yago_endpoint_url: str, query_sparql: str, *, result_format: str = "tsv",
+    client: SparqlClient = None, template: str = None) -> tuple:
+    """
+    Query the YAGO knowledge graph in the given result format.
+    Decode the result with `kg.sparql_formats.get_triples_from_rows` or
+    `kg.sparql_formats.rows_to_triples_with_main_entity`.
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+    Parameters:
+    ----------
+    yago_endpoint_url: str
+        The YAGO endpoint URL
+
+    query_sparql: str
+        The SPARQL query
+
+    result_format: str
+        One of "json", "tsv" or "csv"
+
+    client: SparqlClient
+        The SPARQL client to send the query with. Defaults to the shared client.
+
+    template: str
+        The template the query was built from, recorded in the metrics
+
+    Returns:
+    ----------
+    result: tuple
+        The variables and the rows of the result, or None if the query failed
+    """
+    if client is None:
+        client = get_default_client()
+
+    try:
+        return client.query_rows(query_sparql, endpoint_url=yago_endpoint_url, result_format=result_format,
+            template=template)
     except Exception as e:
         print(f"Error querying the YAGO knowledge graph: {e}")
         return None
 
+def query_kg_dataframe(yago_endpoint_url: str, query_sparql: str, *,
+    columns_dict: dict = None, client: SparqlClient = None, template: str = None) -> pd.DataFrame:
+    """
+    Query the YAGO knowledge graph and decode the result into a DataFrame while it is downloaded.
+    Equivalent to `get_triples_from_response(query_kg(...))`, without materializing the JSON document.
+
+    Parameters:
+    ----------
+    yago_endpoint_url: str
+        The YAGO endpoint URL
+
+    query_sparql: str
+        The SPARQL query
+
+    columns_dict: dict
+        The mapping from SPARQL variables to DataFrame columns
+
+    client: SparqlClient
+        The SPARQL client to send the query with. Defaults to the shared client.
+
+    template: str
+        The template the query was built from, recorded in the metrics
+
+    Returns:
+    ----------
+    triples_df: pd.DataFrame
+        The triples. Empty if the query failed.
+    """
+    if client is None:
+        client = get_default_client()
+    if columns_dict is None:
+        columns_dict = {
+            "subject": "subject",
+            "predicate": "predicate",
+            "object": "object"
+        }
+
+    try:
+        chunks = client.query_stream(query_sparql, endpoint_url=yago_endpoint_url, template=template)
+        triples_df = get_triples_from_stream(chunks, columns_dict=columns_dict)
+        client.metrics.record_rows(template, len(triples_df))
+        return triples_df
+    except Exception as e:
+        print("Error querying the YAGO knowledge graph")
+        print(e)
+        return pd.DataFrame(columns=columns_dict.values())
+
 def get_triples_from_response(response: dict, *,
     columns_dict: dict = None) -> pd.DataFrame:
     """
@@ -178,19 +280,27 @@ def get_triples_from_response(response: dict, *,
         return pd.DataFrame(triples, columns = columns_dict.values())
     
     
-def query_yago_entity_as_list(yago_endpoint_url, yago_entity_id):
+def query_yago_entity_as_list(yago_endpoint_url, yago_entity_id, *, paged: bool = False,
+    max_triples: int = PAGED_MAX_TRIPLES_PER_ENTITY):
     """
     Query the YAGO knowledge graph for all triples connected to a given entity and return results as a list.
 
     Parameters:
         yago_endpoint_url (str): The SPARQL endpoint URL.
         yago_entity_id (str): The YAGO entity ID (e.g., 'doctoralAdvisor').
+        paged (bool): If the result hits the LIMIT of 10000 triples, fetch the remaining triples
+            in ordered pages (see kg/paged_retrieval.py) instead of truncating them.
+        max_triples (int): With `paged`, the maximum number of triples fetched.
 
     Returns:
         list: A list of triples (subject, predicate, object) connected to the entity.
     """
-    # Construct the SPARQL query
-    query = f"""
+    page_size = 10000
+
+    def build_query(limit, offset=0, order_by=False):
+        order_clause = "ORDER BY ?predicate ?subject ?object\n    " if order_by else ""
+        offset_clause = f" OFFSET {offset}" if offset else ""
+        return f"""
     PREFIX yago: <http://yago-knowledge.org/resource/>
     SELECT ?subject ?predicate ?object WHERE {{ 
         {{ yago:{yago_entity_id} ?predicate ?object . }}
@@ -198,26 +308,50 @@ def query_yago_entity_as_list(yago_endpoint_url, yago_entity_id):
         {{ ?subject ?predicate yago:{yago_entity_id} . }}
         FILTER(lang(?object) = 'en' || !isLiteral(?object))
     }} 
-    LIMIT 10000
+    {order_clause}LIMIT {limit}{offset_clause}
     """
+
+    # Construct the SPARQL query
+    query = build_query(page_size)
     
-    # Query the knowledge graph using the provided function
-    response = query_kg(yago_endpoint_url, query)
-    print("Response was received")
-    
-    # Convert the response into a DataFrame
-    triples_df = get_triples_from_response(response)
-    print("Response was converted to DataFrame")
-    
-    # Convert the DataFrame into a list of triples
-    triples_list = triples_df.values.tolist()
-    print("DataFrame was converted to list")
+    # Query the knowledge graph, decoding the triples while the response is downloaded
+    try:
+        chunks = get_default_client().query_stream(query, endpoint_url=yago_endpoint_url)
+        triples_list = [list(triple) for triple in iter_triples(chunks)]
+    except Exception as e:
+        print("Error querying the YAGO knowledge graph")
+        print(e)
+        triples_list = []
+
+    if paged and len(triples_list) >= page_size:
+        count_query = f"""
+    PREFIX yago: <http://yago-knowledge.org/resource/>
+    SELECT (COUNT(*) AS ?count) WHERE {{
+        {{ yago:{yago_entity_id} ?predicate ?object . }}
+        UNION
+        {{ ?subject ?predicate yago:{yago_entity_id} . }}
+        FILTER(lang(?object) = 'en' || !isLiteral(?object))
+    }}
+    """
+        try:
+            total = count_rows(count_query, endpoint_url=yago_endpoint_url)
+            variables, rows, complete = fetch_pages(
+                lambda limit, offset: build_query(limit, offset, order_by=True), total,
+                page_size=page_size, max_rows=max_triples, endpoint_url=yago_endpoint_url)
+            positions = [variables.index(variable) for variable in ["subject", "predicate", "object"]]
+            triples_list = [[row[position] for position in positions] for row in rows]
+            if not complete:
+                print(f"Capped the triples of {yago_entity_id} at {max_triples} of {total}")
+        except Exception as e:
+            print(f"Paged retrieval failed for {yago_entity_id}, keeping the first {page_size} triples")
+            print(e)
+    print("Response was converted to list")
     
     return triples_list
 
 if __name__ == "__main__":
     # Test the functions
-    yago_endpoint_url = "http://localhost:9999/bigdata/sparql"
+    yago_endpoint_url = YAGO_ENDPOINT_URL
     query = """
     PREFIX yago: <http://yago-knowledge.org/resource/>
     SELECT * WHERE { 
@@ -0,0 +1,90 @@
+"""
+This module contains the injection of Blazegraph query hints into the SPARQL query builders.
+The hints of every query template are configured in one place (`QUERY_HINTS` in `kg/constants.py`),
+and are only added when `QUERY_HINTS_ENABLED` is set or a builder is asked for them explicitly.
+Other SPARQL stores reject the `hint:` prefix, so keep the hints disabled when not querying Blazegraph.
+
+See https://github.com/blazegraph/database/wiki/QueryHints for the available hints.
+"""
+############################################################################################################
+# Importing necessary libraries
+import re
+
+from kg.constants import QUERY_HINTS, QUERY_HINTS_ENABLED
+
+BLAZEGRAPH_HINT_PREFIX = "http://www.bigdata.com/queryHints#"
+
+_GROUP_START = re.compile(r"\b(WHERE|ASK)\s*\{", re.IGNORECASE)
+
+############################################################################################################
+# Functions
+
+def use_query_hints(enabled: bool = None) -> bool:
+    """
+    Whether the query builders should add the query hints.
+
+    Parameters:
+    ----------
+    enabled: bool
+        The choice of the caller. None defers to `QUERY_HINTS_ENABLED`.
+
+    Returns:
+    ----------
+    enabled: bool
+        True if the hints should be added
+    """
+    return QUERY_HINTS_ENABLED if enabled is None else enabled
+
+def format_query_hints(hints: dict) -> str:
+    """
+    Format query hints as query-scoped hint triples, e.g. `hint:Query hint:analytic "true" .`
+
+    Parameters:
+    ----------
+    hints: dict
+        The hints, e.g. {"analytic": "true"}
+
+    Returns:
+    ----------
+    hint_triples: str
+        One hint triple per line
+    """
+    return "\n".join(f'hint:Query hint:{name} "{value}" .' for name, value in hints.items())
+
+def add_query_hints(query: str, template: str, *, hints: dict = None) -> str:
+    """
+    Add the Blazegraph query hints of a template to a query: the `hint:` prefix before the query,
+    and the hint triples at the start of its WHERE clause.
+
+    Parameters:
+    ----------
+    query: str
+        The SPARQL query
+
+    template: str
+        The query template, e.g. `kg.sparql_metrics.TEMPLATE_DIRECT_NEIGHBORS`
+
+    hints: dict
+        The hints to add. Defaults to the hints configured for the template.
+
+    Returns:
+    ----------
+    query: str
+        The query with the hints, or the query unchanged if the template has no hints
+
+    Raises:
+    ----------
+    ValueError
+        If the query has no WHERE clause to add the hints to
+    """
+    if hints is None:
+        hints = QUERY_HINTS.get(template, {})
+    if not hints:
+        return query
+
+    match = _GROUP_START.search(query)
+    if match is None:
+        raise ValueError("Cannot add query hints to a query without a WHERE clause")
+    hint_triples = format_query_hints(hints).replace("\n", "\n        ")
+    return (f"PREFIX hint: <{BLAZEGRAPH_HINT_PREFIX}>\n"
+        f"{query[:match.end()]}\n        {hint_triples}{query[match.end():]}")
@@ -20,10 +20,14 @@ from kg.db.yago_db import YagoDB
 from kg.db.constants import YAGO_ALL_ENTITY_COUNT, YAGO_FACTS_ENTITY_COUNT
 from kg.db.queries import get_random_entities_query, \
     get_entity_count_from_label_multiple_query_parameterized
-from kg.query import get_triples_multiple_subjects_query, get_description_multiple_entities_query, \
-    query_kg, get_triples_from_response
+from kg.query import get_triples_multiple_subjects_query, get_description_multiple_entities_query
+from kg.sparql_client import SparqlClient, get_default_client
+from kg.adaptive_batching import AdaptiveBatchExecutor
+from kg.triple_frame import TripleFrame
+from kg.predicate_policy import get_random_walk_predicate_policy
+from kg.sparql_metrics import TEMPLATE_MULTI_SUBJECT, TEMPLATE_DESCRIPTION
 from kg.constants import YAGO_ENTITY_STORE_DB_PATH, YAGO_PREFIXES_PATH, YAGO_ENDPOINT_URL, \
-    PREFIXES, INVALID_PROPERTIES
+    PREFIXES
 from kg.prefix import get_prefixes, get_url_from_prefix_and_id
 
 SPARQL_COLUMNS_DICT = {
@@ -43,7 +47,7 @@ class RandomWalk:
     NOTE: Most of the functions work with entity_labels instead of entity_ids.
     """
     def __init__(self, yago_db: YagoDB, *, yago_endpoint_url = YAGO_ENDPOINT_URL,
-        sparql_columns_dict: dict = SPARQL_COLUMNS_DICT):
+        sparql_columns_dict: dict = SPARQL_COLUMNS_DICT, sparql_client: SparqlClient = None):
         """
         Initialize the RandomWalk2 object.
 
@@ -57,10 +61,19 @@ class RandomWalk:
 
         sparql_columns_dict: dict
             The SPARQL columns dictionary
+
+        sparql_client: SparqlClient
+            The pooled SPARQL client to query the endpoint with. Defaults to the shared client.
         """
         self.yago_db = yago_db
         self.yago_endpoint_url = yago_endpoint_url
         self.sparql_columns_dict = sparql_columns_dict
+        self.sparql_client = sparql_client if sparql_client is not None else get_default_client()
+        # One executor per query template, so that each learns its own batch size
+        self.hop_executor = AdaptiveBatchExecutor(self.sparql_client, endpoint_url=yago_endpoint_url,
+            template=TEMPLATE_MULTI_SUBJECT)
+        self.description_executor = AdaptiveBatchExecutor(self.sparql_client, endpoint_url=yago_endpoint_url,
+            template=TEMPLATE_DESCRIPTION)
 
     def random_walk_batch(self, num_of_entities: int = 10, depth: int = 3) -> pd.DataFrame:
         """
@@ -162,38 +175,86 @@ class RandomWalk:
             if key in ["subject", "predicate", "object", "object_count"]
         }
         try:
-            query2 = get_triples_multiple_subjects_query(
-                entities=entities, 
+            # The entities are queried in adaptively sized batches; a batch that times out is split and retried.
+            # The triples stay dictionary-encoded: the hop only decodes the objects to count and the sampled triples.
+            triples = self.hop_executor.run(entities, lambda batch: get_triples_multiple_subjects_query(
+                entities=batch, 
                 columns_dict=columns_dict,
                 prefixes=PREFIXES,
-                invalid_properties=INVALID_PROPERTIES,
+                invalid_properties=get_random_walk_predicate_policy().sparql_terms(),
                 filter_literals=False
-            )
-            response = query_kg(self.yago_endpoint_url, query2)
-            triples = get_triples_from_response(response)
+            ), columns_dict=columns_dict, as_triple_frame=True)
         except Exception as e:
             print(f"Single hop query failed for: {entity_column_label}", e)
-            triples = pd.DataFrame(columns=columns_dict.values())
+            triples = TripleFrame.empty()
 
-        # Get the counts for the objects
+        # Get the counts for the objects, once per distinct object
+        object_codes, object_positions = np.unique(triples.objects, return_inverse=True)
+        weights = np.zeros(len(triples))
         try:
-            triples_object_counts = self._get_counts_for_entities(entity_df=triples,
-                entity_column_label=columns_dict["object"], 
-                count_label=columns_dict["object_count"])
-            ## The counts returned by _get_counts_for_entities align with the triples
-            triples[columns_dict["object_count"]] = \
-                triples_object_counts[columns_dict["object_count"]].values
+            if len(object_codes):
+                object_labels = pd.DataFrame({columns_dict["object"]: triples.dictionary.decode_many(object_codes)})
+                object_counts = self._get_counts_for_entities(entity_df=object_labels,
+                    entity_column_label=columns_dict["object"], 
+                    count_label=columns_dict["object_count"])[columns_dict["object_count"]].to_numpy(dtype=float)
+                ## The counts returned by _get_counts_for_entities align with the distinct objects
+                weights = object_counts[object_positions]
         except Exception as e:
             print(f"Single hop object counts failed for: {entity_column_label}", e)
-            triples[columns_dict["object_count"]] = 0
 
         # Finally, use the objects and their counts to get one entity each for the first hop
-        entities_hop_1 = entity_df.apply(
-            lambda row: self._sample_triple_for_entity_by_count(triples_df=triples, entity=row[entity_column_label], 
-                weight_column_label=columns_dict["object_count"]),
-            axis=1, result_type="expand").rename(columns=entities_hop_1_cols)
+        sampled_triples = self._sample_triples_by_count(triples=triples, weights=weights,
+            entities=entity_df[entity_column_label].tolist())
+        entities_hop_1 = pd.DataFrame(sampled_triples, index=entity_df.index, 
+            columns=[entities_hop_1_cols[0], entities_hop_1_cols[1]])
         return entities_hop_1
 
+    def _sample_triples_by_count(self, triples: TripleFrame, weights: np.ndarray, 
+        entities: List[str]) -> List[List[str]]:
+        """
+        Samples one triple per entity from dictionary-encoded triples.
+        Uses the count of the objects to weight the sampling, like `_sample_triple_for_entity_by_count`.
+
+        Parameters:
+        ----------
+        triples: TripleFrame
+            The triples of the entities
+
+        weights: np.ndarray
+            The sampling weight of every triple
+
+        entities: List[str]
+            The entities to sample triples for
+
+        Returns:
+        ----------
+        sampled_triples: List[List[str]]
+            One sampled triple per entity as a list (predicate, object), [None, None] if it has no triples
+        """
+        # Group the triples by subject code, so that every entity finds its triples with a binary search
+        order = np.argsort(triples.subjects, kind="stable")
+        sorted_subjects = triples.subjects[order]
+        entity_codes = triples.dictionary.lookup_many(entities)
+        starts = np.searchsorted(sorted_subjects, entity_codes, side="left")
+        ends = np.searchsorted(sorted_subjects, entity_codes, side="right")
+
+        decode = triples.dictionary.decode
+        sampled_triples = []
+        for entity_code, start, end in zip(entity_codes.tolist(), starts.tolist(), ends.tolist()):
+            if entity_code < 0 or start == end:
+                sampled_triples.append([None, None])
+                continue
+            positions = order[start:end]
+            entity_weights = weights[positions]
+            total = entity_weights.sum()
+            if total > 0:
+                position = positions[np.random.choice(len(positions), p=entity_weights / total)]
+            else:
+                position = positions[np.random.randint(len(positions))]
+            sampled_triples.append([decode(int(triples.predicates[position])), 
+                decode(int(triples.objects[position]))])
+        return sampled_triples
+
 
     def _get_counts_for_entities(self, entity_df: pd.DataFrame, entity_column_label: str, *,
         count_label: str = 'count') -> pd.DataFrame:
@@ -294,15 +355,11 @@ class RandomWalk:
         }
 
         try:
-            query = get_description_multiple_entities_query(
-                entities=entities, 
-                columns_dict=columns_dict
-            )
-            response = query_kg(self.yago_endpoint_url, query)
-            entity_description_df = get_triples_from_response(
-                response=response,
-                columns_dict=columns_dict
-            )
+            entity_description_df = self.description_executor.run(entities,
+                lambda batch: get_description_multiple_entities_query(
+                    entities=batch, 
+                    columns_dict=columns_dict
+                ), columns_dict=columns_dict)
         except Exception as e:
             print(f"Description query failed for: {entity_column_label}", e)
             entity_description_df = pd.DataFrame(columns=columns_dict.values())
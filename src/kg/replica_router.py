@@ -0,0 +1,291 @@
+"""
+This module contains the routing of SPARQL queries across read replicas of the YAGO endpoint.
+A single Blazegraph instance stalls every worker at once during its GC pauses; with several replicas serving
+the same YAGO release, the router sends each query to the replica with the fewest outstanding requests,
+and takes slow or failing replicas out of rotation for a while.
+
+Replicas are ejected when:
+- their (exponentially weighted) average latency exceeds the slow-latency threshold,
+- several requests in a row fail (connection errors, timeouts or 5xx responses),
+- a health check (`ASK {}`) fails or is slow.
+An ejected replica is readmitted when its ejection expires or when a health check succeeds.
+"""
+############################################################################################################
+# Importing necessary libraries
+import time
+import threading
+from typing import List
+
+import requests
+
+from kg.constants import YAGO_ENDPOINT_URL, YAGO_ENDPOINT_REPLICAS, REPLICA_HEALTH_CHECK_INTERVAL, \
+    REPLICA_HEALTH_CHECK_TIMEOUT, REPLICA_SLOW_LATENCY, REPLICA_MAX_CONSECUTIVE_FAILURES, REPLICA_EJECTION_SECONDS
+
+# Weight of the latest request in the average latency of a replica
+LATENCY_EWMA_ALPHA = 0.2
+# Number of requests a replica must have served before it can be ejected for being slow
+MIN_REQUESTS_BEFORE_SLOW_EJECTION = 5
+
+HEALTH_CHECK_QUERY = "ASK {}"
+
+############################################################################################################
+# Classes
+
+class _Replica:
+    """The routing state of a replica."""
+    __slots__ = ("url", "outstanding", "requests", "errors", "consecutive_failures", "latency_ewma",
+        "ejected_until", "ejections", "last_health_check", "healthy")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency_ewma = None
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.last_health_check = None
+        self.healthy = True
+
+
+class ReplicaRouter:
+    """
+    Least-outstanding-requests router over replicas of a SPARQL endpoint. Thread-safe.
+    The SPARQL clients acquire a replica before sending a request and release it with the outcome.
+    """
+    def __init__(self, endpoint_urls: List[str] = None, *, logical_url: str = YAGO_ENDPOINT_URL,
+        slow_latency: float = REPLICA_SLOW_LATENCY,
+        max_consecutive_failures: int = REPLICA_MAX_CONSECUTIVE_FAILURES,
+        ejection_seconds: float = REPLICA_EJECTION_SECONDS):
+        """
+        Initialize the ReplicaRouter object.
+
+        Parameters:
+        ----------
+        endpoint_urls: List[str]
+            The URLs of the replicas. Defaults to `YAGO_ENDPOINT_REPLICAS`.
+
+        logical_url: str
+            The endpoint URL the callers query; queries sent to it (or to any replica) are routed
+
+        slow_latency: float
+            The average latency (in seconds) above which a replica is ejected
+
+        max_consecutive_failures: int
+            The number of failed requests in a row after which a replica is ejected
+
+        ejection_seconds: float
+            How long (in seconds) an ejected replica stays out of rotation
+        """
+        if endpoint_urls is None:
+            endpoint_urls = YAGO_ENDPOINT_REPLICAS
+        if not endpoint_urls:
+            raise ValueError("Expected at least one replica")
+        self.logical_url = logical_url
+        self.slow_latency = slow_latency
+        self.max_consecutive_failures = max_consecutive_failures
+        self.ejection_seconds = ejection_seconds
+        self._replicas = {url: _Replica(url) for url in endpoint_urls}
+        self._lock = threading.Lock()
+        self._health_check_thread = None
+        self._stop_health_checks = threading.Event()
+
+    @property
+    def endpoint_urls(self) -> List[str]:
+        return list(self._replicas)
+
+    def routes(self, endpoint_url: str) -> bool:
+        """
+        Whether queries sent to `endpoint_url` are routed across the replicas.
+        """
+        return endpoint_url == self.logical_url or endpoint_url in self._replicas
+
+    def _eject(self, replica: _Replica, reason: str) -> None:
+        """
+        Take a replica out of rotation. Must be called with the lock held.
+        """
+        if replica.ejected_until <= time.monotonic():
+            replica.ejections += 1
+            print(f"Ejecting SPARQL replica {replica.url} for {self.ejection_seconds}s: {reason}")
+        replica.ejected_until = time.monotonic() + self.ejection_seconds
+        replica.latency_ewma = None
+        replica.consecutive_failures = 0
+
+    def acquire(self) -> str:
+        """
+        Pick the replica to send a request to, and count the request as outstanding on it.
+        If every replica is ejected, the one whose ejection expires first is used.
+
+        Returns:
+        ----------
+        endpoint_url: str
+            The URL of the replica. Must be passed to `release` once the request completes.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [replica for replica in self._replicas.values() if replica.ejected_until <= now]
+            if not candidates:
+                candidates = [min(self._replicas.values(), key=lambda replica: replica.ejected_until)]
+            replica = min(candidates, key=lambda replica: (replica.outstanding,
+                replica.latency_ewma if replica.latency_ewma is not None else 0.0, replica.requests))
+            replica.outstanding += 1
+            return replica.url
+
+    def release(self, endpoint_url: str, latency: float, *, failed: bool = False) -> None:
+        """
+        Record the outcome of a request sent to a replica.
+
+        Parameters:
+        ----------
+        endpoint_url: str
+            The URL returned by `acquire`
+
+        latency: float
+            The time (in seconds) the request took
+
+        failed: bool
+            Whether the request failed (connection error, timeout or 5xx response)
+        """
+        with self._lock:
+            replica = self._replicas[endpoint_url]
+            replica.outstanding -= 1
+            replica.requests += 1
+            if failed:
+                replica.errors += 1
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.max_consecutive_failures:
+                    self._eject(replica, f"{replica.consecutive_failures} failed requests in a row")
+                return
+
+            replica.consecutive_failures = 0
+            if replica.latency_ewma is None:
+                replica.latency_ewma = latency
+            else:
+                replica.latency_ewma = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * replica.latency_ewma
+            if replica.requests >= MIN_REQUESTS_BEFORE_SLOW_EJECTION and replica.latency_ewma > self.slow_latency:
+                self._eject(replica, f"average latency {replica.latency_ewma:.2f}s")
+
+    def check_health(self, *, timeout: float = REPLICA_HEALTH_CHECK_TIMEOUT,
+        session: requests.Session = None) -> dict:
+        """
+        Send a trivial query to every replica. Replicas that fail it (or answer slowly) are ejected,
+        ejected replicas that pass it are readmitted.
+
+        Parameters:
+        ----------
+        timeout: float
+            The timeout (in seconds) of a health check
+
+        session: requests.Session
+            The session to send the checks with. Defaults to a new session.
+
+        Returns:
+        ----------
+        health: dict
+            Whether each replica passed the check
+        """
+        health = {}
+        session = session if session is not None else requests.Session()
+        for url in self.endpoint_urls:
+            start = time.perf_counter()
+            try:
+                response = session.post(url, data=HEALTH_CHECK_QUERY.encode("utf-8"), timeout=timeout,
+                    headers={"Content-Type": "application/sparql-query; charset=utf-8",
+                        "Accept": "application/sparql-results+json"})
+                latency = time.perf_counter() - start
+                healthy = response.status_code == 200 and latency <= self.slow_latency
+                reason = f"health check returned {response.status_code} in {latency:.2f}s"
+            except requests.RequestException as e:
+                healthy = False
+                reason = f"health check failed: {e}"
+
+            with self._lock:
+                replica = self._replicas[url]
+                replica.last_health_check = time.time()
+                replica.healthy = healthy
+                if not healthy:
+                    self._eject(replica, reason)
+                elif replica.ejected_until > time.monotonic():
+                    print(f"Readmitting SPARQL replica {url} after a successful health check")
+                    replica.ejected_until = 0.0
+            health[url] = healthy
+        return health
+
+    def start_health_checks(self, interval: float = REPLICA_HEALTH_CHECK_INTERVAL) -> None:
+        """
+        Check the health of the replicas every `interval` seconds, in a daemon thread.
+        """
+        if self._health_check_thread is not None:
+            return
+        self._stop_health_checks.clear()
+
+        def run() -> None:
+            session = requests.Session()
+            while not self._stop_health_checks.wait(interval):
+                self.check_health(session=session)
+            session.close()
+
+        self._health_check_thread = threading.Thread(target=run, name="sparql-replica-health", daemon=True)
+        self._health_check_thread.start()
+
+    def stop_health_checks(self) -> None:
+        """Stop the health-check thread."""
+        if self._health_check_thread is None:
+            return
+        self._stop_health_checks.set()
+        self._health_check_thread.join()
+        self._health_check_thread = None
+
+    def stats(self) -> dict:
+        """
+        Get the routing counters of every replica.
+
+        Returns:
+        ----------
+        stats: dict
+            Per replica: the outstanding requests, the requests and errors served, the average latency,
+            the number of ejections, whether it is currently ejected, and the result of the last health check
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                replica.url: {
+                    "outstanding": replica.outstanding,
+                    "requests": replica.requests,
+                    "errors": replica.errors,
+                    "latency_ewma": replica.latency_ewma,
+                    "ejections": replica.ejections,
+                    "ejected": replica.ejected_until > now,
+                    "healthy": replica.healthy,
+                }
+                for replica in self._replicas.values()
+            }
+
+
+############################################################################################################
+# Default router
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+def get_default_router() -> ReplicaRouter:
+    """
+    Get the process-wide ReplicaRouter over `YAGO_ENDPOINT_REPLICAS`, creating it (and starting its
+    health checks) on first use. With a single replica there is nothing to route, and None is returned.
+
+    Returns:
+    ----------
+    router: ReplicaRouter
+        The shared ReplicaRouter, or None if a single replica is configured
+    """
+    global _default_router
+    if len(YAGO_ENDPOINT_REPLICAS) < 2:
+        return None
+    if _default_router is None:
+        with _default_router_lock:
+            if _default_router is None:
+                router = ReplicaRouter(YAGO_ENDPOINT_REPLICAS)
+                router.start_health_checks()
+                _default_router = router
+    return _default_router
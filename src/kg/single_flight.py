@@ -0,0 +1,152 @@
+"""
+This module contains the single-flight helpers used by the SPARQL clients.
+Concurrent callers asking for the same key wait on one outstanding call and share its result,
+so identical queries issued at the same moment (e.g. the neighbors of a hub entity requested by
+several QIDs in parallel) reach the endpoint only once.
+
+NOTE: The result is shared, not copied. Callers must not mutate it.
+"""
+############################################################################################################
+# Importing necessary libraries
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+############################################################################################################
+# Classes
+
+class _Call:
+    """An outstanding call and the callers waiting on it."""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Thread-based single-flight group.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Call `function`, unless a call with the same key is already in flight,
+        in which case wait for it and return its result (or raise its error).
+
+        Parameters:
+        ----------
+        key: Hashable
+            The key identifying identical calls
+
+        function: Callable[[], Any]
+            The call to make
+
+        Returns:
+        ----------
+        result: Any
+            The result of the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the group.
+
+        Returns:
+        ----------
+        stats: dict
+            The number of calls executed, and the number of calls served by another caller's call
+        """
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    Asyncio single-flight group. Must be used from a single event loop.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `function()`, unless a call with the same key is already in flight,
+        in which case await that call instead.
+
+        Parameters:
+        ----------
+        key: Hashable
+            The key identifying identical calls
+
+        function: Callable[[], Awaitable[Any]]
+            The coroutine function to call
+
+        Returns:
+        ----------
+        result: Any
+            The result of the call
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # Shielded, so that a cancelled waiter does not cancel the call for the others
+            return await asyncio.shield(future)
+
+        self.executed += 1
+        future = asyncio.ensure_future(function())
+        self._calls[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._forget(key, future)
+            else:
+                future.add_done_callback(lambda _: self._forget(key, future))
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the group.
+
+        Returns:
+        ----------
+        stats: dict
+            The number of calls executed, and the number of calls served by another caller's call
+        """
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
@@ -0,0 +1,576 @@
+"""
+This module extracts slices of YAGO: the k-hop neighborhood of a set of seed entities (Wikidata QIDs or YAGO URIs),
+e.g. the entities of a dataset. A slice is small enough to be served by the embedded local store
+(see kg/local_store.py), far faster than the full YAGO store.
+
+The neighborhood is expanded level by level, over the subjects and the objects of the triples (like the neighbor
+queries), following only the predicates not excluded by the predicate policy (see kg/predicate_policy.py):
+- every entity within `hops - 1` hops of a seed keeps all its triples, up to `max_triples_per_entity`,
+- the entities at `hops` hops only keep their attributes (literal values, types and sameAs links),
+  so that the label, description and QID queries still answer for them.
+
+The slice is extracted from the YAGO TTL dump (one pass per hop, plus one for the counts), or from the endpoint
+with one batched query per group of entities. The slice directory contains:
+- `slice.ttl`: the triples of the slice
+- `slice.db`: the entity counts of the slice entities (number of triples with the entity as subject in the full
+  graph), in the `items` table of the YAGO entity database (see kg/db/yago_db.py), for the random walks
+- `meta.json`: the seeds, the number of hops, entities and triples
+
+Usage (from `src`):
+    python -m kg.slice_extractor --dataset ./inputs/final_results_train10K_wiki40B.json --hops 2 \
+        --ttl_paths <yago-facts.ttl> --slice_dir <slice_dir>
+    python -m kg.slice_extractor --seeds Q38 Q183 --hops 1 --endpoint http://localhost:9999/bigdata/sparql
+"""
+############################################################################################################
+# Importing necessary libraries
+import os
+import json
+import sqlite3
+import argparse
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from tqdm import tqdm
+
+from kg.constants import PREFIXES, QID_INDEX_DIR, SLICE_DIR, SLICE_HOPS, SLICE_MAX_TRIPLES_PER_ENTITY, \
+    SLICE_BATCH_SIZE, SLICE_MAX_WORKERS
+from kg.kg_functions import extract_ids_with_prefix, convert_QIDs_yagoIDs, load_json, format_entity_for_values
+from kg.qid_index import QIDIndex, read_same_as_line, _expand_term
+from kg.sparql_client import SparqlClient, SparqlQueryError, get_default_client
+from kg.sparql_metrics import TEMPLATE_OTHER
+from kg.predicate_policy import PredicatePolicy, get_default_predicate_policy
+from kg.io_scheduler import get_default_io_scheduler
+
+SLICE_TTL_FILE = "slice.ttl"
+SLICE_DB_FILE = "slice.db"
+META_FILE = "meta.json"
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+OWL_SAME_AS = "http://www.w3.org/2002/07/owl#sameAs"
+# Predicates kept for the entities at the last hop, besides the literal values
+ATTRIBUTE_PREDICATES = (RDF_TYPE, OWL_SAME_AS)
+
+############################################################################################################
+# Seeds
+
+def get_dataset_seeds(dataset_path: str) -> List[str]:
+    """
+    Get the QIDs of a dataset, i.e. its main entities and the entities they mention,
+    like `subgraph_functions.get_interesting_entities`.
+
+    Parameters:
+    ----------
+    dataset_path: str
+        The dataset, e.g. `inputs/final_results_train10K_wiki40B.json`
+
+    Returns:
+    ----------
+    QIDs: List[str]
+        The distinct QIDs of the dataset
+    """
+    data = load_json(dataset_path)
+    if data is None:
+        return []
+    QIDs = []
+    for QID, item in data.items():
+        QIDs.append(QID)
+        QIDs.extend(extract_ids_with_prefix(item.get("entities", [])))
+    return list(dict.fromkeys(QIDs))
+
+def _expand_seed(seed: str) -> str:
+    """
+    Expand a YAGO seed given as a prefixed name (e.g. `yago:Italy`) or a <URI> to a full URI.
+    """
+    return _expand_term(seed, PREFIXES)
+
+def _is_QID(seed: str) -> bool:
+    return seed[:1] == "Q" and seed[1:].isdigit()
+
+def resolve_seeds_from_ttl(QIDs: List[str], ttl_paths: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Resolve QIDs to YAGO URIs with one pass over the `owl:sameAs` links of the TTL dump.
+    Prefer a `QIDIndex` (see kg/qid_index.py) when one is built.
+
+    Parameters:
+    ----------
+    QIDs: List[str]
+        The Wikidata QIDs
+
+    ttl_paths: List[str]
+        The YAGO TTL files
+
+    Returns:
+    ----------
+    resolved: Dict[str, Optional[str]]
+        The YAGO URI of every QID, None if it has no (unique) match
+    """
+    numeric_QIDs = {int(QID[1:]): QID for QID in QIDs}
+    matches = {QID: [] for QID in QIDs}
+    for ttl_path in ttl_paths:
+        prefix_dict = dict()
+        with open(ttl_path, "r", encoding="utf-8") as f:
+            for line in tqdm(f, desc=f"Resolving QIDs in {os.path.basename(ttl_path)}"):
+                link = read_same_as_line(line, prefix_dict)
+                if link is not None and link[0] in numeric_QIDs:
+                    matches[numeric_QIDs[link[0]]].append(link[1])
+    return {QID: uris[0] if len(uris) == 1 else None for QID, uris in matches.items()}
+
+def resolve_seeds(seeds: List[str], *, ttl_paths: List[str] = None, qid_index_dir: str = QID_INDEX_DIR) -> List[str]:
+    """
+    Resolve the seeds (Wikidata QIDs, YAGO prefixed names or URIs) to YAGO URIs.
+    The QIDs are resolved with the QID index if it is built, else from the TTL dump if given, else with the endpoint.
+
+    Parameters:
+    ----------
+    seeds: List[str]
+        The seeds
+
+    ttl_paths: List[str]
+        The YAGO TTL files. None resolves the QIDs with the endpoint.
+
+    qid_index_dir: str
+        The directory of the QID index
+
+    Returns:
+    ----------
+    seed_uris: List[str]
+        The distinct URIs of the seeds. Unresolved QIDs are dropped.
+    """
+    QIDs = [seed for seed in seeds if _is_QID(seed)]
+    seed_uris = [_expand_seed(seed) for seed in seeds if not _is_QID(seed)]
+    if QIDs:
+        if os.path.exists(os.path.join(qid_index_dir, META_FILE)):
+            resolved = QIDIndex(qid_index_dir).lookup_many(QIDs)
+        elif ttl_paths:
+            resolved = resolve_seeds_from_ttl(QIDs, ttl_paths)
+        else:
+            resolved = convert_QIDs_yagoIDs(QIDs)
+        unresolved = [QID for QID in QIDs if resolved.get(QID) is None]
+        if unresolved:
+            print(f"{len(unresolved)} of {len(QIDs)} QIDs have no YAGO entity")
+        seed_uris.extend(uri for uri in resolved.values() if uri is not None)
+    return list(dict.fromkeys(seed_uris))
+
+############################################################################################################
+# Extraction from the TTL dump
+
+def read_ttl_triple(line: str, prefix_dict: dict) -> Optional[Tuple[str, str, str]]:
+    """
+    Read a line of a YAGO TTL file (one triple per line), and return its terms as written.
+    Prefix declarations are added to `prefix_dict`.
+
+    Parameters:
+    ----------
+    line: str
+        The line of the TTL file
+
+    prefix_dict: dict
+        The prefixes declared so far
+
+    Returns:
+    ----------
+    triple: Tuple[str, str, str]
+        The subject, predicate and object terms, or None if the line is not a triple
+    """
+    if line.startswith("@prefix"):
+        entities = line.split()
+        if len(entities) == 4:
+            prefix_dict[entities[1].rstrip(":")] = entities[2].strip("<>")
+        return None
+    # Literals may contain whitespace, so only the subject and the predicate are split off
+    terms = line.rstrip().split(None, 2)
+    if len(terms) != 3 or not terms[2].endswith("."):
+        return None
+    return terms[0], terms[1], terms[2][:-1].rstrip()
+
+def _is_literal_term(term: str) -> bool:
+    # Quoted strings, and the unquoted numbers and booleans of Turtle
+    return term[:1] == '"' or term[:1].isdigit() or term[:1] in "+-" or term in ("true", "false")
+
+class _TTLSliceExtractor:
+    """
+    Extracts a slice from the TTL dump, with one pass over the dump per hop and a last pass for the attributes
+    of the last hop and the entity counts.
+    """
+    def __init__(self, ttl_paths: List[str], policy: PredicatePolicy, max_triples_per_entity: int):
+        self.ttl_paths = ttl_paths
+        self.policy = policy
+        self.max_triples_per_entity = max_triples_per_entity
+        self.prefixes: Dict[str, str] = dict()
+
+    def _read(self, desc: str) -> Iterator[tuple]:
+        """
+        Yield the line, the terms, and the expanded subject, predicate and object (None for literals)
+        of every triple of the dump.
+        """
+        for ttl_path in self.ttl_paths:
+            prefix_dict = dict()
+            with open(ttl_path, "r", encoding="utf-8") as f:
+                for line in tqdm(f, desc=f"{desc} {os.path.basename(ttl_path)}"):
+                    terms = read_ttl_triple(line, prefix_dict)
+                    if terms is None:
+                        continue
+                    subject_term, predicate_term, object_term = terms
+                    _object = None if _is_literal_term(object_term) else _expand_term(object_term, prefix_dict)
+                    yield line, terms, _expand_term(subject_term, prefix_dict), \
+                        _expand_term(predicate_term, prefix_dict), _object
+            for prefix, namespace in prefix_dict.items():
+                self.prefixes.setdefault(prefix, namespace)
+
+    def extract(self, seed_uris: List[str], hops: int, out) -> Tuple[Dict[str, str], Dict[str, int], int]:
+        """
+        Write the triples of the slice to `out`, and return the entity terms, the entity counts
+        and the number of triples.
+        """
+        visited: Set[str] = set()
+        frontier = set(seed_uris)
+        num_triples = 0
+        for hop in range(hops):
+            next_frontier = set()
+            emitted = dict.fromkeys(frontier, 0)
+            for line, _, subject, predicate, _object in self._read(f"Hop {hop + 1}/{hops}:"):
+                # The triples of the entities of the previous hops were written by the previous passes
+                if subject in visited or _object in visited:
+                    continue
+                ends = [end for end in (subject, _object) if end in frontier]
+                if not ends or all(emitted[end] >= self.max_triples_per_entity for end in ends):
+                    continue
+                for end in ends:
+                    emitted[end] += 1
+                out.write(line if line.endswith("\n") else line + "\n")
+                num_triples += 1
+                if not self.policy.is_excluded(predicate):
+                    for neighbor in (subject, _object):
+                        if neighbor is not None and neighbor not in frontier and neighbor.startswith("http"):
+                            next_frontier.add(neighbor)
+            visited |= frontier
+            frontier = next_frontier - visited
+
+        # Last pass: the attributes of the last hop, and the counts of every entity of the slice
+        entities = visited | frontier
+        entity_terms: Dict[str, str] = dict()
+        counts: Dict[str, int] = dict()
+        for line, terms, subject, predicate, _object in self._read("Counts and attributes:"):
+            if subject not in entities:
+                continue
+            counts[subject] = counts.get(subject, 0) + 1
+            entity_terms.setdefault(subject, terms[0])
+            if subject in frontier and _object not in visited and \
+                (_object is None or predicate in ATTRIBUTE_PREDICATES):
+                out.write(line if line.endswith("\n") else line + "\n")
+                num_triples += 1
+        return entity_terms, {entity: counts.get(entity, 0) for entity in entities}, num_triples
+
+############################################################################################################
+# Extraction from the endpoint
+
+def _escape_literal(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+
+def binding_to_term(binding: dict) -> str:
+    """
+    Write a SPARQL JSON binding as an RDF term in N-Triples syntax (which is valid Turtle).
+
+    Parameters:
+    ----------
+    binding: dict
+        The binding, e.g. {"type": "uri", "value": "http://..."}
+
+    Returns:
+    ----------
+    term: str
+        The term, e.g. `<http://...>` or `"Italia"@it`
+    """
+    if binding["type"] == "uri":
+        return f"<{binding['value']}>"
+    if binding["type"] == "bnode":
+        return f"_:{binding['value']}"
+    term = f'"{_escape_literal(binding["value"])}"'
+    if "xml:lang" in binding:
+        return f"{term}@{binding['xml:lang']}"
+    if "datatype" in binding:
+        return f"{term}^^<{binding['datatype']}>"
+    return term
+
+def get_slice_query_batch(entity_uris: List[str], max_triples_per_entity: int, *, attributes_only: bool = False) -> str:
+    """
+    Generates a single SPARQL query for the triples of multiple entities, in both directions.
+    The entities are bound through a VALUES clause, and every binding carries its entity in the ?entity column.
+
+    Parameters:
+    ----------
+    entity_uris: List[str]
+        The YAGO URIs of the entities
+
+    max_triples_per_entity: int
+        The maximum number of triples per entity, on average. The limit applies to the whole batch.
+
+    attributes_only: bool
+        Whether to only get the outgoing attributes (literal values, types and sameAs links) of the entities
+
+    Returns:
+    ----------
+    query: str
+        The SPARQL query
+    """
+    values = " ".join(format_entity_for_values(uri) for uri in entity_uris)
+    if attributes_only:
+        predicates = ", ".join(f"<{predicate}>" for predicate in ATTRIBUTE_PREDICATES)
+        pattern = f"?entity ?pred ?obj . FILTER (isLiteral(?obj) || ?pred IN ({predicates}))"
+    else:
+        pattern = "{ ?entity ?pred ?obj . } UNION { ?sub ?pred ?entity . }"
+    return f"""
+    SELECT ?entity ?sub ?pred ?obj WHERE {{
+        VALUES ?entity {{ {values} }}
+        {pattern}
+    }}
+    LIMIT {max_triples_per_entity * len(entity_uris)}
+    """
+
+def get_subject_count_query_batch(entity_uris: List[str]) -> str:
+    """
+    Generates a single SPARQL query counting the triples with each entity as subject.
+    """
+    values = " ".join(format_entity_for_values(uri) for uri in entity_uris)
+    return f"""
+    SELECT ?entity (COUNT(*) AS ?count) WHERE {{
+        VALUES ?entity {{ {values} }}
+        ?entity ?pred ?obj .
+    }}
+    GROUP BY ?entity
+    """
+
+class _EndpointSliceExtractor:
+    """
+    Extracts a slice from the SPARQL endpoint, with one batched query per group of entities of a hop.
+    """
+    def __init__(self, client: SparqlClient, policy: PredicatePolicy, max_triples_per_entity: int,
+        batch_size: int, max_workers: int):
+        self.client = client
+        self.policy = policy
+        self.max_triples_per_entity = max_triples_per_entity
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.prefixes: Dict[str, str] = dict()
+
+    def _query_triples(self, entity_uris: List[str], attributes_only: bool) -> List[Tuple[dict, dict, dict]]:
+        """
+        Get the triples of a batch of entities, as SPARQL JSON bindings.
+        A batch whose result hits its LIMIT (i.e. holds a hub entity) is split into single entities,
+        so that the hub does not use up the share of the others.
+        """
+        query = get_slice_query_batch(entity_uris, self.max_triples_per_entity, attributes_only=attributes_only)
+        bindings = self.client.query(query, template=TEMPLATE_OTHER)["results"]["bindings"]
+        if len(entity_uris) > 1 and len(bindings) >= self.max_triples_per_entity * len(entity_uris):
+            return [triple for uri in entity_uris for triple in self._query_triples([uri], attributes_only)]
+        triples = []
+        for binding in bindings:
+            if "obj" in binding:
+                triples.append((binding["entity"], binding["pred"], binding["obj"]))
+            elif "sub" in binding:
+                triples.append((binding["sub"], binding["pred"], binding["entity"]))
+        return triples
+
+    def _query_counts(self, entity_uris: List[str]) -> Dict[str, int]:
+        response = self.client.query(get_subject_count_query_batch(entity_uris), template=TEMPLATE_OTHER)
+        return {binding["entity"]["value"]: int(binding["count"]["value"])
+            for binding in response["results"]["bindings"]}
+
+    def _map_batches(self, function, entities: List[str], desc: str) -> Iterator:
+        batches = [entities[i:i + self.batch_size] for i in range(0, len(entities), self.batch_size)]
+        self.client.ensure_pool_size(self.max_workers)
+        scheduler = get_default_io_scheduler()
+        futures = [scheduler.submit(function, batch, endpoint=self.client.endpoint_url, caller_limit=self.max_workers)
+            for batch in batches]
+        # A failed batch raises, rather than writing an incomplete slice
+        for future in tqdm(futures, desc=desc):
+            yield future.result()
+
+    def extract(self, seed_uris: List[str], hops: int, out) -> Tuple[Dict[str, str], Dict[str, int], int]:
+        """
+        Write the triples of the slice to `out`, and return the entity terms, the entity counts
+        and the number of triples.
+        """
+        written: Set[tuple] = set()
+
+        def write(triples) -> None:
+            for triple in triples:
+                line = " ".join(binding_to_term(term) for term in triple) + " .\n"
+                if line not in written:
+                    written.add(line)
+                    out.write(line)
+
+        visited: Set[str] = set()
+        frontier = list(dict.fromkeys(seed_uris))
+        for hop in range(hops):
+            next_frontier = dict()
+            for triples in self._map_batches(lambda batch: self._query_triples(batch, False), frontier,
+                f"Hop {hop + 1}/{hops}"):
+                write(triples)
+                for subject, predicate, _object in triples:
+                    if self.policy.is_excluded(predicate["value"]):
+                        continue
+                    for neighbor in (subject, _object):
+                        if neighbor["type"] == "uri":
+                            next_frontier[neighbor["value"]] = None
+            visited.update(frontier)
+            frontier = [uri for uri in next_frontier if uri not in visited]
+
+        for triples in self._map_batches(lambda batch: self._query_triples(batch, True), frontier, "Attributes"):
+            write(triples)
+        entities = list(visited) + frontier
+        counts = dict.fromkeys(entities, 0)
+        for batch_counts in self._map_batches(self._query_counts, entities, "Counts"):
+            counts.update(batch_counts)
+        return {entity: _compress_uri(entity) for entity in entities}, counts, len(written)
+
+def _compress_uri(uri: str) -> str:
+    """
+    Write a URI as a prefixed name when one of `PREFIXES` applies, like the entity ids of the YAGO entity database.
+    """
+    for prefix, namespace in PREFIXES.items():
+        if uri.startswith(namespace):
+            return f"{prefix}:{uri[len(namespace):]}"
+    return f"<{uri}>"
+
+############################################################################################################
+# Slice
+
+def write_entity_counts(db_path: str, entity_terms: Dict[str, str], counts: Dict[str, int]) -> None:
+    """
+    Write the entity counts of a slice to a SQLite database, with the `items` table of the YAGO entity database
+    (see `YagoDB.create_db`), so that `RandomWalk` can use it in place of the full database.
+
+    Parameters:
+    ----------
+    db_path: str
+        The database to write. An existing database is replaced.
+
+    entity_terms: Dict[str, str]
+        The entity id (as written in the TTL file) of every entity URI
+
+    counts: Dict[str, int]
+        The count of every entity URI
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''
+            CREATE TABLE items (
+                item_id TEXT PRIMARY KEY,
+                item_label TEXT,
+                item_description TEXT,
+                count INTEGER DEFAULT 0
+            )
+        ''')
+        conn.executemany("INSERT OR IGNORE INTO items (item_id, item_label, item_description, count) VALUES (?, ?, ?, ?)",
+            ((entity_terms.get(uri, _compress_uri(uri)), uri, None, count) for uri, count in counts.items()))
+        # The random walks look the counts up by label (the full URI)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_items_item_label ON items(item_label)")
+        conn.commit()
+    finally:
+        conn.close()
+
+def extract_slice(seeds: List[str], *, hops: int = SLICE_HOPS, slice_dir: str = SLICE_DIR,
+    ttl_paths: List[str] = None, client: SparqlClient = None, policy: PredicatePolicy = None,
+    max_triples_per_entity: int = SLICE_MAX_TRIPLES_PER_ENTITY, batch_size: int = SLICE_BATCH_SIZE,
+    max_workers: int = SLICE_MAX_WORKERS, qid_index_dir: str = QID_INDEX_DIR) -> dict:
+    """
+    Extract the k-hop neighborhood of the seeds to a slice directory.
+
+    Parameters:
+    ----------
+    seeds: List[str]
+        The seeds: Wikidata QIDs, YAGO prefixed names or URIs
+
+    hops: int
+        The number of hops of the neighborhood
+
+    slice_dir: str
+        The directory to write the slice to
+
+    ttl_paths: List[str]
+        The YAGO TTL files to extract the slice from. None extracts it from the endpoint.
+
+    client: SparqlClient
+        The client to query the endpoint with. Defaults to the shared client.
+
+    policy: PredicatePolicy
+        The predicates the expansion does not follow. Their triples are still part of the slice.
+        Defaults to the shared policy.
+
+    max_triples_per_entity: int
+        The maximum number of triples kept per entity
+
+    batch_size, max_workers: int
+        The number of entities per query, and the number of queries run concurrently (endpoint only)
+
+    qid_index_dir: str
+        The directory of the QID index, used to resolve the QIDs if it is built
+
+    Returns:
+    ----------
+    meta: dict
+        The seeds, the number of hops, entities and triples of the slice
+    """
+    if hops < 1:
+        raise ValueError("A slice needs at least one hop")
+    seed_uris = resolve_seeds(seeds, ttl_paths=ttl_paths, qid_index_dir=qid_index_dir)
+    policy = policy if policy is not None else get_default_predicate_policy()
+    if ttl_paths:
+        extractor = _TTLSliceExtractor(ttl_paths, policy, max_triples_per_entity)
+    else:
+        extractor = _EndpointSliceExtractor(client if client is not None else get_default_client(),
+            policy, max_triples_per_entity, batch_size, max_workers)
+
+    os.makedirs(slice_dir, exist_ok=True)
+    ttl_path = os.path.join(slice_dir, SLICE_TTL_FILE)
+    body_path = ttl_path + ".body"
+    with open(body_path, "w", encoding="utf-8") as out:
+        entity_terms, counts, num_triples = extractor.extract(seed_uris, hops, out)
+    # The prefixes of the dump are only known once it is read, so they are prepended at the end
+    with open(ttl_path, "w", encoding="utf-8") as out, open(body_path, "r", encoding="utf-8") as body:
+        for prefix, namespace in extractor.prefixes.items():
+            out.write(f"@prefix {prefix}: <{namespace}> .\n")
+        for line in body:
+            out.write(line)
+    os.remove(body_path)
+    write_entity_counts(os.path.join(slice_dir, SLICE_DB_FILE), entity_terms, counts)
+
+    meta = {"seeds": len(seed_uris), "hops": hops, "entities": len(counts), "triples": num_triples,
+        "source": "ttl" if ttl_paths else "endpoint"}
+    with open(os.path.join(slice_dir, META_FILE), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the k-hop neighborhood of seed entities from YAGO.")
+    parser.add_argument("--seeds", type=str, nargs="*", default=[],
+        help="Seed entities: Wikidata QIDs, YAGO prefixed names or URIs.")
+    parser.add_argument("--dataset", type=str, default=None,
+        help="Dataset whose QIDs (and mentioned entities) are added to the seeds.")
+    parser.add_argument("--hops", type=int, default=SLICE_HOPS, help="Number of hops of the neighborhood.")
+    parser.add_argument("--slice_dir", type=str, default=SLICE_DIR, help="Directory to write the slice to.")
+    parser.add_argument("--ttl_paths", type=str, nargs="*", default=None,
+        help="YAGO TTL files to extract the slice from. Without them, the slice is extracted from the endpoint.")
+    parser.add_argument("--endpoint", type=str, default=None, help="SPARQL endpoint URL.")
+    parser.add_argument("--max_triples_per_entity", type=int, default=SLICE_MAX_TRIPLES_PER_ENTITY,
+        help="Maximum number of triples kept per entity.")
+    args = parser.parse_args()
+
+    seeds = list(args.seeds)
+    if args.dataset:
+        seeds.extend(get_dataset_seeds(args.dataset))
+    if not seeds:
+        parser.error("Expected --seeds or --dataset")
+    client = SparqlClient(args.endpoint) if args.endpoint else None
+    try:
+        meta = extract_slice(seeds, hops=args.hops, slice_dir=args.slice_dir, ttl_paths=args.ttl_paths,
+            client=client, max_triples_per_entity=args.max_triples_per_entity)
+    except SparqlQueryError as e:
+        print(f"Error extracting the slice from the endpoint: {e}")
+        return
+    print(f"Extracted {meta['triples']} triples of {meta['entities']} entities to {args.slice_dir}")
+
+if __name__ == "__main__":
+    main()
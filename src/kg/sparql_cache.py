@@ -0,0 +1,270 @@
+"""
+This module contains a persistent, on-disk cache for SPARQL query results.
+Results are keyed on the normalized query text, stored zlib-compressed in a sqlite3 database,
+and evicted in least-recently-used order once the cache grows beyond its byte budget.
+
+The YAGO dump is static, so reruns and overlapping QIDs (hub entities such as countries or awards)
+can be answered from the local disk instead of Blazegraph.
+"""
+############################################################################################################
+# Importing necessary libraries
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from kg.constants import SPARQL_CACHE_MAX_BYTES
+
+############################################################################################################
+# Functions
+
+def normalize_query(query_sparql: str) -> str:
+    """
+    Normalize a SPARQL query for use as a cache key.
+    Collapses all the whitespace, so that the same template formatted with different indentation
+    maps to the same key.
+
+    Parameters:
+    ----------
+    query_sparql: str
+        The SPARQL query
+
+    Returns:
+    ----------
+    query: str
+        The normalized query
+    """
+    return " ".join(query_sparql.split())
+
+############################################################################################################
+# Classes
+
+class SparqlDiskCache:
+    """
+    Size-capped LRU cache of SPARQL results, persisted in a sqlite3 database.
+    The cache is thread-safe; it can be shared by all the workers of a SparqlClient.
+    """
+    def __init__(self, cache_dir: str, *, max_bytes: int = SPARQL_CACHE_MAX_BYTES,
+        ttl: float = None, compression_level: int = 6):
+        """
+        Initialize the SparqlDiskCache object.
+
+        Parameters:
+        ----------
+        cache_dir: str
+            The directory to store the cache database in
+
+        max_bytes: int
+            The byte budget of the cache (compressed sizes).
+            The least recently used entries are evicted once it is exceeded.
+
+        ttl: float
+            The time-to-live of an entry, in seconds. None keeps the entries until they are evicted.
+
+        compression_level: int
+            The zlib compression level
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, "sparql_cache.db")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compression_level = compression_level
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                cache_key TEXT PRIMARY KEY,
+                value BLOB,
+                size INTEGER,
+                created REAL,
+                last_access REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)')
+        self._conn.commit()
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def make_key(self, query_sparql: str, endpoint_url: str = "") -> str:
+        """
+        Get the cache key of a query.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            The SPARQL endpoint the query is sent to
+
+        Returns:
+        ----------
+        key: str
+            The cache key
+        """
+        key_text = f"{endpoint_url}\n{normalize_query(query_sparql)}"
+        return hashlib.sha256(key_text.encode("utf-8")).hexdigest()
+
+    def get_bytes(self, key: str) -> bytes:
+        """
+        Get the raw (decompressed) response body of a cached query.
+
+        Parameters:
+        ----------
+        key: str
+            The cache key
+
+        Returns:
+        ----------
+        value: bytes
+            The response body, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, size, created FROM results WHERE cache_key = ?',
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute('DELETE FROM results WHERE cache_key = ?', (key,))
+                self._conn.commit()
+                self._total_bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE results SET last_access = ? WHERE cache_key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return zlib.decompress(value)
+
+    def get(self, key: str) -> dict:
+        """
+        Get the decoded SPARQL JSON result of a cached query.
+
+        Parameters:
+        ----------
+        key: str
+            The cache key
+
+        Returns:
+        ----------
+        response_json: dict
+            The decoded SPARQL JSON result, or None on a miss
+        """
+        value = self.get_bytes(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def put_bytes(self, key: str, value: bytes) -> None:
+        """
+        Store the raw response body of a query, evicting least recently used entries if needed.
+        Entries larger than the whole budget are not stored.
+
+        Parameters:
+        ----------
+        key: str
+            The cache key
+
+        value: bytes
+            The response body
+        """
+        compressed = zlib.compress(value, self.compression_level)
+        size = len(compressed)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM results WHERE cache_key = ?', (key,)).fetchone()
+            if row is not None:
+                self._total_bytes -= row[0]
+            self._conn.execute('''
+                INSERT OR REPLACE INTO results (cache_key, value, size, created, last_access)
+                    VALUES (?, ?, ?, ?, ?)
+            ''', (key, compressed, size, now, now))
+            self._total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def put(self, key: str, response_json: dict) -> None:
+        """
+        Store the decoded SPARQL JSON result of a query.
+
+        Parameters:
+        ----------
+        key: str
+            The cache key
+
+        response_json: dict
+            The decoded SPARQL JSON result
+        """
+        self.put_bytes(key, json.dumps(response_json).encode("utf-8"))
+
+    def _evict(self) -> None:
+        """
+        Evict the least recently used entries until the cache fits its byte budget.
+        Must be called with the lock held.
+        """
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT cache_key, size FROM results ORDER BY last_access ASC LIMIT 64').fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._conn.execute('DELETE FROM results WHERE cache_key = ?', (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._conn.execute('DELETE FROM results')
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get the hit/miss counters of the cache.
+
+        Returns:
+        ----------
+        stats: dict
+            The counters, the number of entries and the total (compressed) size
+        """
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "entries": entries,
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self) -> None:
+        """Close the connection to the cache database."""
+        with self._lock:
+            self._conn.close()
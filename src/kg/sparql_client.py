@@ -0,0 +1,497 @@
+"""
+This module contains the SparqlClient class, which owns a pooled, keep-alive HTTP session to the YAGO SPARQL endpoint.
+All the query functions in `kg.query` go through a SparqlClient, so that repeated queries reuse TCP connections
+instead of opening a new connection per request.
+"""
+############################################################################################################
+# Importing necessary libraries
+import time
+import threading
+from typing import Callable, Iterator
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from kg.constants import YAGO_ENDPOINT_URL, SPARQL_DEFAULT_POOL_SIZE, SPARQL_REQUEST_TIMEOUT
+from kg.sparql_cache import SparqlDiskCache, normalize_query
+from kg.sparql_formats import get_accept_header, decode_results
+from kg.single_flight import SingleFlight
+from kg.sparql_metrics import SparqlMetrics, get_default_metrics, count_bindings
+from kg.replica_router import ReplicaRouter, get_default_router
+from kg.circuit_breaker import CircuitBreaker, get_default_circuit_breaker
+
+SPARQL_JSON_FORMAT = "application/sparql-results+json"
+
+############################################################################################################
+# Classes
+
+class SparqlQueryError(Exception):
+    """
+    Raised when a SPARQL query fails, either with a non-200 response or a connection error.
+    """
+    error_class = "connection"
+
+    def __init__(self, message: str, *, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SparqlTimeoutError(SparqlQueryError):
+    """
+    Raised when a SPARQL query does not complete within its timeout.
+    """
+    error_class = "timeout"
+
+
+class SparqlCircuitOpenError(SparqlQueryError):
+    """
+    Raised when the circuit breaker rejects a query (the circuit is open, or the query waited too long for a slot).
+    The query was not sent, and can be retried once the circuit closes.
+    """
+    error_class = "circuit_open"
+
+
+class SparqlClient:
+    """
+    Pooled, keep-alive HTTP client for a SPARQL endpoint.
+    The client is thread-safe and is meant to be shared by all the worker threads issuing queries.
+    """
+    def __init__(self, endpoint_url: str = YAGO_ENDPOINT_URL, *,
+        pool_size: int = SPARQL_DEFAULT_POOL_SIZE, timeout: float = SPARQL_REQUEST_TIMEOUT,
+        cache: SparqlDiskCache = None, single_flight: bool = True, metrics: SparqlMetrics = None,
+        router: ReplicaRouter = None, breaker: CircuitBreaker = None,
+        adapter_factory: Callable[[int], BaseAdapter] = None):
+        """
+        Initialize the SparqlClient object.
+
+        Parameters:
+        ----------
+        endpoint_url: str
+            The default SPARQL endpoint URL, used when a query does not specify one
+
+        pool_size: int
+            The maximum number of keep-alive connections kept per host.
+            Should be at least the number of threads querying the endpoint concurrently.
+
+        timeout: float
+            The timeout (in seconds) for a single request. None waits indefinitely.
+
+        cache: SparqlDiskCache
+            The on-disk result cache to read from and write to. None disables caching.
+
+        single_flight: bool
+            Whether concurrent identical queries share one request (and one decoded result).
+            Callers must then treat the results as read-only.
+
+        metrics: SparqlMetrics
+            The metrics to record the queries in. Defaults to the shared metrics.
+
+        router: ReplicaRouter
+            The router spreading the queries across read replicas of the endpoint. None sends every query
+            to the URL it is addressed to.
+
+        breaker: CircuitBreaker
+            The circuit breaker limiting the requests in flight and rejecting requests during outages.
+            None sends every request.
+
+        adapter_factory: Callable[[int], BaseAdapter]
+            Builds the transport adapter of the session from the pool size, e.g. to record or replay the traffic
+            (see `kg.sparql_replay`). Defaults to a connection-pooling HTTPAdapter.
+        """
+        self.endpoint_url = endpoint_url
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+        self.router = router
+        self.breaker = breaker
+        self.timeout = timeout
+        self.cache = cache
+        self._single_flight = SingleFlight() if single_flight else None
+        self._pool_size = pool_size
+        self._adapter_factory = adapter_factory
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        # Blazegraph compresses the (verbose) JSON results if asked to
+        self._session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+        self._mount_adapter(pool_size)
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def _mount_adapter(self, pool_size: int) -> None:
+        """
+        Mount a connection-pooling adapter of the given size on the session.
+        In-flight requests keep using the previous adapter until they complete.
+        """
+        if self._adapter_factory is not None:
+            adapter = self._adapter_factory(pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=SPARQL_DEFAULT_POOL_SIZE, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def ensure_pool_size(self, pool_size: int) -> None:
+        """
+        Grow the connection pool so that it can hold at least `pool_size` connections per host.
+        Call this with the number of worker threads before fanning out queries.
+        The pool is never shrunk.
+
+        Parameters:
+        ----------
+        pool_size: int
+            The number of threads that will use the client concurrently
+        """
+        with self._lock:
+            if pool_size <= self._pool_size:
+                return
+            self._mount_adapter(pool_size)
+            self._pool_size = pool_size
+
+    def post(self, query_sparql: str, *, endpoint_url: str = None,
+        accept: str = SPARQL_JSON_FORMAT, stream: bool = False, timeout: float = None) -> requests.Response:
+        """
+        Send a SPARQL query to the endpoint and return the raw response.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+        accept: str
+            The result format to request
+
+        stream: bool
+            Whether to defer downloading the response body
+
+        timeout: float
+            The timeout (in seconds) of this request. Defaults to the client's timeout.
+
+        Returns:
+        ----------
+        response: requests.Response
+            The response of the endpoint
+
+        Raises:
+        ----------
+        SparqlCircuitOpenError
+            If the circuit breaker rejects the request
+        """
+        headers = {
+            "Content-Type": "application/sparql-query; charset=utf-8",
+            "Accept": accept,
+        }
+        endpoint_url = endpoint_url or self.endpoint_url
+        timeout = timeout if timeout is not None else self.timeout
+        if self.breaker is None:
+            return self._send(endpoint_url, headers, query_sparql, timeout, stream)
+
+        slot = self.breaker.acquire()
+        if slot is None:
+            raise SparqlCircuitOpenError(f"The SPARQL circuit breaker rejected the query ({self.breaker.state})")
+        # NOTE: Like the replicas, a streamed request is released once its headers are received
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self._send(endpoint_url, headers, query_sparql, timeout, stream)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.breaker.release(slot, time.perf_counter() - start, failed=failed)
+
+    def _send(self, endpoint_url: str, headers: dict, query_sparql: str, timeout: float,
+        stream: bool) -> requests.Response:
+        """
+        Send a request, to a replica if the client routes the endpoint.
+        """
+        if self.router is None or not self.router.routes(endpoint_url):
+            return self._session.post(endpoint_url, headers=headers, data=query_sparql.encode("utf-8"),
+                timeout=timeout, stream=stream)
+
+        # NOTE: A streamed request is released once its headers are received
+        replica_url = self.router.acquire()
+        start = time.perf_counter()
+        try:
+            response = self._session.post(replica_url, headers=headers, data=query_sparql.encode("utf-8"),
+                timeout=timeout, stream=stream)
+        except requests.RequestException:
+            self.router.release(replica_url, time.perf_counter() - start, failed=True)
+            raise
+        self.router.release(replica_url, time.perf_counter() - start, failed=response.status_code >= 500)
+        return response
+
+    def query(self, query_sparql: str, *, endpoint_url: str = None, template: str = None) -> dict:
+        """
+        Query the SPARQL endpoint and return the decoded JSON result.
+        If the client has a cache, cached results are returned without contacting the endpoint,
+        and successful results are added to the cache.
+        Concurrent identical queries are coalesced into one request, unless single-flight is disabled.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+        template: str
+            The template the query was built from, recorded in the metrics (see `kg.sparql_metrics`)
+
+        Returns:
+        ----------
+        response_json: dict
+            The decoded SPARQL JSON result
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If the request fails or the endpoint does not return 200
+        """
+        endpoint_url = endpoint_url or self.endpoint_url
+        if self.cache is not None:
+            cache_key = self.cache.make_key(query_sparql, endpoint_url)
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                self.metrics.record_cache_hit(template)
+                return cached_response
+
+        def fetch() -> dict:
+            start = time.perf_counter()
+            try:
+                response = self._post_checked(query_sparql, endpoint_url)
+                response_json = response.json()
+            except Exception as e:
+                self.metrics.record(template, latency=time.perf_counter() - start, error=e)
+                raise
+            self.metrics.record(template, latency=time.perf_counter() - start,
+                bytes_received=len(response.content), rows=count_bindings(response_json))
+            if self.cache is not None:
+                self.cache.put_bytes(cache_key, response.content)
+            return response_json
+
+        return self._coalesce(("json", endpoint_url, query_sparql), fetch)
+
+    def _post_checked(self, query_sparql: str, endpoint_url: str,
+        accept: str = SPARQL_JSON_FORMAT, timeout: float = None) -> requests.Response:
+        """
+        Send a query and return the response, raising a SparqlQueryError unless it succeeded.
+        """
+        try:
+            response = self.post(query_sparql, endpoint_url=endpoint_url, accept=accept, timeout=timeout)
+        except requests.Timeout as e:
+            raise SparqlTimeoutError(f"The SPARQL query timed out: {e}") from e
+        except requests.RequestException as e:
+            raise SparqlQueryError(f"Error querying the SPARQL endpoint: {e}") from e
+        if response.status_code != 200:
+            raise SparqlQueryError(f"Error: {response.status_code}", status_code=response.status_code)
+        return response
+
+    def _coalesce(self, key: tuple, fetch):
+        """
+        Run `fetch` through the single-flight group, keyed on the result format, endpoint and normalized query.
+        """
+        if self._single_flight is None:
+            return fetch()
+        result_format, endpoint_url, query_sparql = key
+        return self._single_flight.do((result_format, endpoint_url, normalize_query(query_sparql)), fetch)
+
+    def single_flight_stats(self) -> dict:
+        """
+        Get the counters of the single-flight group: the number of requests sent,
+        and the number of queries served by another caller's request.
+        """
+        if self._single_flight is None:
+            return {}
+        return self._single_flight.stats()
+
+    def query_rows(self, query_sparql: str, *, endpoint_url: str = None,
+        result_format: str = "tsv", timeout: float = None, template: str = None) -> tuple:
+        """
+        Query the SPARQL endpoint in the given result format and decode the result into rows.
+        The tabular formats ("tsv", "csv") are smaller and cheaper to decode than SPARQL JSON.
+        If the client has a cache, results are cached per format.
+        Concurrent identical queries are coalesced into one request, unless single-flight is disabled.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+        result_format: str
+            One of "json", "tsv" or "csv"
+
+        timeout: float
+            The timeout (in seconds) of this query. Defaults to the client's timeout.
+
+        template: str
+            The template the query was built from, recorded in the metrics
+
+        Returns:
+        ----------
+        variables: List[str]
+            The variables of the result
+
+        rows: List[tuple]
+            One tuple of values per result, aligned with the variables
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If the request fails or the endpoint does not return 200
+        """
+        endpoint_url = endpoint_url or self.endpoint_url
+        accept = get_accept_header(result_format)
+        if self.cache is not None:
+            cache_key = self.cache.make_key(query_sparql, f"{endpoint_url}#{result_format}")
+            cached_body = self.cache.get_bytes(cache_key)
+            if cached_body is not None:
+                self.metrics.record_cache_hit(template)
+                return decode_results(cached_body, result_format)
+
+        def fetch() -> tuple:
+            start = time.perf_counter()
+            try:
+                response = self._post_checked(query_sparql, endpoint_url, accept=accept, timeout=timeout)
+                variables, rows = decode_results(response.content, result_format)
+            except Exception as e:
+                self.metrics.record(template, latency=time.perf_counter() - start, error=e)
+                raise
+            self.metrics.record(template, latency=time.perf_counter() - start,
+                bytes_received=len(response.content), rows=len(rows))
+            if self.cache is not None:
+                self.cache.put_bytes(cache_key, response.content)
+            return variables, rows
+
+        return self._coalesce((result_format, endpoint_url, query_sparql), fetch)
+
+    def query_stream(self, query_sparql: str, *, endpoint_url: str = None,
+        accept: str = SPARQL_JSON_FORMAT, chunk_size: int = 64 * 1024, timeout: float = None,
+        template: str = None) -> Iterator[bytes]:
+        """
+        Query the SPARQL endpoint and yield the (decompressed) response body in chunks,
+        without downloading it as a whole. Streamed queries bypass the cache.
+        Decode the chunks with `kg.sparql_stream`.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        endpoint_url: str
+            The SPARQL endpoint URL. Defaults to the client's endpoint URL.
+
+        accept: str
+            The result format to request
+
+        chunk_size: int
+            The size of the chunks read from the connection
+
+        timeout: float
+            The timeout (in seconds) of the request and of every read. Defaults to the client's timeout.
+
+        template: str
+            The template the query was built from, recorded in the metrics.
+            The latency covers the whole stream; the rows are recorded by the caller (`SparqlMetrics.record_rows`).
+
+        Returns:
+        ----------
+        chunks: Iterator[bytes]
+            The response body, in chunks
+
+        Raises:
+        ----------
+        SparqlQueryError
+            If the request fails or the endpoint does not return 200
+        """
+        start = time.perf_counter()
+        bytes_received = 0
+        chunks = self._stream(query_sparql, endpoint_url, accept, chunk_size, timeout)
+        try:
+            for chunk in chunks:
+                bytes_received += len(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The caller stopped reading early
+            self.metrics.record(template, latency=time.perf_counter() - start, bytes_received=bytes_received)
+            raise
+        except Exception as e:
+            self.metrics.record(template, latency=time.perf_counter() - start, bytes_received=bytes_received,
+                error=e)
+            raise
+        finally:
+            chunks.close()
+        self.metrics.record(template, latency=time.perf_counter() - start, bytes_received=bytes_received)
+
+    def _stream(self, query_sparql: str, endpoint_url: str, accept: str, chunk_size: int,
+        timeout: float) -> Iterator[bytes]:
+        """
+        Send a query and yield the response body in chunks, raising a SparqlQueryError unless it succeeded.
+        """
+        try:
+            response = self.post(query_sparql, endpoint_url=endpoint_url, accept=accept, stream=True,
+                timeout=timeout)
+        except requests.Timeout as e:
+            raise SparqlTimeoutError(f"The SPARQL query timed out: {e}") from e
+        except requests.RequestException as e:
+            raise SparqlQueryError(f"Error querying the SPARQL endpoint: {e}") from e
+        # Release the connection back to the pool even if the caller stops early
+        with response:
+            if response.status_code != 200:
+                raise SparqlQueryError(f"Error: {response.status_code}", status_code=response.status_code)
+            try:
+                yield from response.iter_content(chunk_size=chunk_size)
+            except requests.exceptions.ConnectionError as e:
+                # requests reports a read timeout while streaming as a ConnectionError
+                if "timed out" in str(e):
+                    raise SparqlTimeoutError(f"The SPARQL response timed out: {e}") from e
+                raise SparqlQueryError(f"Error reading the SPARQL response: {e}") from e
+            except requests.RequestException as e:
+                raise SparqlQueryError(f"Error reading the SPARQL response: {e}") from e
+
+    def close(self) -> None:
+        """Close the pooled connections of the client."""
+        self._session.close()
+
+
+############################################################################################################
+# Default client
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_client() -> SparqlClient:
+    """
+    Get the process-wide SparqlClient, creating it on first use.
+
+    Returns:
+    ----------
+    client: SparqlClient
+        The shared SparqlClient
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = SparqlClient(router=get_default_router(), breaker=get_default_circuit_breaker())
+    return _default_client
+
+def set_default_client(client: SparqlClient) -> None:
+    """
+    Replace the process-wide SparqlClient, e.g. to point every call site to another endpoint.
+
+    Parameters:
+    ----------
+    client: SparqlClient
+        The SparqlClient to use by default
+    """
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
@@ -0,0 +1,259 @@
+"""
+This module contains the SPARQL result formats that the KG layer can request, and fast decoders for the tabular ones.
+The tab-separated (TSV) and comma-separated (CSV) formats are much smaller on the wire than SPARQL JSON,
+and decode into rows of plain strings without building one dict per binding.
+
+The decoders return `(variables, rows)`, where every row is a tuple of values aligned with the variables,
+and unbound values are None. Helpers convert them into the same structures as
+`kg.query.get_triples_from_response` and `kg.kg_functions.sparql_to_triples_with_main_entity`.
+"""
+############################################################################################################
+# Importing necessary libraries
+import io
+import re
+import csv
+import json
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+RESULT_FORMATS = {
+    "json": "application/sparql-results+json",
+    "tsv": "text/tab-separated-values",
+    "csv": "text/csv",
+}
+
+_TSV_ESCAPES = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+_TSV_ESCAPE_CHARACTERS = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+############################################################################################################
+# Functions
+
+def get_accept_header(result_format: str) -> str:
+    """
+    Get the Accept header requesting a result format.
+
+    Parameters:
+    ----------
+    result_format: str
+        One of "json", "tsv" or "csv"
+
+    Returns:
+    ----------
+    accept: str
+        The MIME type of the format
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {result_format}. Expected one of {list(RESULT_FORMATS)}")
+    return RESULT_FORMATS[result_format]
+
+def _unescape_tsv(match: re.Match) -> str:
+    escape = match.group(1)
+    if escape[0] in "uU" and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    return _TSV_ESCAPE_CHARACTERS.get(escape, escape)
+
+def parse_tsv_term(term: str) -> Optional[str]:
+    """
+    Get the value of an RDF term written in the SPARQL TSV format (N-Triples syntax),
+    e.g. `<http://yago-knowledge.org/resource/Italy>` or `"Italy"@en`.
+    Like the SPARQL JSON decoders, only the value is kept: language tags and datatypes are dropped.
+
+    Parameters:
+    ----------
+    term: str
+        The term
+
+    Returns:
+    ----------
+    value: str
+        The value of the term, or None for an unbound value
+    """
+    if not term:
+        return None
+    first = term[0]
+    if first == "<":
+        return term[1:-1]
+    if first == '"':
+        value = term[1:term.rindex('"')]
+        if "\\" in value:
+            value = _TSV_ESCAPES.sub(_unescape_tsv, value)
+        return value
+    if term.startswith("_:"):
+        return term[2:]
+    # Numbers and booleans are written without quotes
+    return term
+
+def decode_tsv(text: str) -> Tuple[List[str], List[tuple]]:
+    """
+    Decode a SPARQL TSV result.
+
+    Parameters:
+    ----------
+    text: str
+        The response body
+
+    Returns:
+    ----------
+    variables: List[str]
+        The variables, without the leading `?`
+
+    rows: List[tuple]
+        One tuple of values per result
+    """
+    lines = text.split("\n")
+    variables = [variable.lstrip("?$") for variable in lines[0].rstrip("\r").split("\t")] if lines[0] else []
+    rows = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        rows.append(tuple(parse_tsv_term(term) for term in line.rstrip("\r").split("\t")))
+    return variables, rows
+
+def decode_csv(text: str) -> Tuple[List[str], List[tuple]]:
+    """
+    Decode a SPARQL CSV result.
+    The CSV format carries plain values only; empty values are returned as None.
+
+    Parameters:
+    ----------
+    text: str
+        The response body
+
+    Returns:
+    ----------
+    variables: List[str]
+        The variables
+
+    rows: List[tuple]
+        One tuple of values per result
+    """
+    reader = csv.reader(io.StringIO(text))
+    variables = next(reader, [])
+    rows = [tuple(value if value != "" else None for value in row) for row in reader if row]
+    return variables, rows
+
+def decode_json(text: str) -> Tuple[List[str], List[tuple]]:
+    """
+    Decode a SPARQL JSON result into the same `(variables, rows)` structure as the tabular decoders.
+
+    Parameters:
+    ----------
+    text: str
+        The response body
+
+    Returns:
+    ----------
+    variables: List[str]
+        The variables
+
+    rows: List[tuple]
+        One tuple of values per result
+    """
+    response = json.loads(text)
+    variables = response["head"]["vars"]
+    rows = [
+        tuple(binding[variable]["value"] if variable in binding else None for variable in variables)
+        for binding in response["results"]["bindings"]
+    ]
+    return variables, rows
+
+_DECODERS = {
+    "json": decode_json,
+    "tsv": decode_tsv,
+    "csv": decode_csv,
+}
+
+def decode_results(body: bytes, result_format: str) -> Tuple[List[str], List[tuple]]:
+    """
+    Decode a SPARQL result in any of the supported formats into `(variables, rows)`.
+
+    Parameters:
+    ----------
+    body: bytes
+        The response body
+
+    result_format: str
+        One of "json", "tsv" or "csv"
+
+    Returns:
+    ----------
+    variables: List[str]
+        The variables
+
+    rows: List[tuple]
+        One tuple of values per result
+    """
+    get_accept_header(result_format)
+    return _DECODERS[result_format](body.decode("utf-8"))
+
+def get_triples_from_rows(variables: List[str], rows: List[tuple], *,
+    columns_dict: dict = None) -> pd.DataFrame:
+    """
+    Tabular counterpart of `kg.query.get_triples_from_response`.
+
+    Parameters:
+    ----------
+    variables: List[str]
+        The variables of the result
+
+    rows: List[tuple]
+        The rows of the result
+
+    columns_dict: dict
+        The mapping from SPARQL variables to DataFrame columns
+
+    Returns:
+    ----------
+    triples_df: pd.DataFrame
+        The triples, with one column per entry of `columns_dict`
+    """
+    if columns_dict is None:
+        columns_dict = {
+            "subject": "subject",
+            "predicate": "predicate",
+            "object": "object"
+        }
+    positions = {variable: position for position, variable in enumerate(variables)}
+    data = {}
+    for variable, column in columns_dict.items():
+        position = positions.get(variable)
+        data[column] = [row[position] for row in rows] if position is not None else [None] * len(rows)
+    return pd.DataFrame(data, columns=list(columns_dict.values()))
+
+def rows_to_triples_with_main_entity(variables: List[str], rows: List[tuple], main_entity: str) -> List[tuple]:
+    """
+    Tabular counterpart of `kg.kg_functions.sparql_to_triples_with_main_entity`,
+    for the rows of a direct-neighbors query (variables ?sub, ?pred and ?obj).
+
+    Parameters:
+    ----------
+    variables: List[str]
+        The variables of the result
+
+    rows: List[tuple]
+        The rows of the result
+
+    main_entity: str
+        The entity whose neighbors were queried
+
+    Returns:
+    ----------
+    triples: List[tuple]
+        The (subject, predicate, object) triples around the main entity
+    """
+    sub_position = variables.index("sub") if "sub" in variables else None
+    pred_position = variables.index("pred")
+    obj_position = variables.index("obj") if "obj" in variables else None
+
+    triples = []
+    for row in rows:
+        subj = row[sub_position] if sub_position is not None else None
+        pred = row[pred_position]
+        obj = row[obj_position] if obj_position is not None else None
+
+        if subj and pred:
+            triples.append((subj, pred, main_entity))
+        elif obj and pred:
+            triples.append((main_entity, pred, obj))
+    return triples
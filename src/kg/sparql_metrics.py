@@ -0,0 +1,281 @@
+"""
+This module contains the instrumentation of the SPARQL access layer.
+Every query sent by the SPARQL clients is tagged with the template it was built from (e.g. direct-neighbors,
+sameAs), and its latency, payload size, number of rows and error class are recorded per template.
+The metrics can be exported as a JSON snapshot or in the Prometheus text exposition format.
+
+NOTE: Only the requests sent to the endpoint are timed. Results served by the cache are counted separately,
+and callers served by another caller's request (single-flight) are not counted.
+"""
+############################################################################################################
+# Importing necessary libraries
+import json
+import asyncio
+import threading
+from typing import Dict, List
+
+# Query templates
+TEMPLATE_DIRECT_NEIGHBORS = "direct-neighbors"
+TEMPLATE_SAME_AS = "sameAs"
+TEMPLATE_MULTI_SUBJECT = "multi-subject"
+TEMPLATE_DESCRIPTION = "description"
+TEMPLATE_PATH_SEARCH = "path-search"
+TEMPLATE_TRIPLE_CHECK = "triple-check"
+TEMPLATE_OTHER = "other"
+
+# Upper bounds (in seconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+############################################################################################################
+# Functions
+
+def classify_error(error: BaseException) -> str:
+    """
+    Get the class of an error, used as a label of the error counters.
+
+    Parameters:
+    ----------
+    error: BaseException
+        The error raised by a query
+
+    Returns:
+    ----------
+    error_class: str
+        "http_<status>" for non-200 responses, "timeout", "connection", "decode",
+        or the name of the exception type otherwise
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return f"http_{status_code}"
+    error_class = getattr(error, "error_class", None)
+    if error_class is not None:
+        return error_class
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, ValueError):
+        return "decode"
+    return type(error).__name__
+
+def count_bindings(response_json: dict) -> int:
+    """
+    Get the number of rows of a decoded SPARQL JSON result (0 for ASK results).
+    """
+    return len(response_json.get("results", {}).get("bindings", ()))
+
+############################################################################################################
+# Classes
+
+class _TemplateMetrics:
+    """The metrics of one query template."""
+    __slots__ = ("requests", "errors", "error_classes", "cache_hits", "latency_buckets", "latency_sum",
+        "latency_max", "bytes", "rows", "rows_observed")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.error_classes: Dict[str, int] = {}
+        self.cache_hits = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.rows_observed = 0
+
+    def latency_quantile(self, quantile: float) -> float:
+        """
+        Estimate a latency quantile from the histogram (the upper bound of the bucket it falls in).
+        """
+        if self.requests == 0:
+            return 0.0
+        rank = quantile * self.requests
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.latency_max)
+        return self.latency_max
+
+
+class SparqlMetrics:
+    """
+    Thread-safe per-template metrics of the SPARQL queries.
+    One instance is shared by the clients of the process (see `get_default_metrics`).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates: Dict[str, _TemplateMetrics] = {}
+
+    def _get(self, template: str) -> _TemplateMetrics:
+        metrics = self._templates.get(template)
+        if metrics is None:
+            metrics = self._templates[template] = _TemplateMetrics()
+        return metrics
+
+    def record(self, template: str, *, latency: float, bytes_received: int = 0, rows: int = None,
+        error: BaseException = None) -> None:
+        """
+        Record a request sent to the endpoint.
+
+        Parameters:
+        ----------
+        template: str
+            The query template, e.g. `TEMPLATE_DIRECT_NEIGHBORS`. None records the query as `TEMPLATE_OTHER`.
+
+        latency: float
+            The time (in seconds) from sending the request to decoding the response
+
+        bytes_received: int
+            The size of the (decompressed) response body
+
+        rows: int
+            The number of rows of the result, if the client decoded it
+
+        error: BaseException
+            The error raised by the request, if it failed
+        """
+        with self._lock:
+            metrics = self._get(template or TEMPLATE_OTHER)
+            metrics.requests += 1
+            metrics.latency_sum += latency
+            metrics.latency_max = max(metrics.latency_max, latency)
+            position = 0
+            while position < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[position]:
+                position += 1
+            metrics.latency_buckets[position] += 1
+            metrics.bytes += bytes_received
+            if rows is not None:
+                metrics.rows += rows
+                metrics.rows_observed += 1
+            if error is not None:
+                error_class = classify_error(error)
+                metrics.errors += 1
+                metrics.error_classes[error_class] = metrics.error_classes.get(error_class, 0) + 1
+
+    def record_rows(self, template: str, rows: int) -> None:
+        """
+        Record the number of rows of a result decoded by the caller (e.g. a streamed result).
+        """
+        with self._lock:
+            metrics = self._get(template or TEMPLATE_OTHER)
+            metrics.rows += rows
+            metrics.rows_observed += 1
+
+    def record_cache_hit(self, template: str) -> None:
+        """
+        Record a query served by the result cache.
+        """
+        with self._lock:
+            self._get(template or TEMPLATE_OTHER).cache_hits += 1
+
+    def snapshot(self) -> dict:
+        """
+        Get a JSON-serializable snapshot of the metrics.
+
+        Returns:
+        ----------
+        snapshot: dict
+            The metrics of every template: requests, errors (per class), cache hits, latency histogram,
+            estimated latency quantiles, bytes and rows
+        """
+        with self._lock:
+            snapshot = {}
+            for template, metrics in sorted(self._templates.items()):
+                snapshot[template] = {
+                    "requests": metrics.requests,
+                    "errors": metrics.errors,
+                    "error_classes": dict(metrics.error_classes),
+                    "cache_hits": metrics.cache_hits,
+                    "latency": {
+                        "sum": metrics.latency_sum,
+                        "mean": metrics.latency_sum / metrics.requests if metrics.requests else 0.0,
+                        "max": metrics.latency_max,
+                        "p50": metrics.latency_quantile(0.5),
+                        "p95": metrics.latency_quantile(0.95),
+                        "p99": metrics.latency_quantile(0.99),
+                        "buckets": {str(bound): count for bound, count
+                            in zip(LATENCY_BUCKETS + ("+Inf",), metrics.latency_buckets)},
+                    },
+                    "bytes": metrics.bytes,
+                    "rows": metrics.rows,
+                    "mean_rows": metrics.rows / metrics.rows_observed if metrics.rows_observed else 0.0,
+                }
+            return snapshot
+
+    def to_json(self, **kwargs) -> str:
+        """
+        Get the snapshot of the metrics as a JSON string. The keyword arguments are passed to `json.dumps`.
+        """
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, *, namespace: str = "kgqa_sparql") -> str:
+        """
+        Get the metrics in the Prometheus text exposition format.
+
+        Parameters:
+        ----------
+        namespace: str
+            The prefix of the metric names
+
+        Returns:
+        ----------
+        text: str
+            The metrics, one sample per line
+        """
+        lines: List[str] = []
+
+        def family(name: str, metric_type: str, description: str) -> str:
+            full_name = f"{namespace}_{name}"
+            lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            return full_name
+
+        with self._lock:
+            templates = sorted(self._templates.items())
+
+            name = family("request_duration_seconds", "histogram", "Latency of the SPARQL requests.")
+            for template, metrics in templates:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), metrics.latency_buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{template="{template}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{template="{template}"}} {metrics.latency_sum}')
+                lines.append(f'{name}_count{{template="{template}"}} {metrics.requests}')
+
+            name = family("errors_total", "counter", "Failed SPARQL requests, by error class.")
+            for template, metrics in templates:
+                for error_class, count in sorted(metrics.error_classes.items()):
+                    lines.append(f'{name}{{template="{template}",error_class="{error_class}"}} {count}')
+
+            for metric, attribute, description in (
+                ("response_bytes_total", "bytes", "Bytes received from the SPARQL endpoint."),
+                ("result_rows_total", "rows", "Rows returned by the SPARQL queries."),
+                ("cache_hits_total", "cache_hits", "SPARQL queries served by the result cache."),
+            ):
+                name = family(metric, "counter", description)
+                for template, metrics in templates:
+                    lines.append(f'{name}{{template="{template}"}} {getattr(metrics, attribute)}')
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Clear all the metrics."""
+        with self._lock:
+            self._templates.clear()
+
+
+############################################################################################################
+# Default metrics
+
+_default_metrics = SparqlMetrics()
+
+def get_default_metrics() -> SparqlMetrics:
+    """
+    Get the process-wide SparqlMetrics, shared by the SPARQL clients unless they are given their own.
+
+    Returns:
+    ----------
+    metrics: SparqlMetrics
+        The shared SparqlMetrics
+    """
+    return _default_metrics
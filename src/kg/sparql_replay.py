@@ -0,0 +1,496 @@
+"""
+This module contains a record/replay harness for the SPARQL traffic of the KG layer.
+Benchmarks of the subgraph generation or the random walks depend on a live, 400 GB Blazegraph; recording the
+traffic once lets the same workload be replayed offline, deterministically, with the original payloads and
+(optionally) the original latencies.
+
+- Record: a `SparqlClient` built with `make_recording_client` sends its queries to the endpoint as usual, and
+  appends every request/response pair and its latency to a traffic log (gzip-compressed JSON lines).
+- Replay in-process: a `SparqlClient` built with `make_replay_client` answers its queries from the log without
+  any network access. Queries that were not recorded get a 404.
+- Replay over HTTP: `python -m kg.sparql_replay serve --log traffic.jsonl.gz` serves the log as a stand-in
+  SPARQL endpoint (by default on the port of the local Blazegraph), for the asyncio client and other tools.
+
+Responses are matched on the normalized query and the requested result format. The terms of the VALUES blocks
+are sorted in the key, so that a batch of entities matches whatever order it was built in. A query recorded several
+times is answered with its recordings in order, then with the last one.
+Record with the on-disk cache disabled, since cache hits never reach the network.
+
+Usage (from `src`):
+    python -m kg.sparql_replay stats --log traffic.jsonl.gz
+    python -m kg.sparql_replay serve --log traffic.jsonl.gz --port 9999 --reproduce-latency
+"""
+############################################################################################################
+# Importing necessary libraries
+import io
+import re
+import json
+import gzip
+import math
+import time
+import base64
+import argparse
+import threading
+import statistics
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from kg.constants import SPARQL_DEFAULT_POOL_SIZE
+from kg.sparql_cache import normalize_query
+from kg.sparql_client import SparqlClient
+
+DEFAULT_ACCEPT = "application/sparql-results+json"
+# A single-variable VALUES block, and the terms it lists: IRIs, literals (with a language tag or a datatype),
+# prefixed names and UNDEF
+_VALUES_PATTERN = re.compile(r"(VALUES\s+\?\w+\s*\{)([^{}]*)(\})", re.IGNORECASE)
+_TERM_PATTERN = re.compile(r'<[^>]*>|"(?:[^"\\]|\\.)*"(?:@[\w-]+|\^\^\S+)?|\S+')
+
+############################################################################################################
+# Functions
+
+def _sort_values_terms(query_sparql: str) -> str:
+    """
+    Sort the terms of every single-variable VALUES block of a query, which does not change its result set.
+    """
+    def sort_terms(match: re.Match) -> str:
+        return f"{match.group(1)} {' '.join(sorted(_TERM_PATTERN.findall(match.group(2))))} {match.group(3)}"
+    return _VALUES_PATTERN.sub(sort_terms, query_sparql)
+
+def make_traffic_key(query_sparql: str, accept: str) -> tuple:
+    """
+    Get the key a request is matched on: the normalized query, with the terms of its VALUES blocks sorted, and the
+    requested result format.
+
+    Parameters:
+    ----------
+    query_sparql: str
+        The SPARQL query
+
+    accept: str
+        The Accept header of the request
+
+    Returns:
+    ----------
+    key: tuple
+        The key of the request
+    """
+    return _sort_values_terms(normalize_query(query_sparql)), accept or DEFAULT_ACCEPT
+
+def _encode_body(body: bytes) -> dict:
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(body).decode("ascii")}
+
+def _decode_body(record: dict) -> bytes:
+    if "body_b64" in record:
+        return base64.b64decode(record["body_b64"])
+    return record["body"].encode("utf-8")
+
+############################################################################################################
+# Classes
+
+class SparqlTrafficRecorder:
+    """
+    Appends request/response pairs to a traffic log. Thread-safe.
+    """
+    def __init__(self, path: str, *, append: bool = False):
+        """
+        Initialize the SparqlTrafficRecorder object.
+
+        Parameters:
+        ----------
+        path: str
+            The path of the traffic log (gzip-compressed JSON lines)
+
+        append: bool
+            Whether to add to an existing log instead of overwriting it
+        """
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "at" if append else "wt", encoding="utf-8")
+
+    def __enter__(self) -> "SparqlTrafficRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record(self, *, endpoint_url: str, query_sparql: str, accept: str, status_code: int,
+        content_type: str, body: bytes, latency: float) -> None:
+        """
+        Append a request/response pair to the log.
+
+        Parameters:
+        ----------
+        endpoint_url: str
+            The URL the request was sent to
+
+        query_sparql: str
+            The SPARQL query
+
+        accept: str
+            The Accept header of the request
+
+        status_code: int
+            The status code of the response
+
+        content_type: str
+            The Content-Type of the response
+
+        body: bytes
+            The (decompressed) body of the response
+
+        latency: float
+            The time (in seconds) from sending the request to receiving the whole body
+        """
+        record = {
+            "endpoint": endpoint_url,
+            "query": query_sparql,
+            "accept": accept or DEFAULT_ACCEPT,
+            "status": status_code,
+            "content_type": content_type,
+            "latency": round(latency, 6),
+            **_encode_body(body),
+        }
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self.records += 1
+
+    def close(self) -> None:
+        """Flush and close the log."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class SparqlTrafficLog:
+    """
+    The recordings of a traffic log, indexed for replay. Thread-safe.
+    """
+    def __init__(self, path: str):
+        """
+        Load a traffic log.
+
+        Parameters:
+        ----------
+        path: str
+            The path of the traffic log
+        """
+        self.path = path
+        self._recordings: Dict[tuple, List[dict]] = {}
+        self._served: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._recordings.setdefault(make_traffic_key(record["query"], record["accept"]), []).append(record)
+
+    def __len__(self) -> int:
+        return sum(len(recordings) for recordings in self._recordings.values())
+
+    def records(self) -> List[dict]:
+        """All the recordings, grouped by request."""
+        return [record for recordings in self._recordings.values() for record in recordings]
+
+    def lookup(self, query_sparql: str, accept: str) -> Optional[dict]:
+        """
+        Get the next recording of a request.
+
+        Parameters:
+        ----------
+        query_sparql: str
+            The SPARQL query
+
+        accept: str
+            The Accept header of the request
+
+        Returns:
+        ----------
+        record: dict
+            The recording, or None if the request was never recorded
+        """
+        key = make_traffic_key(query_sparql, accept)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if recordings is None:
+                self.misses += 1
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self.hits += 1
+            return recordings[min(served, len(recordings) - 1)]
+
+    def reset(self) -> None:
+        """Replay the recordings from the start again."""
+        with self._lock:
+            self._served.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Get the hits and misses of the replay.
+
+        Returns:
+        ----------
+        stats: dict
+            The number of recordings, distinct requests, hits and misses
+        """
+        with self._lock:
+            return {"recordings": len(self), "requests": len(self._recordings), "hits": self.hits,
+                "misses": self.misses}
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Connection-pooling HTTPAdapter that records every SPARQL request it sends.
+    The body of a streamed response is read as a whole before it is returned, so that its latency
+    and payload are recorded.
+    """
+    def __init__(self, recorder: SparqlTrafficRecorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        body = response.content
+        body_request = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body
+        self.recorder.record(endpoint_url=request.url, query_sparql=body_request or "",
+            accept=request.headers.get("Accept"), status_code=response.status_code,
+            content_type=response.headers.get("Content-Type"), body=body, latency=time.perf_counter() - start)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter answering the requests from a traffic log, without any network access.
+    """
+    def __init__(self, traffic_log: SparqlTrafficLog, *, reproduce_latency: bool = False,
+        latency_scale: float = 1.0):
+        super().__init__()
+        self.traffic_log = traffic_log
+        self.reproduce_latency = reproduce_latency
+        self.latency_scale = latency_scale
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        query_sparql = request.body.decode("utf-8") if isinstance(request.body, bytes) else (request.body or "")
+        record = self.traffic_log.lookup(query_sparql, request.headers.get("Accept"))
+        if record is None:
+            return _build_response(request, 404, "text/plain", b"The query was not recorded")
+        if self.reproduce_latency:
+            time.sleep(record["latency"] * self.latency_scale)
+        return _build_response(request, record["status"], record["content_type"], _decode_body(record))
+
+    def close(self) -> None:
+        pass
+
+
+def _build_response(request: requests.PreparedRequest, status_code: int, content_type: str,
+    body: bytes) -> requests.Response:
+    """
+    Build a requests Response whose body is already read, so that streamed reads are served from memory.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict({"Content-Type": content_type or "", "Content-Length": str(len(body))})
+    response._content = body
+    response._content_consumed = True
+    response.raw = io.BytesIO(body)
+    response.url = request.url
+    response.request = request
+    response.reason = "OK" if status_code == 200 else "Replayed"
+    return response
+
+############################################################################################################
+# Clients
+
+def make_recording_client(path: str, *, append: bool = False, **client_kwargs) -> SparqlClient:
+    """
+    Build a SparqlClient that records its traffic. Close its recorder (`client.recorder.close()`) to flush the log.
+
+    Parameters:
+    ----------
+    path: str
+        The path of the traffic log
+
+    append: bool
+        Whether to add to an existing log instead of overwriting it
+
+    client_kwargs:
+        The other arguments of the SparqlClient. Pass no cache, so that every query reaches the endpoint.
+
+    Returns:
+    ----------
+    client: SparqlClient
+        The recording client
+    """
+    recorder = SparqlTrafficRecorder(path, append=append)
+    client = SparqlClient(adapter_factory=lambda pool_size: RecordingAdapter(recorder,
+        pool_connections=SPARQL_DEFAULT_POOL_SIZE, pool_maxsize=pool_size), **client_kwargs)
+    client.recorder = recorder
+    return client
+
+def make_replay_client(path: str, *, reproduce_latency: bool = False, latency_scale: float = 1.0,
+    **client_kwargs) -> SparqlClient:
+    """
+    Build a SparqlClient that answers its queries from a traffic log, in-process.
+
+    Parameters:
+    ----------
+    path: str
+        The path of the traffic log
+
+    reproduce_latency: bool
+        Whether to wait for the recorded latency of every response
+
+    latency_scale: float
+        The factor applied to the recorded latencies
+
+    client_kwargs:
+        The other arguments of the SparqlClient
+
+    Returns:
+    ----------
+    client: SparqlClient
+        The replay client, whose log (and its hits and misses) is `client.traffic_log`
+    """
+    traffic_log = SparqlTrafficLog(path)
+    adapter = ReplayAdapter(traffic_log, reproduce_latency=reproduce_latency, latency_scale=latency_scale)
+    client = SparqlClient(adapter_factory=lambda pool_size: adapter, **client_kwargs)
+    client.traffic_log = traffic_log
+    return client
+
+############################################################################################################
+# HTTP stand-in
+
+def make_replay_server(traffic_log: SparqlTrafficLog, *, host: str = "localhost", port: int = 9999,
+    reproduce_latency: bool = False, latency_scale: float = 1.0) -> ThreadingHTTPServer:
+    """
+    Build an HTTP server answering SPARQL requests (on any path) from a traffic log.
+    Serve it with `server.serve_forever()`.
+
+    Parameters:
+    ----------
+    traffic_log: SparqlTrafficLog
+        The recordings to serve
+
+    host, port:
+        The address to listen on. Defaults to the address of the local Blazegraph.
+
+    reproduce_latency: bool
+        Whether to wait for the recorded latency of every response
+
+    latency_scale: float
+        The factor applied to the recorded latencies
+
+    Returns:
+    ----------
+    server: ThreadingHTTPServer
+        The stand-in endpoint
+    """
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, query_sparql: str) -> None:
+            record = traffic_log.lookup(query_sparql, self.headers.get("Accept"))
+            if record is None:
+                status_code, content_type, body = 404, "text/plain", b"The query was not recorded"
+            else:
+                if reproduce_latency:
+                    time.sleep(record["latency"] * latency_scale)
+                status_code, content_type, body = record["status"], record["content_type"], _decode_body(record)
+            self.send_response(status_code)
+            self.send_header("Content-Type", content_type or "")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                body = urllib.parse.parse_qs(body).get("query", [""])[0]
+            self._reply(body)
+
+        def do_GET(self) -> None:
+            parameters = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            self._reply(parameters.get("query", [""])[0])
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return ThreadingHTTPServer((host, port), ReplayHandler)
+
+def summarize_traffic_log(traffic_log: SparqlTrafficLog) -> dict:
+    """
+    Summarize the recordings of a traffic log.
+
+    Parameters:
+    ----------
+    traffic_log: SparqlTrafficLog
+        The recordings
+
+    Returns:
+    ----------
+    summary: dict
+        The number of recordings and distinct requests, the status codes, the total payload,
+        and the median, p95 and total latency
+    """
+    records = traffic_log.records()
+    latencies = sorted(record["latency"] for record in records)
+    status_codes = {}
+    for record in records:
+        status_codes[record["status"]] = status_codes.get(record["status"], 0) + 1
+    return {
+        "recordings": len(records),
+        "requests": traffic_log.stats()["requests"],
+        "status_codes": status_codes,
+        "bytes": sum(len(_decode_body(record)) for record in records),
+        "latency_median": statistics.median(latencies) if latencies else None,
+        "latency_p95": latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)] if latencies else None,
+        "latency_total": sum(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded SPARQL traffic.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Serve a traffic log as a stand-in SPARQL endpoint.")
+    serve_parser.add_argument("--log", type=str, required=True, help="Path of the traffic log.")
+    serve_parser.add_argument("--host", type=str, default="localhost", help="Host to listen on.")
+    serve_parser.add_argument("--port", type=int, default=9999, help="Port to listen on.")
+    serve_parser.add_argument("--reproduce-latency", action="store_true", help="Wait for the recorded latencies.")
+    serve_parser.add_argument("--latency-scale", type=float, default=1.0, help="Factor applied to the latencies.")
+    stats_parser = subparsers.add_parser("stats", help="Summarize a traffic log.")
+    stats_parser.add_argument("--log", type=str, required=True, help="Path of the traffic log.")
+    args = parser.parse_args()
+
+    traffic_log = SparqlTrafficLog(args.log)
+    if args.command == "stats":
+        print(json.dumps(summarize_traffic_log(traffic_log), indent=2))
+        return
+
+    server = make_replay_server(traffic_log, host=args.host, port=args.port,
+        reproduce_latency=args.reproduce_latency, latency_scale=args.latency_scale)
+    print(f"Replaying {len(traffic_log)} recordings of {args.log} on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(traffic_log.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+This module contains a streaming decoder for SPARQL JSON results (application/sparql-results+json).
+It reads the HTTP body incrementally and yields the bindings one by one, so that large results
+(e.g. LIMIT 10000 entity queries or batched random-walk hops) are never held in memory as a whole
+decoded document, a list of dicts and a DataFrame at the same time.
+"""
+############################################################################################################
+# Importing necessary libraries
+import re
+import json
+import codecs
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import pandas as pd
+
+_BINDINGS_START = re.compile(r'"bindings"\s*:\s*\[')
+_WHITESPACE_AND_COMMAS = re.compile(r'[\s,]*')
+_decoder = json.JSONDecoder()
+
+############################################################################################################
+# Functions
+
+def iter_bindings(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Incrementally decode the bindings of a SPARQL JSON result.
+    Only the binding being decoded and the unread part of the current chunk are kept in memory.
+
+    Parameters:
+    ----------
+    chunks: Iterable[bytes]
+        The HTTP body, in chunks (e.g. `response.iter_content()`)
+
+    Returns:
+    ----------
+    bindings: Iterator[dict]
+        The bindings, in the order of the result
+
+    Raises:
+    ----------
+    ValueError
+        If the body ends before the bindings array is closed
+    """
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    in_bindings = False
+
+    for chunk in chunks:
+        buffer = buffer[position:] + utf8_decoder.decode(chunk)
+        position = 0
+
+        if not in_bindings:
+            match = _BINDINGS_START.search(buffer)
+            if match is None:
+                # Keep a tail long enough to hold a split `"bindings" : [`
+                position = max(0, len(buffer) - 64)
+                continue
+            in_bindings = True
+            position = match.end()
+
+        while True:
+            position = _WHITESPACE_AND_COMMAS.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                binding, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The binding is split across chunks, wait for more data
+                break
+            position = end
+            yield binding
+
+    raise ValueError("The SPARQL JSON result ended before the end of its bindings")
+
+def iter_rows(chunks: Iterable[bytes], variables: List[str]) -> Iterator[Tuple[str, ...]]:
+    """
+    Incrementally decode a SPARQL JSON result into tuples of values.
+
+    Parameters:
+    ----------
+    chunks: Iterable[bytes]
+        The HTTP body, in chunks
+
+    variables: List[str]
+        The variables to extract, in order. Unbound variables are returned as None.
+
+    Returns:
+    ----------
+    rows: Iterator[Tuple[str, ...]]
+        One tuple of values per binding
+    """
+    for binding in iter_bindings(chunks):
+        yield tuple(binding[variable]["value"] if variable in binding else None for variable in variables)
+
+def iter_triples(chunks: Iterable[bytes], *, subject: str = "subject", predicate: str = "predicate",
+    _object: str = "object") -> Iterator[Tuple[str, str, str]]:
+    """
+    Incrementally decode a SPARQL JSON result into (subject, predicate, object) tuples.
+
+    Parameters:
+    ----------
+    chunks: Iterable[bytes]
+        The HTTP body, in chunks
+
+    subject, predicate, _object: str
+        The variables holding the subject, the predicate and the object
+
+    Returns:
+    ----------
+    triples: Iterator[Tuple[str, str, str]]
+        One (subject, predicate, object) tuple per binding
+    """
+    return iter_rows(chunks, [subject, predicate, _object])
+
+def read_columns(chunks: Iterable[bytes], variables: List[str]) -> Dict[str, list]:
+    """
+    Decode a SPARQL JSON result directly into one list per variable.
+
+    Parameters:
+    ----------
+    chunks: Iterable[bytes]
+        The HTTP body, in chunks
+
+    variables: List[str]
+        The variables to extract. Unbound variables are stored as None.
+
+    Returns:
+    ----------
+    columns: Dict[str, list]
+        The values of each variable, aligned across variables
+    """
+    columns = {variable: [] for variable in variables}
+    appenders = [(variable, columns[variable].append) for variable in variables]
+    for binding in iter_bindings(chunks):
+        for variable, append in appenders:
+            value = binding.get(variable)
+            append(value["value"] if value is not None else None)
+    return columns
+
+def get_triples_from_stream(chunks: Iterable[bytes], *, columns_dict: dict = None) -> pd.DataFrame:
+    """
+    Streaming counterpart of `kg.query.get_triples_from_response`.
+    Builds the same DataFrame, filling its columns directly from the HTTP body.
+
+    Parameters:
+    ----------
+    chunks: Iterable[bytes]
+        The HTTP body, in chunks
+
+    columns_dict: dict
+        The mapping from SPARQL variables to DataFrame columns
+
+    Returns:
+    ----------
+    triples_df: pd.DataFrame
+        The triples, with one column per entry of `columns_dict`
+    """
+    if columns_dict is None:
+        columns_dict = {
+            "subject": "subject",
+            "predicate": "predicate",
+            "object": "object"
+        }
+    columns = read_columns(chunks, list(columns_dict.keys()))
+    return pd.DataFrame({columns_dict[variable]: values for variable, values in columns.items()},
+        columns=list(columns_dict.values()))
@@ -11,10 +11,14 @@ from networkx.algorithms.approximation import steiner_tree
 
 from kg.kg_functions import load_json, extract_ids_with_prefix, convert_QID_yagoID
 from kg.kg_functions import combine_lists_from_dict, get_yago_direct_neighbors, sparql_to_triples_with_main_entity
-from kg.kg_functions import parallel_process_nodes, extract_ids_with_prefix, parallel_convert_QID_yagoID
+from kg.kg_functions import parallel_process_nodes, extract_ids_with_prefix
+from kg.kg_functions import convert_QIDs_yagoIDs, aconvert_QIDs_yagoIDs
+from kg.async_client import AsyncSparqlClient
+from kg.constants import YAGO_ENDPOINT_URL
+from kg.triple_frame import TripleFrame
 
-# TODO: Move this to a config file
-yago_endpoint_url = "http://localhost:9999/bigdata/sparql"
+# Queries sent to this URL are routed across the replicas in `YAGO_ENDPOINT_REPLICAS` (see kg/replica_router.py)
+yago_endpoint_url = YAGO_ENDPOINT_URL
 
 
 def create_graph_from_triples(triples):
@@ -38,17 +42,46 @@ def create_graph_from_triples(triples):
 
     return graph
 
+def create_graph_from_triple_frame(triples: TripleFrame):
+    """
+    Creates a NetworkX graph from dictionary-encoded triples.
+    The nodes are the int32 codes of the entities and the relations are the codes of the predicates, so the graph
+    never holds the URI strings; decode its triples with `kg.triple_frame.decode_triples`.
+
+    Args:
+        triples (TripleFrame): The triples.
+
+    Returns:
+        nx.DiGraph: A directed graph representing the triples.
+    """
+    graph = nx.DiGraph()
+    graph.add_edges_from((subj, obj, {"relation": pred}) for subj, pred, obj in
+        zip(triples.subjects.tolist(), triples.predicates.tolist(), triples.objects.tolist()))
+    return graph
+
 def get_interesting_entities(main_node_qid, entities):
     qids = extract_ids_with_prefix(entities)
     qids = qids + [main_node_qid]
-    qids = list(set(qids))
+    # Sorted, so that the batches (and the recorded queries, see kg/sparql_replay.py) do not depend on the hash seed
+    qids = sorted(set(qids))
 
-    yago_ids = parallel_convert_QID_yagoID(qids)
-    yago_ids_list = list(yago_ids.values())
-    yago_ids_list = [x for x in yago_ids_list if x != 'NA']
+    # Resolved in batches, with the QIDs without a YAGO match mapped to None. A failed batch raises a SparqlQueryError,
+    # so that the QID is retried instead of getting a subgraph with missing terminals
+    yago_ids = convert_QIDs_yagoIDs(qids)
+    yago_ids_list = [x for x in yago_ids.values() if x is not None]
     
     return yago_ids_list
 
+async def aget_interesting_entities(main_node_qid, entities, *, client: AsyncSparqlClient = None):
+    """
+    Asyncio variant of `get_interesting_entities`.
+    """
+    qids = extract_ids_with_prefix(entities)
+    qids = sorted(set(qids + [main_node_qid]))
+
+    yago_ids = await aconvert_QIDs_yagoIDs(qids, client=client)
+    return [x for x in yago_ids.values() if x is not None]
+
 def filter_triples_by_predicates(triples, exclude_predicates):
     # print(f'Length of Triples = {len(triples)}')
     processed_triples = []
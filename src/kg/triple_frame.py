@@ -0,0 +1,472 @@
+"""
+This module contains dictionary-encoded, columnar containers for SPARQL triples.
+The same subject, predicate and object URIs come back thousands of times across results; stored as Python
+strings in object-dtype DataFrames or lists of tuples, every triple costs hundreds of bytes.
+A `TripleFrame` stores one int32 code per value instead, in three numpy arrays (12 bytes per triple), and the
+codes index into a process-wide `URIDictionary` that holds every distinct URI once.
+
+Codes are stable for the life of the process, so frames built by different threads and queries can be
+compared, concatenated and joined on their codes. The process-wide dictionary is never evicted: frames whose
+codes are only compared with each other (e.g. the triples of one QID) use their own `URIDictionary` instead.
+Decoding back to strings is lazy: only the values that are actually returned to the caller (e.g. a sampled hop
+or the edges of a Steiner tree) are decoded.
+"""
+############################################################################################################
+# Importing necessary libraries
+import array
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kg.sparql_stream import iter_rows
+
+# The code of an unbound value (None)
+NULL_CODE = -1
+
+_MAX_CODE = np.iinfo(np.int32).max
+
+############################################################################################################
+# Classes
+
+class URIDictionary:
+    """
+    Bidirectional mapping between URIs (or literals) and int32 codes. Thread-safe.
+    Codes are assigned in insertion order and never change; None is encoded as `NULL_CODE`.
+    """
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._codes
+
+    def encode(self, value: Optional[str]) -> int:
+        """
+        Get the code of a value, assigning a new code if the value was never seen.
+
+        Parameters:
+        ----------
+        value: str
+            The value to encode. None is encoded as `NULL_CODE`.
+
+        Returns:
+        ----------
+        code: int
+            The code of the value
+
+        Raises:
+        ----------
+        OverflowError
+            If the dictionary holds more values than int32 codes can address
+        """
+        if value is None:
+            return NULL_CODE
+        # Reads of a dict are atomic, so the common case (a known value) does not take the lock
+        code = self._codes.get(value)
+        if code is not None:
+            return code
+        with self._lock:
+            code = self._codes.get(value)
+            if code is None:
+                code = len(self._values)
+                if code > _MAX_CODE:
+                    raise OverflowError("The URI dictionary is full")
+                # Append before publishing the code, so that a concurrent decode never misses it
+                self._values.append(value)
+                self._codes[value] = code
+            return code
+
+    def encode_many(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        """
+        Encode values, assigning new codes to the values that were never seen.
+
+        Parameters:
+        ----------
+        values: Iterable[str]
+            The values to encode
+
+        Returns:
+        ----------
+        codes: np.ndarray
+            The int32 codes of the values
+        """
+        encode = self.encode
+        return _to_codes(array.array("i", (encode(value) for value in values)))
+
+    def lookup_many(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        """
+        Get the codes of values without assigning new codes. Unknown values are mapped to `NULL_CODE`,
+        since no triple can refer to them.
+
+        Parameters:
+        ----------
+        values: Iterable[str]
+            The values to look up
+
+        Returns:
+        ----------
+        codes: np.ndarray
+            The int32 codes of the values
+        """
+        codes = self._codes
+        return _to_codes(array.array("i", (codes.get(value, NULL_CODE) if value is not None else NULL_CODE
+            for value in values)))
+
+    def decode(self, code: int) -> Optional[str]:
+        """
+        Get the value of a code.
+
+        Parameters:
+        ----------
+        code: int
+            The code, as returned by `encode`
+
+        Returns:
+        ----------
+        value: str
+            The value, or None for `NULL_CODE`
+        """
+        return None if code < 0 else self._values[code]
+
+    def decode_many(self, codes: Iterable[int]) -> List[Optional[str]]:
+        """
+        Get the values of codes.
+
+        Parameters:
+        ----------
+        codes: Iterable[int]
+            The codes, e.g. a column of a `TripleFrame`
+
+        Returns:
+        ----------
+        values: List[str]
+            The values, with None for `NULL_CODE`
+        """
+        if isinstance(codes, np.ndarray):
+            codes = codes.tolist()
+        values = self._values
+        return [None if code < 0 else values[code] for code in codes]
+
+
+class TripleFrame:
+    """
+    Columnar container of (subject, predicate, object) triples stored as int32 codes into a `URIDictionary`.
+    """
+    __slots__ = ("subjects", "predicates", "objects", "dictionary")
+
+    def __init__(self, subjects: np.ndarray, predicates: np.ndarray, objects: np.ndarray, *,
+        dictionary: URIDictionary = None):
+        """
+        Initialize the TripleFrame object.
+
+        Parameters:
+        ----------
+        subjects, predicates, objects: np.ndarray
+            The codes of the subjects, the predicates and the objects, aligned
+
+        dictionary: URIDictionary
+            The dictionary the codes index into. Defaults to the process-wide dictionary.
+        """
+        self.subjects = np.asarray(subjects, dtype=np.int32)
+        self.predicates = np.asarray(predicates, dtype=np.int32)
+        self.objects = np.asarray(objects, dtype=np.int32)
+        if not len(self.subjects) == len(self.predicates) == len(self.objects):
+            raise ValueError("Expected columns of the same length")
+        self.dictionary = dictionary if dictionary is not None else get_default_uri_dictionary()
+
+    ########################################################################################################
+    # Constructors
+
+    @classmethod
+    def empty(cls, *, dictionary: URIDictionary = None) -> "TripleFrame":
+        empty = np.empty(0, dtype=np.int32)
+        return cls(empty, empty, empty, dictionary=dictionary)
+
+    @classmethod
+    def from_triples(cls, triples: Iterable[Tuple[str, str, str]], *,
+        dictionary: URIDictionary = None) -> "TripleFrame":
+        """
+        Encode (subject, predicate, object) tuples, e.g. the output of
+        `kg.kg_functions.sparql_to_triples_with_main_entity`.
+
+        Parameters:
+        ----------
+        triples: Iterable[Tuple[str, str, str]]
+            The triples
+
+        dictionary: URIDictionary
+            The dictionary to encode with. Defaults to the process-wide dictionary.
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The encoded triples
+
+        Raises:
+        ----------
+        ValueError
+            If a triple does not have 3 elements
+        """
+        dictionary = dictionary if dictionary is not None else get_default_uri_dictionary()
+        encode = dictionary.encode
+        columns = (array.array("i"), array.array("i"), array.array("i"))
+        appenders = [column.append for column in columns]
+        for triple in triples:
+            if len(triple) != 3:
+                raise ValueError(f"Triple '{triple}' does not have 3 elements.")
+            for append, value in zip(appenders, triple):
+                append(encode(value))
+        return cls(*(_to_codes(column) for column in columns), dictionary=dictionary)
+
+    @classmethod
+    def from_rows(cls, variables: List[str], rows: Iterable[tuple], *, subject: str = "subject",
+        predicate: str = "predicate", _object: str = "object", dictionary: URIDictionary = None) -> "TripleFrame":
+        """
+        Encode the rows of a result, e.g. the output of `kg.sparql_formats.decode_result`.
+
+        Parameters:
+        ----------
+        variables: List[str]
+            The variables of the result
+
+        rows: Iterable[tuple]
+            The rows of the result
+
+        subject, predicate, _object: str
+            The variables holding the subject, the predicate and the object
+
+        dictionary: URIDictionary
+            The dictionary to encode with. Defaults to the process-wide dictionary.
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The encoded triples
+        """
+        positions = [variables.index(variable) if variable in variables else None
+            for variable in (subject, predicate, _object)]
+        return cls.from_triples((tuple(row[position] if position is not None else None for position in positions)
+            for row in rows), dictionary=dictionary)
+
+    @classmethod
+    def from_stream(cls, chunks: Iterable[bytes], *, subject: str = "subject", predicate: str = "predicate",
+        _object: str = "object", dictionary: URIDictionary = None) -> "TripleFrame":
+        """
+        Encode a SPARQL JSON result while it is downloaded (see `kg.sparql_stream`).
+        Only the distinct values are kept as strings; every row is reduced to three codes as it is decoded.
+
+        Parameters:
+        ----------
+        chunks: Iterable[bytes]
+            The HTTP body, in chunks
+
+        subject, predicate, _object: str
+            The variables holding the subject, the predicate and the object
+
+        dictionary: URIDictionary
+            The dictionary to encode with. Defaults to the process-wide dictionary.
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The encoded triples
+        """
+        return cls.from_triples(iter_rows(chunks, [subject, predicate, _object]), dictionary=dictionary)
+
+    @classmethod
+    def from_dataframe(cls, triples_df: pd.DataFrame, *, columns_dict: dict = None,
+        dictionary: URIDictionary = None) -> "TripleFrame":
+        """
+        Encode a DataFrame of triples, e.g. the output of `kg.query.get_triples_from_response`.
+
+        Parameters:
+        ----------
+        triples_df: pd.DataFrame
+            The triples
+
+        columns_dict: dict
+            The mapping from "subject", "predicate" and "object" to the columns of the DataFrame
+
+        dictionary: URIDictionary
+            The dictionary to encode with. Defaults to the process-wide dictionary.
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The encoded triples
+        """
+        if columns_dict is None:
+            columns_dict = {}
+        dictionary = dictionary if dictionary is not None else get_default_uri_dictionary()
+        return cls(*(dictionary.encode_many(triples_df[columns_dict.get(key, key)].tolist())
+            for key in ("subject", "predicate", "object")), dictionary=dictionary)
+
+    @classmethod
+    def concat(cls, frames: List["TripleFrame"]) -> "TripleFrame":
+        """
+        Concatenate frames encoded with the same dictionary.
+
+        Parameters:
+        ----------
+        frames: List[TripleFrame]
+            The frames
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The triples of the frames, in order
+        """
+        if not frames:
+            return cls.empty()
+        dictionary = frames[0].dictionary
+        if any(frame.dictionary is not dictionary for frame in frames):
+            raise ValueError("Cannot concatenate frames encoded with different dictionaries")
+        if len(frames) == 1:
+            return frames[0]
+        return cls(np.concatenate([frame.subjects for frame in frames]),
+            np.concatenate([frame.predicates for frame in frames]),
+            np.concatenate([frame.objects for frame in frames]), dictionary=dictionary)
+
+    ########################################################################################################
+    # Selection
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def __getitem__(self, selection) -> "TripleFrame":
+        """
+        Select triples with a boolean mask, an array of positions or a slice.
+        """
+        return TripleFrame(self.subjects[selection], self.predicates[selection], self.objects[selection],
+            dictionary=self.dictionary)
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the codes (the dictionary is shared, hence not counted)."""
+        return self.subjects.nbytes + self.predicates.nbytes + self.objects.nbytes
+
+    def exclude_predicates(self, exclude_predicates: List[str]) -> "TripleFrame":
+        """
+        Drop the triples whose predicate contains one of the substrings (case-insensitive), like
+        `kg.subgraph_functions.filter_triples_by_predicates`. Each distinct predicate is tested once.
+
+        Parameters:
+        ----------
+        exclude_predicates: List[str]
+            The substrings of the predicates to exclude
+
+        Returns:
+        ----------
+        frame: TripleFrame
+            The remaining triples
+        """
+        substrings = [substring.lower() for substring in exclude_predicates]
+        predicate_codes = np.unique(self.predicates)
+        excluded = [code for code, predicate in zip(predicate_codes.tolist(),
+            self.dictionary.decode_many(predicate_codes))
+            if any(substring in str(predicate).lower() for substring in substrings)]
+        if not excluded:
+            return self
+        return self[~np.isin(self.predicates, excluded)]
+
+    ########################################################################################################
+    # Decoding
+
+    def __iter__(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Decode the triples lazily, one (subject, predicate, object) tuple at a time.
+        """
+        decode = self.dictionary.decode
+        for subj, pred, obj in zip(self.subjects.tolist(), self.predicates.tolist(), self.objects.tolist()):
+            yield decode(subj), decode(pred), decode(obj)
+
+    def to_triples(self) -> List[Tuple[str, str, str]]:
+        """
+        Decode the triples into (subject, predicate, object) tuples.
+        """
+        return list(self)
+
+    def to_dataframe(self, *, columns_dict: dict = None, categorical: bool = False) -> pd.DataFrame:
+        """
+        Decode the triples into a DataFrame, like `kg.query.get_triples_from_response`.
+
+        Parameters:
+        ----------
+        columns_dict: dict
+            The mapping from "subject", "predicate" and "object" to the columns of the DataFrame
+
+        categorical: bool
+            Whether to return categorical columns, which decode every distinct value once
+
+        Returns:
+        ----------
+        triples_df: pd.DataFrame
+            The triples
+        """
+        if columns_dict is None:
+            columns_dict = {}
+        data = {}
+        for key, codes in (("subject", self.subjects), ("predicate", self.predicates), ("object", self.objects)):
+            if categorical:
+                distinct_codes, positions = np.unique(codes, return_inverse=True)
+                values = self.dictionary.decode_many(distinct_codes)
+                if None in values:
+                    # Categoricals mark missing values with the position -1
+                    positions = np.where(distinct_codes[positions] == NULL_CODE, -1, positions)
+                    values = [value if value is not None else "" for value in values]
+                data[columns_dict.get(key, key)] = pd.Categorical.from_codes(positions, categories=values)
+            else:
+                data[columns_dict.get(key, key)] = self.dictionary.decode_many(codes)
+        return pd.DataFrame(data, columns=list(data))
+
+
+############################################################################################################
+# Functions
+
+def _to_codes(values: array.array) -> np.ndarray:
+    return np.frombuffer(values, dtype=np.int32) if len(values) else np.empty(0, dtype=np.int32)
+
+def decode_triples(triples: Iterable[Tuple[int, int, int]], *,
+    dictionary: URIDictionary = None) -> List[Tuple[str, str, str]]:
+    """
+    Decode triples of codes, e.g. the edges of a graph built with
+    `kg.subgraph_functions.create_graph_from_triple_frame`.
+
+    Parameters:
+    ----------
+    triples: Iterable[Tuple[int, int, int]]
+        The triples of codes
+
+    dictionary: URIDictionary
+        The dictionary the codes index into. Defaults to the process-wide dictionary.
+
+    Returns:
+    ----------
+    triples: List[Tuple[str, str, str]]
+        The decoded triples
+    """
+    dictionary = dictionary if dictionary is not None else get_default_uri_dictionary()
+    decode = dictionary.decode
+    return [(decode(subj), decode(pred), decode(obj)) for subj, pred, obj in triples]
+
+############################################################################################################
+# Default dictionary
+
+_default_uri_dictionary = URIDictionary()
+
+def get_default_uri_dictionary() -> URIDictionary:
+    """
+    Get the process-wide URIDictionary, shared by every TripleFrame unless another dictionary is given.
+
+    Returns:
+    ----------
+    dictionary: URIDictionary
+        The shared URIDictionary
+    """
+    return _default_uri_dictionary
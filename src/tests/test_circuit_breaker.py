@@ -0,0 +1,49 @@
+"""
+Tests of the SPARQL circuit breaker (kg/circuit_breaker.py).
+"""
+import time
+
+import pytest
+
+from kg.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+OPEN_SECONDS = 0.05
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(max_concurrency=4, min_concurrency=1, failure_threshold=2, open_seconds=OPEN_SECONDS,
+        acquire_timeout=0)
+
+
+def open_circuit(breaker):
+    """Open the circuit with failed requests, and return the slot of a request still in flight."""
+    stale = breaker.acquire()
+    for _ in range(2):
+        breaker.release(breaker.acquire(), 0.01, failed=True)
+    assert breaker.state == OPEN
+    time.sleep(OPEN_SECONDS * 2)
+    assert breaker.state == HALF_OPEN
+    return stale
+
+
+@pytest.mark.parametrize("failed", [True, False])
+def test_request_sent_before_opening_does_not_decide_the_probe(breaker, failed):
+    stale = open_circuit(breaker)
+    probe = breaker.acquire()
+    assert probe is not None and probe.probe
+    assert breaker.acquire() is None
+
+    breaker.release(stale, 5.0, failed=failed)
+    assert breaker.state == HALF_OPEN
+
+    breaker.release(probe, 0.01)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["in_flight"] == 0
+
+
+def test_failed_probe_reopens_the_circuit(breaker):
+    open_circuit(breaker)
+    breaker.release(breaker.acquire(), 0.01, failed=True)
+    assert breaker.state == OPEN
+    assert breaker.opens == 1
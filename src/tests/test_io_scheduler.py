@@ -0,0 +1,75 @@
+"""
+Tests of the shared I/O scheduler (kg/io_scheduler.py) and of the paged retrieval running on it.
+"""
+import threading
+import time
+
+import pytest
+
+from kg import io_scheduler
+from kg.io_scheduler import IOScheduler
+from kg.paged_retrieval import fetch_pages
+
+ENDPOINT = "http://example.org/sparql"
+PAGE_SECONDS = 0.2
+
+
+class SlowClient:
+    """
+    A SparqlClient stand-in whose queries take PAGE_SECONDS, recording the number of queries in flight.
+    """
+    endpoint_url = ENDPOINT
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def query_rows(self, query, endpoint_url=None, result_format="tsv", template=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(PAGE_SECONDS)
+        with self.lock:
+            self.in_flight -= 1
+        return ["s"], [(query,)]
+
+
+@pytest.fixture
+def scheduler():
+    previous = io_scheduler.get_default_io_scheduler()
+    scheduler = IOScheduler(max_workers=8, endpoint_limit=4)
+    io_scheduler.set_default_io_scheduler(scheduler)
+    yield scheduler
+    io_scheduler.set_default_io_scheduler(previous)
+    scheduler.shutdown()
+
+
+def fetch_hub(client):
+    return fetch_pages(lambda limit, offset: f"page {offset}", 400, page_size=100, max_rows=None,
+        max_workers=4, client=client)
+
+
+def test_nested_pages_run_concurrently(scheduler):
+    client = SlowClient()
+    start = time.monotonic()
+    variables, rows, complete = scheduler.submit(fetch_hub, client, endpoint=ENDPOINT).result()
+    elapsed = time.monotonic() - start
+
+    assert rows == [(f"page {offset}",) for offset in (0, 100, 200, 300)] and complete
+    # The 3 free slots and the waiting task fetch the 4 pages at once, instead of one after the other
+    assert elapsed < 2.5 * PAGE_SECONDS
+    assert client.max_in_flight == 4
+
+
+def test_nested_pages_respect_the_endpoint_limit(scheduler):
+    client = SlowClient()
+    futures = [scheduler.submit(fetch_hub, client, endpoint=ENDPOINT) for _ in range(6)]
+    for future in futures:
+        assert len(future.result(timeout=30)[1]) == 4
+
+    stats = scheduler.stats()["endpoints"][ENDPOINT]
+    assert client.max_in_flight <= 4
+    assert stats["max_running"] <= 4
+    assert stats["completed"] == 6 + 6 * 4 and stats["failed"] == 0
+    assert stats["queue_depth"] == 0 and stats["running"] == 0
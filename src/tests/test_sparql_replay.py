@@ -0,0 +1,95 @@
+"""
+Tests of the SPARQL record/replay harness (kg/sparql_replay.py).
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from kg.sparql_replay import make_traffic_key
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Resolves the interesting entities of a QID against `url`, recording or replaying the traffic in `log`
+WORKLOAD = """
+import json, sys
+from kg import kg_functions
+from kg.sparql_client import set_default_client
+from kg.sparql_replay import make_recording_client, make_replay_client
+from kg.subgraph_functions import get_interesting_entities
+
+mode, log, url = sys.argv[1:]
+kg_functions.yago_endpoint_url = url
+client = make_recording_client(log) if mode == "record" else make_replay_client(log)
+set_default_client(client)
+entities = [{"id": str(i)} for i in range(1, 450)]
+yago_ids = get_interesting_entities("Q1000", entities)
+if mode == "record":
+    client.recorder.close()
+print(json.dumps({"yago_ids": sorted(yago_ids),
+    "misses": client.traffic_log.stats()["misses"] if mode == "replay" else 0}))
+"""
+
+
+class SameAsHandler(BaseHTTPRequestHandler):
+    """
+    Answers every sameAs query with one YAGO entity per QID.
+    """
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        bindings = [{"wikidataEntity": {"type": "uri", "value": f"http://www.wikidata.org/entity/{QID}"},
+            "yagoEntity": {"type": "uri", "value": f"http://yago-knowledge.org/resource/{QID}"}}
+            for QID in re.findall(r"wd:(Q[0-9]+)", body)]
+        payload = json.dumps({"head": {"vars": ["wikidataEntity", "yagoEntity"]},
+            "results": {"bindings": bindings}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SameAsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/sparql"
+    server.shutdown()
+    server.server_close()
+
+
+def run_workload(mode, log, url, hash_seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(hash_seed),
+        PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")])))
+    completed = subprocess.run([sys.executable, "-c", WORKLOAD, mode, log, url], cwd=SRC_DIR, env=env,
+        capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_traffic_key_sorts_the_values_terms():
+    query = "SELECT ?y WHERE {{ VALUES ?e {{ {terms} }} ?y owl:sameAs ?e . }}"
+    key = make_traffic_key(query.format(terms='wd:Q2 <http://example.org/a> "a b"@en wd:Q1'), None)
+    assert key == make_traffic_key(query.format(terms='wd:Q1  "a b"@en wd:Q2\n<http://example.org/a>'), None)
+    assert key != make_traffic_key(query.format(terms="wd:Q1 wd:Q3"), None)
+
+
+def test_record_then_replay_with_another_hash_seed(tmp_path, endpoint_url):
+    pytest.importorskip("networkx")
+    pytest.importorskip("matplotlib")
+    log = str(tmp_path / "traffic.jsonl.gz")
+    recorded = run_workload("record", log, endpoint_url, hash_seed=1)
+    replayed = run_workload("replay", log, endpoint_url, hash_seed=2)
+
+    assert len(recorded["yago_ids"]) == 450
+    assert replayed["yago_ids"] == recorded["yago_ids"]
+    assert replayed["misses"] == 0